@@ -0,0 +1,76 @@
+# benchmarks/async_client.py
+
+"""
+Сравнивает пул потоков (Synthesizer.synth_to_file) с asyncio-клиентом
+(AsyncSynthesizer.synth_to_file) при большом числе запросов в полёте
+на локальной заглушке SpeechKit с искусственной задержкой.
+
+    python -m benchmarks.async_client --requests 2000 --workers 500 --latency 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.stub_speechkit import serve
+from scripts.tts_async import AsyncSynthesizer
+from scripts.tts_speechkit_v3 import Synthesizer, iter_pool
+
+HEADERS = {"Content-Type": "application/json", "Authorization": "Api-Key bench"}
+TEXT = "Съешь же ещё этих мягких французских булок, да выпей чаю. " * 3
+RPS = 1e9  # лимитер не должен мешать замеру
+
+
+def run_threads(n: int, workers: int, url: str, out_dir: Path) -> float:
+    synth = Synthesizer(HEADERS, workers=workers, rps=RPS, url=url)
+    t0 = time.perf_counter()
+    for _, _, err in iter_pool(lambda i: synth.synth_to_file(TEXT, out_dir / f"t{i:06d}.mp3"), range(n), workers):
+        if err is not None:
+            raise err
+    elapsed = time.perf_counter() - t0
+    synth.close()
+    return n / elapsed
+
+
+async def _run_async(n: int, workers: int, url: str, out_dir: Path) -> float:
+    synth = AsyncSynthesizer(HEADERS, workers=workers, rps=RPS, url=url)
+    todo = iter(range(n))
+
+    async def worker() -> None:
+        for i in todo:
+            await synth.synth_to_file(TEXT, out_dir / f"a{i:06d}.mp3")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    elapsed = time.perf_counter() - t0
+    await synth.close()
+    return n / elapsed
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Бенчмарк asyncio-клиента SpeechKit против пула потоков")
+    p.add_argument("--requests", type=int, default=1000)
+    p.add_argument("--workers", type=int, default=200, help="Запросов в полёте одновременно")
+    p.add_argument("--latency", type=float, default=0.1, help="Искусственная задержка заглушки, сек")
+    args = p.parse_args(argv)
+
+    server, url = serve(latency=args.latency)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            out_dir = Path(tmp)
+            threads = run_threads(args.requests, args.workers, url, out_dir)
+            aio = asyncio.run(_run_async(args.requests, args.workers, url, out_dir))
+    finally:
+        server.shutdown()
+
+    print(f"потоки:  {threads:8.1f} req/s")
+    print(f"asyncio: {aio:8.1f} req/s  (x{aio / threads:.2f})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
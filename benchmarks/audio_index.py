@@ -0,0 +1,170 @@
+# benchmarks/audio_index.py
+
+"""
+Скорость индекса длительностей: синтетическая книга из кусочков MP3 (CBR,
+CBR с Info-кадром, VBR без Xing), WAV и Ogg Opus — кадры и страницы с
+настоящими заголовками и нулевой начинкой — индексируется scripts.audio_index.
+Рядом меряется прежний способ — проход по всем кадрам и страницам файла, —
+и сверяются суммы длительностей. Файлы свежие, то есть в кэше страниц ОС.
+audio_index запускается дважды: первый раз без .durations.tsv, второй — с ним.
+VBR без Xing по заголовкам не посчитать: первый запуск проходит по всем
+кадрам, так же долго, как прежний способ, и бенчмарк об этом предупреждает.
+
+    python -m benchmarks.audio_index
+    python -m benchmarks.audio_index --chars 1000000 --seconds 13
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import random
+import struct
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+from benchmarks.tts_e2e import make_book
+from project_config import settings
+from scripts import audio_formats, audio_index
+from scripts.chunk_store import write_chunks
+from scripts.utils import split_for_tts
+
+# MPEG2 Layer III, 24 кГц, моно, без CRC: 576 сэмплов (24 мс) на кадр
+_MP3_BITRATE_IDX = {32: 4, 48: 6, 64: 8}
+
+
+def _mp3_frame(kbps: int, payload: bytes = b"") -> bytes:
+    header = bytes((0xFF, 0xF3, _MP3_BITRATE_IDX[kbps] << 4 | 1 << 2, 0xC0))
+    size = 72 * kbps * 1000 // 24000
+    return (header + payload).ljust(size, b"\0")
+
+
+def make_mp3(seconds: float, kind: str, rng: random.Random) -> bytes:
+    """kind: cbr — постоянный битрейт; info — то же с Info-кадром LAME; vbr — переменный без Xing."""
+    frames = round(seconds * 24000 / 576)
+    if kind == "vbr":
+        return b"".join(_mp3_frame(rng.choice((32, 48, 64))) for _ in range(frames))
+    body = _mp3_frame(48) * frames
+    if kind == "info":
+        # side info моно MPEG2 — 9 байт, за ним тег: флаг «есть число кадров» и само число
+        body = _mp3_frame(48, b"\0" * 9 + b"Info" + struct.pack(">II", 1, frames)) + body
+    return body
+
+
+def _ogg_page(granule: int, serial: int, seq: int, body: bytes, header_type: int = 0) -> bytes:
+    segs = [255] * (len(body) // 255) + [len(body) % 255]
+    return b"OggS" + struct.pack("<BBqIII", 0, header_type, granule, serial, seq, 0) + bytes((len(segs),)) + bytes(segs) + body
+
+
+def make_ogg(seconds: float, rng: random.Random) -> bytes:
+    """Ogg Opus: OpusHead, OpusTags и страницы по секунде звука."""
+    serial = rng.getrandbits(32)
+    pages = [
+        _ogg_page(0, serial, 0, b"OpusHead" + struct.pack("<BBHIhB", 1, 1, 312, 48000, 0, 0), header_type=2),
+        _ogg_page(0, serial, 1, b"OpusTags" + b"\0" * 8),
+    ]
+    samples = round(seconds * 48000)
+    granule = 0
+    while granule < samples:
+        granule = min(samples, granule + 48000)
+        pages.append(_ogg_page(granule + 312, serial, len(pages), b"\0" * 3000, header_type=4 if granule == samples else 0))
+    return b"".join(pages)
+
+
+def make_wav(seconds: float) -> bytes:
+    fmt = struct.pack("<HHIIHH", 1, 1, 24000, 48000, 2, 16)
+    data_size = round(seconds * 24000) * 2
+    return audio_formats.wav_header(fmt, data_size) + b"\0" * data_size
+
+
+def make_audio(audio_dir: Path, count: int, kind: str, seconds: float, seed: int = 1) -> None:
+    """Пишет count кусочков вида kind длительностью около seconds."""
+    rng = random.Random(seed)
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    ext = ".wav" if kind == "wav" else ".ogg" if kind == "ogg" else ".mp3"
+    for n in range(1, count + 1):
+        dur = round(rng.uniform(0.5, 1.5) * seconds, 2)
+        if kind == "wav":
+            data = make_wav(dur)
+        elif kind == "ogg":
+            data = make_ogg(dur, rng)
+        else:
+            data = make_mp3(dur, kind, rng)
+        (audio_dir / f"{n:05d}{ext}").write_bytes(data)
+
+
+def full_scan(path: Path) -> float:
+    """Прежний способ: все кадры MP3 и все страницы Ogg."""
+    if path.suffix == ".mp3":
+        data = path.read_bytes()
+        start, end = audio_formats.mp3_audio_span(data)
+        return audio_formats._frames_seconds(data, start, end)
+    if path.suffix == ".ogg":
+        with path.open("rb") as f:
+            last = max((page.granule for page in audio_formats.iter_ogg_pages(f)), default=0)
+        return max(0, last - 312) / 48000
+    return audio_formats.wav_duration(path)
+
+
+def timed(fn: Callable[[], object]) -> float:
+    t = time.perf_counter()
+    fn()
+    return time.perf_counter() - t
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Скорость индекса длительностей по заголовкам против полного прохода по файлам")
+    p.add_argument("--chars", type=int, default=1_000_000, help="Размер синтетической книги, символов")
+    p.add_argument("--seconds", type=float, default=13.0, help="Средняя длительность кусочка, сек (по умолчанию: 13)")
+    p.add_argument("--kinds", default="cbr,info,vbr,wav,ogg", help="Виды аудио через запятую: cbr, info, vbr, wav, ogg")
+    args = p.parse_args(argv)
+
+    pieces = split_for_tts(make_book(args.chars), settings.SPEECHKIT_CHUNK_SIZE, settings.SPEECHKIT_CHUNK_TARGET)
+    print(f"Книга: {args.chars:,} символов → {len(pieces):,} кусочков")
+    print(
+        f"{'аудио':<6} {'файлов, МБ':>10} {'полный проход, мс':>18} {'заголовки, мс':>14} "
+        f"{'audio_index, мс':>16} {'повторно, мс':>13} {'расхождение, с':>15}"
+    )
+    failed = False
+    slow: List[str] = []
+    with tempfile.TemporaryDirectory(prefix="audio_index_") as tmp:
+        for kind in (k.strip() for k in args.kinds.split(",") if k.strip()):
+            work = Path(tmp) / kind
+            write_chunks([(f"{i:05d}", piece) for i, piece in enumerate(pieces, 1)], work / "chunks")
+            (work / "cleaned.txt").write_text("\n\n".join(pieces), encoding="utf-8")
+            make_audio(work / "audio", len(pieces), kind, args.seconds)
+            files = sorted((work / "audio").iterdir())
+            mb = sum(f.stat().st_size for f in files) / 2**20
+            scanned: List[float] = []
+            heads: List[float] = []
+            t_scan = timed(lambda: scanned.extend(full_scan(f) for f in files))
+            t_head = timed(lambda: heads.extend(audio_formats.duration(f) for f in files))
+            argv_index = [
+                "--audio-dir", str(work / "audio"), "--chunks-dir", str(work / "chunks"),
+                "--cleaned", str(work / "cleaned.txt"), "--out", str(work / "book"),
+            ]
+            with contextlib.redirect_stdout(io.StringIO()):
+                codes: List[int] = []
+                t_index = timed(lambda: codes.append(audio_index.main(argv_index)))
+                t_again = timed(lambda: codes.append(audio_index.main(argv_index)))  # длительности из .durations.tsv
+            diff = abs(sum(heads) - sum(scanned))
+            print(
+                f"{kind:<6} {mb:>10.1f} {t_scan * 1000:>18.0f} {t_head * 1000:>14.0f} "
+                f"{t_index * 1000:>16.0f} {t_again * 1000:>13.0f} {diff:>15.3f}"
+            )
+            failed = failed or diff > 0.01 or codes != [0, 0]
+            if t_index >= 1.0:
+                slow.append(kind)
+    for kind in slow:
+        print(
+            f"[WARN] {kind}: первый индекс дольше секунды. Длительность берётся проходом по всем кадрам "
+            "(у VBR без Xing её нет в заголовках). Повторные запуски читают заново только новые и изменённые файлы."
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
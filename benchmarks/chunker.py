@@ -0,0 +1,89 @@
+# benchmarks/chunker.py
+
+"""
+Сравнивает прежний пословный chunk_by_tokens (encode на каждое слово)
+с текущим (одно кодирование всего текста) на синтетической книге.
+
+    python -m benchmarks.chunker --mb 4 --max-tokens 9500
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from typing import List
+
+from scripts import utils
+
+WORDS = (
+    "и в не на я быть он с что а по это она этот к но они мы как из у который то за свой "
+    "весь год от так о для ты же все тот мочь вы человек такой его сказать только или ещё "
+    "бы себя один как-то уже до время если сам когда другой вот говорить наш мой знать стать "
+    "при чтобы дело жизнь кто первый очень два день её новый рука даже во со раз где там под"
+).split()
+
+
+def make_book(mb: float, seed: int = 1) -> str:
+    rnd = random.Random(seed)
+    out: List[str] = []
+    size = 0
+    while size < mb * 1024 * 1024:
+        sentence = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(5, 25))).capitalize() + "."
+        if rnd.random() < 0.1:
+            sentence += "\n\n"
+        else:
+            sentence += " "
+        out.append(sentence)
+        size += len(sentence.encode("utf-8"))
+    return "".join(out)
+
+
+def legacy_chunk_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """Прежняя реализация: count_tokens на каждое слово."""
+    words = re.findall(r"\S+\s*", text)
+    chunks: List[str] = []
+    cur: List[str] = []
+    cur_tokens = 0
+    for w in words:
+        w_tokens = utils.count_tokens(w)
+        if cur and cur_tokens + w_tokens > max_tokens:
+            chunks.append("".join(cur).rstrip())
+            cur = [w]
+            cur_tokens = w_tokens
+        else:
+            cur.append(w)
+            cur_tokens += w_tokens
+    if cur:
+        chunks.append("".join(cur).rstrip())
+    return chunks
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Бенчмарк chunk_by_tokens")
+    p.add_argument("--mb", type=float, default=4.0, help="Размер синтетической книги, МБ")
+    p.add_argument("--max-tokens", type=int, default=9500)
+    args = p.parse_args(argv)
+
+    text = make_book(args.mb)
+    print(f"Книга: {len(text):,} символов, энкодер: {getattr(utils.get_encoder(), 'name', 'нет (оценка по символам)')}")
+
+    t0 = time.perf_counter()
+    old = legacy_chunk_by_tokens(text, args.max_tokens)
+    t_old = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    new = utils.chunk_by_tokens(text, args.max_tokens)
+    t_new = time.perf_counter() - t0
+
+    over = sum(1 for ch in new if utils.count_tokens(ch) > args.max_tokens)
+    same_words = " ".join(new).split() == text.split()
+    print(f"пословно:   {t_old:7.3f} s, {len(old)} чанков")
+    print(f"целиком:    {t_new:7.3f} s, {len(new)} чанков  (x{t_old / t_new:.1f})")
+    print(f"чанков сверх бюджета: {over}, текст сохранён: {same_words}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,94 @@
+# benchmarks/fake_openai.py
+
+"""
+Локальный OpenAI-совместимый эндпоинт для прогонов очистки без реального API.
+Отвечает на /v1/chat/completions, возвращая пользовательский текст как «очищенный».
+Умеет задержку и долю ответов 429, чтобы проверить ретраи и порядок сборки.
+
+    python -m benchmarks.fake_openai --port 8808 --latency 0.5 --rate-limit 0.1
+    OPENAI_BASE_URL=http://127.0.0.1:8808/v1 OPENAI_API_KEY=fake python -m scripts.clean_and_chunk_book
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    latency = 0.0
+    rate_limit = 0.0  # доля запросов, на которые отвечаем 429
+
+    def _send_json(self, status: int, obj: dict, headers: dict | None = None) -> None:
+        payload = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if random.random() < self.rate_limit:
+            self._send_json(429, {"error": {"message": "rate limited", "type": "rate_limit"}}, {"retry-after": "0.2"})
+            return
+        if self.latency:
+            time.sleep(self.latency * (0.5 + random.random()))
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        user = next((m["content"] for m in body.get("messages", []) if m.get("role") == "user"), "")
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": " ".join(user.split())},
+            }],
+        })
+
+    def log_message(self, format, *args):  # noqa: A002 - сигнатура BaseHTTPRequestHandler
+        pass
+
+
+def serve(latency: float = 0.0, rate_limit: float = 0.0, port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Поднимает эндпоинт в фоне. Возвращает (server, base_url) для OPENAI_BASE_URL."""
+    handler = type("Handler", (FakeOpenAIHandler,), {"latency": latency, "rate_limit": rate_limit})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Фейковый OpenAI-совместимый сервер")
+    p.add_argument("--port", type=int, default=8808)
+    p.add_argument("--latency", type=float, default=0.5)
+    p.add_argument("--rate-limit", type=float, default=0.0)
+    args = p.parse_args(argv)
+    server, url = serve(args.latency, args.rate_limit, args.port)
+    print(f"OPENAI_BASE_URL={url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
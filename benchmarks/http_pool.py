@@ -0,0 +1,72 @@
+# benchmarks/http_pool.py
+
+"""
+Сравнивает synth_one с голым requests.post и с пулом соединений (make_session)
+на локальной заглушке SpeechKit.
+
+    python -m benchmarks.http_pool --requests 500 --workers 4
+
+Заглушка работает по голому HTTP на loopback, поэтому выигрыш здесь — только
+от TCP-рукопожатия. На реальном HTTPS-эндпоинте к нему добавляется TLS.
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from benchmarks.stub_speechkit import serve
+from scripts.tts_speechkit_v3 import iter_pool, make_session, synth_one
+
+HEADERS = {"Content-Type": "application/json", "Authorization": "Api-Key bench"}
+TEXT = "Съешь же ещё этих мягких французских булок, да выпей чаю. " * 3
+
+
+def run(n: int, workers: int, url: str, pooled: bool) -> float:
+    session = make_session(HEADERS, pool_size=workers) if pooled else None
+
+    def work(_: int) -> int:
+        audio = synth_one(
+            text=TEXT,
+            headers=None if pooled else HEADERS,
+            voice="filipp",
+            role="",
+            speed=1.1,
+            container="MP3",
+            session=session,
+            url=url,
+        )
+        return len(audio)
+
+    t0 = time.perf_counter()
+    for _, _, err in iter_pool(work, range(n), workers):
+        if err is not None:
+            raise err
+    elapsed = time.perf_counter() - t0
+    if session is not None:
+        session.close()
+    return n / elapsed
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Бенчмарк пула HTTP-соединений для synth_one")
+    p.add_argument("--requests", type=int, default=300)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--latency", type=float, default=0.0, help="Искусственная задержка заглушки, сек")
+    args = p.parse_args(argv)
+
+    server, url = serve(latency=args.latency)
+    try:
+        run(20, args.workers, url, pooled=True)  # прогрев
+        plain = run(args.requests, args.workers, url, pooled=False)
+        pooled = run(args.requests, args.workers, url, pooled=True)
+    finally:
+        server.shutdown()
+
+    print(f"без пула:  {plain:8.1f} req/s")
+    print(f"с пулом:   {pooled:8.1f} req/s  (x{pooled / plain:.2f})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,119 @@
+# benchmarks/listen.py
+
+"""
+Время до первого звука у scripts.listen. Синтетическая книга озвучивается
+бэкендом mock через локальную заглушку SpeechKit, а поток открывается с
+начала, затем с перемоткой в середину и почти в конец. Для сравнения
+показано, когда тот же кусочек был бы готов у пакетного синтеза по порядку
+имён: номер кусочка × медиана задержки / workers.
+
+    python -m benchmarks.listen
+    python -m benchmarks.listen --chars 300000 --latency lognormal:0.5,0.3 --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import List, Tuple
+
+from benchmarks.stub_speechkit import parse_latency, serve
+from benchmarks.tts_e2e import make_book
+from project_config import settings
+from scripts.chunk_store import write_chunks
+from scripts.utils import split_for_tts
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_up(base: str, timeout: float = 15.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base}/status", timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def first_audio(url: str) -> float:
+    """Секунд от запроса до первого байта звука."""
+    t = time.monotonic()
+    with urllib.request.urlopen(url, timeout=120) as resp:
+        resp.read(1)
+    return time.monotonic() - t
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Время до первого звука у сервера прослушивания против пакетного синтеза по порядку")
+    p.add_argument("--chars", type=int, default=300_000, help="Размер синтетической книги, символов")
+    p.add_argument("--latency", default="lognormal:0.3,0.3", help="Задержка заглушки (см. benchmarks.stub_speechkit)")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--at", default="0,0.5,0.9", help="Откуда слушать, доли книги через запятую (по умолчанию: 0,0.5,0.9)")
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args(argv)
+
+    pieces = split_for_tts(make_book(args.chars, args.seed), settings.SPEECHKIT_CHUNK_SIZE, settings.SPEECHKIT_CHUNK_TARGET)
+    sample = parse_latency(args.latency)
+    rng = random.Random(args.seed)
+    median_latency = statistics.median(sample(rng) for _ in range(1000))
+    print(f"Книга: {args.chars:,} символов → {len(pieces):,} кусочков; заглушка: {args.latency}, workers={args.workers}")
+
+    rows: List[Tuple[str, float, float]] = []
+    with tempfile.TemporaryDirectory(prefix="listen_") as tmp:
+        write_chunks([(f"{i:05d}", piece) for i, piece in enumerate(pieces, 1)], Path(tmp) / "chunks")
+        stub, tts_url = serve(args.latency, seed=args.seed)
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        log = (Path(tmp) / "listen.log").open("w")
+        cmd = [
+            sys.executable, "-m", "scripts.listen", "--backend", "mock", "--tts-url", tts_url,
+            "--in-dir", str(Path(tmp) / "chunks"), "--out-dir", str(Path(tmp) / "audio"),
+            "--workers", str(args.workers), "--rps", "0", "--no-cache", "--dedup", "off", "--port", str(port),
+        ]
+        proc = subprocess.Popen(cmd, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            if not wait_up(base):
+                print(f"[FATAL] Сервер не поднялся:\n{(Path(tmp) / 'listen.log').read_text(encoding='utf-8')[-2000:]}", file=sys.stderr)
+                return 1
+            for share in (float(x) for x in args.at.split(",") if x.strip()):
+                idx = min(len(pieces), int(share * len(pieces)) + 1)
+                waited = first_audio(f"{base}/book.mp3?chunk={idx:05d}")
+                rows.append((f"{idx:05d}", waited, idx * median_latency / args.workers))
+            with urllib.request.urlopen(f"{base}/status") as resp:
+                status = json.load(resp)
+        finally:
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+            stub.shutdown()
+
+    print(f"{'слушать с':>10} {'первый звук, с':>15} {'пакетно по порядку, с':>22}")
+    for chunk_id, waited, batch in rows:
+        print(f"{chunk_id:>10} {waited:>15.2f} {batch:>22.1f}")
+    print(f"Озвучено за прогон: {status['ready']} из {status['chunks']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
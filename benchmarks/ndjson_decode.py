@@ -0,0 +1,117 @@
+# benchmarks/ndjson_decode.py
+
+"""
+Сравнивает прежний разбор ответа SpeechKit (iter_lines → str → json.loads →
+b64decode) с побайтовым NdjsonAudioDecoder на записанных ответах.
+
+    python -m benchmarks.ndjson_decode --responses out/recorded/ --repeat 20
+    python -m benchmarks.ndjson_decode --seconds 30 --frames 40 --repeat 20
+
+Без --responses ответ собирается синтетически в раскладке SpeechKit v3:
+аудио, textChunk, startMs/lengthMs в каждом кадре.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterator, List
+
+from scripts.tts_speechkit_v3 import STREAM_BLOCK, NdjsonAudioDecoder
+
+MP3_BYTES_PER_SEC = 16_000  # 128 кбит/с
+
+
+def make_response(seconds: float, frames: int) -> bytes:
+    audio = os.urandom(int(seconds * MP3_BYTES_PER_SEC))
+    step = max(1, -(-len(audio) // max(1, frames)))
+    ms = int(seconds * 1000 / max(1, frames))
+    lines = []
+    for n, i in enumerate(range(0, len(audio), step)):
+        lines.append(json.dumps({"result": {
+            "audioChunk": {"data": base64.b64encode(audio[i:i + step]).decode("ascii")},
+            "textChunk": {"text": "Съешь же ещё этих мягких французских булок"},
+            "startMs": str(n * ms),
+            "lengthMs": str(ms),
+        }}, ensure_ascii=False))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def blocks(body: bytes, size: int) -> Iterator[bytes]:
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def legacy_decode(body: bytes, block: int) -> List[bytes]:
+    """Прежняя реализация: строки как str, полный json.loads, ошибки глотаются."""
+    out: List[bytes] = []
+    pending = ""
+    for chunk in blocks(body, block):
+        pending += chunk.decode("utf-8", "replace")
+        *lines, pending = pending.split("\n")
+        for raw_line in lines:
+            line = raw_line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except Exception:
+                continue
+            node = obj.get("result", obj)
+            audio_chunk = node.get("audioChunk")
+            if isinstance(audio_chunk, dict) and audio_chunk.get("data"):
+                try:
+                    out.append(base64.b64decode(audio_chunk["data"]))
+                except Exception:
+                    continue
+    return out
+
+
+def fast_decode(body: bytes, block: int) -> List[bytes]:
+    decoder = NdjsonAudioDecoder()
+    out: List[bytes] = []
+    for chunk in blocks(body, block):
+        out.extend(decoder.feed(chunk))
+    out.extend(decoder.flush())
+    return out
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Бенчмарк разбора NDJSON-ответов SpeechKit")
+    p.add_argument("--responses", type=Path, default=None, help="Папка с записанными телами ответов (*.ndjson / *.json)")
+    p.add_argument("--seconds", type=float, default=20.0, help="Длина синтетического ответа, сек аудио")
+    p.add_argument("--frames", type=int, default=40, help="Кадров audioChunk в синтетическом ответе")
+    p.add_argument("--block", type=int, default=STREAM_BLOCK, help="Размер куска, как он приходит из сокета")
+    p.add_argument("--repeat", type=int, default=20)
+    args = p.parse_args(argv)
+
+    if args.responses is not None:
+        bodies = [f.read_bytes() for f in sorted(args.responses.iterdir()) if f.suffix in (".ndjson", ".json")]
+    else:
+        bodies = [make_response(args.seconds, args.frames)]
+    total_mb = sum(map(len, bodies)) * args.repeat / 1e6
+    print(f"Ответов: {len(bodies)}, {total_mb / args.repeat:.2f} МБ NDJSON, повторов: {args.repeat}")
+
+    timings = {}
+    for name, decode in (("json.loads", legacy_decode), ("побайтово", fast_decode)):
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            results = [b"".join(decode(body, args.block)) for body in bodies]
+        timings[name] = time.perf_counter() - t0
+        if name == "json.loads":
+            expected = results
+    same = results == expected
+
+    t_old, t_new = timings["json.loads"], timings["побайтово"]
+    print(f"json.loads: {t_old:7.3f} s  ({total_mb / t_old:7.1f} МБ/с)")
+    print(f"побайтово:  {t_new:7.3f} s  ({total_mb / t_new:7.1f} МБ/с, x{t_old / t_new:.2f})")
+    print(f"аудио совпадает: {same}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
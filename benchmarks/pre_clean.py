@@ -0,0 +1,101 @@
+# benchmarks/pre_clean.py
+
+"""
+Предочистка utils.PreCleaner на синтетической «PDF→TXT» книге: абзацы
+разбиты на строки фиксированной ширины, через каждые --page-lines строк —
+номер страницы (то с пустыми строками вокруг, то без). Между абзацами
+вставлены то, что номером страницы не является: нумерованные списки по
+строке на пункт, годы на отдельной строке и номера глав между пустыми
+строками. Печатается скорость и проверяется:
+
+* списки, годы и номера глав целы (иначе код выхода 1);
+* сколько номеров страниц осталось в тексте;
+* сколько абзацев не совпало с исходными (лишние разрывы и склейки).
+
+    python -m benchmarks.pre_clean
+    python -m benchmarks.pre_clean --chars 3000000 --width 60 --page-lines 35
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import textwrap
+import time
+from typing import List, Tuple
+
+from benchmarks.tts_e2e import make_book
+from scripts.utils import PreCleaner
+
+_NUMBER = re.compile(r"(?<![\w-])\d{1,4}(?![\w-])")
+
+
+def make_raw(book: str, width: int, page_lines: int, seed: int = 1) -> Tuple[str, List[str], int]:
+    """
+    (сырой текст, ожидаемые абзацы после очистки, число страниц). Страница
+    не рвётся внутри списка, года или номера главы: номер страницы между
+    числами неотличим от пункта списка, и меряется не это.
+    """
+    rng = random.Random(seed)
+    expected: List[str] = []
+    blocks: List[Tuple[List[str], bool]] = []  # (строки, можно ли рвать страницу внутри)
+    chapter = 0
+    for para in book.split("\n\n"):
+        expected.append(para)
+        blocks.append((textwrap.wrap(para, width) + [""], True))
+        roll = rng.random()
+        if roll < 0.03:
+            items = [str(i) for i in range(1, rng.randint(2, 6) + 1)]
+            expected.append(f"Список: {' '.join(items)} Конец списка.")
+            blocks.append((["Список:", *items, "Конец списка.", ""], False))
+        elif roll < 0.06:
+            year = rng.randint(1700, 1999)
+            expected.append(f"В том году случилось многое: {year}")
+            blocks.append((["В том году случилось многое:", str(year), ""], False))
+        elif roll < 0.08:
+            chapter += 1
+            expected.append(str(chapter))
+            blocks.append(([str(chapter), ""], False))
+    out: List[str] = []
+    page = filled = 0
+    for lines, breakable in blocks:
+        for line in lines:
+            out.append(line)
+            filled += 1
+            if filled >= page_lines and (breakable or line == lines[-1]):
+                page += 1
+                out += ["", str(page), ""] if rng.random() < 0.5 else [str(page)]
+                filled = 0
+    return "\n".join(out), expected, page
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Скорость и свойства предочистки на синтетической книге с номерами страниц, списками и годами")
+    p.add_argument("--chars", type=int, default=1_000_000, help="Размер синтетической книги, символов")
+    p.add_argument("--width", type=int, default=70, help="Ширина строки «PDF», символов (по умолчанию: 70)")
+    p.add_argument("--page-lines", type=int, default=40, help="Строк на странице (по умолчанию: 40)")
+    args = p.parse_args(argv)
+
+    raw, expected, pages = make_raw(make_book(args.chars), args.width, args.page_lines)
+    pre = PreCleaner(with_tokens=False)
+    t = time.perf_counter()
+    got = "".join(pre.feed([raw])).split("\n\n")[:-1]
+    seconds = time.perf_counter() - t
+
+    kept = set(got)
+    special = [e for e in expected if e[0].isdigit() or e.startswith(("Список:", "В том году"))]
+    lost = [e for e in special if e not in kept]
+    leftover = sum(len(_NUMBER.findall(g)) for g in got) - sum(len(_NUMBER.findall(e)) for e in expected)
+    matched = len(kept & set(expected))
+    print(f"Книга: {len(raw):,} символов, {raw.count(chr(10)):,} строк → {len(got):,} абзацев за {seconds:.2f} s")
+    print(f"Списки, годы, главы: {len(special) - len(lost)} из {len(special)} целы")
+    print(f"Номеров страниц осталось: {max(0, leftover)} из {pages}")
+    print(f"Абзацев совпало с исходными: {matched:,} из {len(expected):,}")
+    for e in lost[:5]:
+        print(f"[WARN] потеряно: {e[:80]!r}")
+    return 1 if lost else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
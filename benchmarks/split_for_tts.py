@@ -0,0 +1,127 @@
+# benchmarks/split_for_tts.py
+
+"""
+Сравнивает прежний split_for_tts (re.split + конкатенация строк) с потоковым
+упаковщиком и проверяет свойство «ничего не потеряно и не переставлено»
+на случайных текстах.
+
+    python -m benchmarks.split_for_tts --mb 2 --cases 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from typing import List
+
+from benchmarks.chunker import make_book
+from project_config import settings
+from scripts import utils
+
+
+def legacy_split_for_tts(text: str, max_chars: int = 200) -> List[str]:
+    """Прежняя реализация — для сравнения скорости и числа кусочков."""
+    parts = re.split(r"(\n\n+|(?<=[\.\!\?\:\;])\s+)", text)
+    out: List[str] = []
+    buf = ""
+    for piece in parts:
+        if not piece:
+            continue
+        piece = piece.replace("\n", " ").strip()
+        if not piece:
+            continue
+        if not buf:
+            if len(piece) <= max_chars:
+                buf = piece
+            else:
+                temp = ""
+                for w in piece.split():
+                    add = (w if temp == "" else " " + w)
+                    if len(temp) + len(add) > max_chars:
+                        out.append(temp)
+                        temp = w
+                    else:
+                        temp += add
+                if temp:
+                    buf = temp
+        else:
+            add = (" " + piece)
+            if len(buf) + len(add) <= max_chars:
+                buf += add
+            else:
+                out.append(buf)
+                if len(piece) <= max_chars:
+                    buf = piece
+                else:
+                    temp = ""
+                    for w in piece.split():
+                        add2 = (w if temp == "" else " " + w)
+                        if len(temp) + len(add2) > max_chars:
+                            out.append(temp)
+                            temp = w
+                        else:
+                            temp += add2
+                    buf = temp
+    if buf:
+        out.append(buf)
+    return [s.strip() for s in out if s.strip()]
+
+
+def random_text(rnd: random.Random) -> str:
+    """Короткие и длинные фразы, абзацы, переносы строк, слова длиннее лимита."""
+    alphabet = "абвгдежзиклмнопрстуфхцчшщыэюя"
+    parts: List[str] = []
+    for _ in range(rnd.randint(0, 40)):
+        n = rnd.choice((1, 3, 8, 30, 120))
+        words = ["".join(rnd.choice(alphabet) for _ in range(rnd.choice((1, 4, 9, 60, 300)))) for _ in range(n)]
+        sep = rnd.choice((" ", " ", "\n", "  "))
+        parts.append(sep.join(words) + rnd.choice((".", "!", "?", ";", ":", "…", "", ",")))
+        parts.append(rnd.choice((" ", "\n", "\n\n", "\n\n\n", "  ", "")))
+    return "".join(parts)
+
+
+def check_property(cases: int, seed: int = 7) -> int:
+    """Склеенные кусочки дают ту же последовательность слов; кусочек длиннее лимита — только одно слово."""
+    rnd = random.Random(seed)
+    failures = 0
+    for _ in range(cases):
+        text = random_text(rnd)
+        max_chars = rnd.choice((20, 80, 200, 1000))
+        target = rnd.choice((None, max_chars // 2, max_chars))
+        pieces = utils.split_for_tts(text, max_chars, target)
+        ok = " ".join(pieces).split() == text.split()
+        ok = ok and all(len(p) <= max_chars or len(p.split()) == 1 for p in pieces)
+        ok = ok and all(p == p.strip() and p for p in pieces)
+        failures += not ok
+    return failures
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Бенчмарк и проверка split_for_tts")
+    p.add_argument("--mb", type=float, default=2.0)
+    p.add_argument("--cases", type=int, default=500)
+    args = p.parse_args(argv)
+
+    text = make_book(args.mb)
+    print(f"Текст: {len(text):,} символов")
+
+    t0 = time.perf_counter()
+    old = legacy_split_for_tts(text, 200)
+    t_old = time.perf_counter() - t0
+    print(f"прежний (200):          {t_old:6.3f} s, {len(old):,} кусочков")
+
+    for name, prof in settings.TTS_CHUNK_PROFILES.items():
+        t0 = time.perf_counter()
+        new = utils.split_for_tts(text, prof["max"], prof["target"])
+        t_new = time.perf_counter() - t0
+        print(f"{name:<22}  {t_new:6.3f} s, {len(new):,} кусочков (x{len(old) / len(new):.1f} меньше запросов)")
+
+    failures = check_property(args.cases)
+    print(f"свойство на {args.cases} случайных текстах: {'OK' if not failures else f'{failures} нарушений'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
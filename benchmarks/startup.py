@@ -0,0 +1,137 @@
+# benchmarks/startup.py
+
+"""
+Время запуска точек входа: сколько стоит импорт каждого скрипта и `--help`
+в свежем процессе и сколько — первый вызов тяжёлых зависимостей (токенайзер,
+клиент OpenAI, HTTP-сессия SpeechKit). Каждый замер — отдельный процесс,
+берётся медиана из --repeat.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 9 --top 5   # и самые тяжёлые импорты каждого скрипта
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# первый вызов: (что импортировать, что вызвать)
+FIRST_CALLS = {
+    "токенайзер": ("from scripts import utils", "utils.count_tokens('проба')"),
+    "клиент OpenAI": ("from scripts.clean_and_chunk_book import get_client", "get_client()"),
+    "HTTP-сессия": ("from scripts.tts_speechkit_v3 import make_session", "make_session({})"),
+}
+
+_TIMED = """
+import time
+t = time.perf_counter()
+{setup}
+t1 = time.perf_counter()
+{call}
+print(t1 - t, time.perf_counter() - t1)
+"""
+
+
+def entry_points() -> List[str]:
+    """Модули scripts/ с блоком if __name__ == "__main__"."""
+    return sorted(
+        f"scripts.{p.stem}" for p in (ROOT / "scripts").glob("*.py")
+        if '__name__ == "__main__"' in p.read_text(encoding="utf-8")
+    )
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    env.setdefault("OPENAI_API_KEY", "startup-benchmark")  # клиент создаётся без запросов к API
+    return env
+
+
+def timed(setup: str, call: str = "pass") -> Tuple[float, float]:
+    """(импорт, вызов) в свежем процессе, сек. Ошибка — RuntimeError с хвостом stderr."""
+    proc = subprocess.run(
+        [sys.executable, "-c", _TIMED.format(setup=setup, call=call)],
+        cwd=ROOT, env=_env(), capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"код {proc.returncode}")
+    t_import, t_call = map(float, proc.stdout.split()[-2:])
+    return t_import, t_call
+
+
+def wall(*args: str) -> float:
+    """Процесс `python *args` целиком, вместе со стартом интерпретатора."""
+    t = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, env=_env(), capture_output=True)
+    return time.perf_counter() - t
+
+
+def heaviest_imports(module: str, top: int) -> List[Tuple[str, float]]:
+    """Самые дорогие импорты верхнего уровня по -X importtime (кумулятивно, сек)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=_env(), capture_output=True, text=True,
+    )
+    # importtime печатает детей раньше родителя: прямые импорты скрипта — строки
+    # с одним уровнем отступа сразу перед его собственной строкой
+    rows: List[Tuple[str, float]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        if not name.startswith(" "):
+            if name == module:
+                break
+            rows = []
+        elif not name.startswith("   "):
+            rows.append((name.strip(), int(cumulative) / 1e6))
+    rows.sort(key=lambda r: -r[1])
+    return rows[:top]
+
+
+def median(fn, repeat: int) -> Optional[float]:
+    try:
+        return statistics.median(fn() for _ in range(repeat))
+    except RuntimeError:
+        return None
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Время запуска точек входа и первых вызовов тяжёлых зависимостей")
+    p.add_argument("--repeat", type=int, default=5, help="Повторов каждого замера, берётся медиана (по умолчанию: 5)")
+    p.add_argument("--top", type=int, default=0, help="Показать N самых тяжёлых импортов каждого скрипта")
+    args = p.parse_args(argv)
+
+    print(f"{'скрипт':<30} {'импорт, мс':>11} {'--help, мс':>11}")
+    print(f"{'(пустой python -c pass)':<30} {0:>11} {median(lambda: wall('-c', 'pass'), args.repeat) * 1000:>11.0f}")
+    for module in entry_points():
+        t_import = median(lambda: timed(f"import {module}")[0], args.repeat)
+        t_help = median(lambda: wall("-m", module, "--help"), args.repeat)
+        shown = f"{t_import * 1000:>11.0f}" if t_import is not None else f"{'ошибка':>11}"
+        print(f"{module:<30} {shown} {t_help * 1000:>11.0f}")
+        for name, seconds in heaviest_imports(module, args.top) if args.top else ():
+            print(f"    {name:<26} {seconds * 1000:>11.0f}")
+
+    print(f"\n{'первый вызов':<30} {'импорт, мс':>11} {'вызов, мс':>11}")
+    for label, (setup, call) in FIRST_CALLS.items():
+        try:
+            runs = [timed(setup, call) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{label:<30} {'ошибка':>11}  {str(e)[:160]}")
+            continue
+        t_import = statistics.median(r[0] for r in runs)
+        t_call = statistics.median(r[1] for r in runs)
+        print(f"{label:<30} {t_import * 1000:>11.0f} {t_call * 1000:>11.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,221 @@
+# benchmarks/stub_speechkit.py
+
+"""
+Локальная заглушка SpeechKit v3: принимает POST с телом make_request_body
+и отвечает NDJSON-строками {"result":{"audioChunk":{"data":"..."}}}.
+Нужна бенчмаркам и нагрузочным прогонам, чтобы не тратить реальную квоту.
+
+Умеет то, на чём ломаются клиенты:
+  * задержку из распределения: 0.2, uniform:0.1,0.5, lognormal:0.2,0.6 (медиана, сигма),
+    exp:0.2 (среднее), плюс --latency-per-char на каждый символ текста;
+  * долю ответов с ошибкой: --errors 429:0.02,503:0.01;
+  * ответ кадрами по мере «синтеза»: --chunked шлёт каждую NDJSON-строку
+    отдельным chunk, --frame-interval — пауза между кадрами.
+
+    python -m benchmarks.stub_speechkit --port 8765 --latency lognormal:0.3,0.5 --errors 429:0.05,503:0.02 --chunked
+    python -m scripts.tts_speechkit_v3 --backend mock --workers 16 --rps 50
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Tuple, Union
+
+DEFAULT_PORT = 8765  # совпадает с MOCK_URL бэкенда mock
+
+
+def make_ndjson(audio: bytes, frames: int) -> bytes:
+    """Режет аудио на `frames` частей и упаковывает в NDJSON, как это делает SpeechKit."""
+    return b"".join(ndjson_frames(audio, frames))
+
+
+def ndjson_frames(audio: bytes, frames: int) -> List[bytes]:
+    """Те же кадры по одному, каждый с "\\n" в конце."""
+    frames = max(1, frames)
+    step = max(1, -(-len(audio) // frames))
+    lines = []
+    for i in range(0, len(audio), step):
+        data = base64.b64encode(audio[i:i + step]).decode("ascii")
+        lines.append((json.dumps({"result": {"audioChunk": {"data": data}}}) + "\n").encode("ascii"))
+    return lines
+
+
+def parse_latency(spec: Union[float, str]) -> Callable[[random.Random], float]:
+    """'0.2' | 'fixed:0.2' | 'uniform:LO,HI' | 'lognormal:MEDIAN,SIGMA' | 'exp:MEAN' → генератор задержки, сек."""
+    if isinstance(spec, (int, float)):
+        value = float(spec)
+        return lambda rng: value
+    kind, _, params = spec.partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    try:
+        args = [float(x) for x in params.split(",")]
+        if kind == "fixed" and len(args) == 1:
+            return lambda rng: args[0]
+        if kind == "uniform" and len(args) == 2:
+            return lambda rng: rng.uniform(args[0], args[1])
+        if kind == "lognormal" and len(args) == 2:
+            mu = math.log(args[0]) if args[0] > 0 else float("-inf")
+            return lambda rng: rng.lognormvariate(mu, args[1]) if args[0] > 0 else 0.0
+        if kind == "exp" and len(args) == 1:
+            return lambda rng: rng.expovariate(1 / args[0]) if args[0] > 0 else 0.0
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"Не понимаю распределение задержки {spec!r}: 0.2, uniform:0.1,0.5, lognormal:0.2,0.6, exp:0.2")
+
+
+def parse_errors(spec: str) -> List[Tuple[int, float]]:
+    """'429:0.02,503:0.01' → [(429, 0.02), (503, 0.01)]: HTTP-код и доля запросов с ним."""
+    errors = []
+    for item in filter(None, (x.strip() for x in spec.split(","))):
+        try:
+            status, share = item.split(":")
+            errors.append((int(status), float(share)))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Ожидается КОД:ДОЛЯ через запятую, например 429:0.02,503:0.01, а не {spec!r}") from None
+    return errors
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, иначе пулу нечего переиспользовать
+    disable_nagle_algorithm = True  # иначе delayed ACK съедает 40 мс на каждом keep-alive запросе
+
+    latency: Callable[[random.Random], float] = staticmethod(lambda rng: 0.0)
+    latency_per_char = 0.0
+    errors: List[Tuple[int, float]] = []
+    frames = 4
+    chunked = False
+    frame_interval = 0.0
+    bytes_per_char = 64
+    rng = random.Random()
+
+    def _pick_error(self) -> int:
+        roll = self.rng.random()
+        for status, share in self.errors:
+            if roll < share:
+                return status
+            roll -= share
+        return 0
+
+    def _send_error_json(self, status: int) -> None:
+        payload = json.dumps({"error": f"injected {status}"}).encode("ascii")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        text = body.get("text", "")
+        status = self._pick_error()
+        self.server.count(status or 200)
+        if status == 429:  # троттлинг отвечает сразу, не «синтезируя»
+            self._send_error_json(status)
+            return
+        delay = self.latency(self.rng) + self.latency_per_char * len(text)
+        if delay > 0:
+            time.sleep(delay)
+        if status:
+            self._send_error_json(status)
+            return
+
+        lines = ndjson_frames(b"\x00" * (len(text) * self.bytes_per_char or 1), self.frames)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if not self.chunked:
+            payload = b"".join(lines)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for n, line in enumerate(lines):
+            if n and self.frame_interval:
+                time.sleep(self.frame_interval)
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):  # noqa: A002 - сигнатура BaseHTTPRequestHandler
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    # по умолчанию очередь на 5 подключений: сотни одновременных connect() теряют SYN и ждут ретрансмита секунду
+    request_queue_size = 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statuses: Counter = Counter()  # сколько ответов с каким кодом отдано
+        self._lock = threading.Lock()
+
+    def count(self, status: int) -> None:
+        with self._lock:
+            self.statuses[status] += 1
+
+
+def serve(
+    latency: Union[float, str] = 0.0,
+    frames: int = 4,
+    port: int = 0,
+    errors: Union[str, List[Tuple[int, float]]] = (),
+    latency_per_char: float = 0.0,
+    chunked: bool = False,
+    frame_interval: float = 0.0,
+    seed: int | None = None,
+) -> Tuple[StubServer, str]:
+    """Поднимает заглушку в фоновом потоке. Возвращает (server, url); остановка — server.shutdown()."""
+    handler = type("Handler", (StubHandler,), {
+        "latency": staticmethod(parse_latency(latency)),
+        "latency_per_char": latency_per_char,
+        "errors": parse_errors(errors) if isinstance(errors, str) else list(errors),
+        "frames": frames,
+        "chunked": chunked or frame_interval > 0,
+        "frame_interval": frame_interval,
+        "rng": random.Random(seed),
+    })
+    server = StubServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/tts/v3/utteranceSynthesis"
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Локальная заглушка SpeechKit v3 для нагрузочных прогонов")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--latency", default="0.2", help="Задержка ответа: 0.2, uniform:LO,HI, lognormal:MEDIAN,SIGMA, exp:MEAN (по умолчанию: 0.2)")
+    p.add_argument("--latency-per-char", type=float, default=0.0, help="Добавка к задержке на каждый символ текста, сек")
+    p.add_argument("--errors", type=parse_errors, default=[], help="Доля ответов с ошибкой по кодам: 429:0.02,503:0.01")
+    p.add_argument("--frames", type=int, default=4, help="Кадров audioChunk в ответе")
+    p.add_argument("--chunked", action="store_true", help="Отдавать кадры по одному (Transfer-Encoding: chunked)")
+    p.add_argument("--frame-interval", type=float, default=0.0, help="Пауза между кадрами, сек (включает --chunked)")
+    p.add_argument("--seed", type=int, default=None, help="Зерно генератора задержек и ошибок")
+    args = p.parse_args(argv)
+    parse_latency(args.latency)  # ошибка в спецификации — до запуска сервера
+
+    server, url = serve(args.latency, args.frames, args.port, args.errors, args.latency_per_char, args.chunked, args.frame_interval, args.seed)
+    print(f"Заглушка SpeechKit: {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Ответов по кодам: {dict(server.statuses)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,165 @@
+# benchmarks/tts_e2e.py
+
+"""
+Сквозной бенчмарк синтеза: синтетическая книга в 1M символов озвучивается
+бэкендом mock через локальную заглушку SpeechKit с задержкой из распределения
+и долей ошибок 429/5xx. Для каждого уровня --workers меряются кусочки в
+секунду, p50/p95/p99 задержки запроса и пиковая память процесса.
+
+Каждый уровень — отдельный процесс `python -m scripts.tts_speechkit_v3
+--backend mock` по манифесту: тот же путь, что в бою (выборка, очередь
+повторов, журнал, атомарная запись файлов), а пиковый RSS — его собственный.
+
+    python -m benchmarks.tts_e2e --chars 1000000 --workers 8,32,128
+    python -m benchmarks.tts_e2e --save bench.json
+    python -m benchmarks.tts_e2e --compare bench.json --tolerance 0.2   # код 1 при регрессии
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.stub_speechkit import parse_errors, parse_latency, serve
+from project_config import settings
+from scripts.prepare_jsonl import write_jsonl
+from scripts.utils import split_for_tts
+
+ROOT = Path(__file__).resolve().parents[1]
+WORDS = "съешь же ещё этих мягких французских булок да выпей чаю широкая электрификация южных губерний даст мощный толчок".split()
+# чем больше, тем лучше; для памяти и p99 — наоборот
+HIGHER_IS_BETTER = {"chunks_per_s": True, "p50_s": False, "p95_s": False, "p99_s": False, "rss_mb": False}
+
+
+def make_book(chars: int, seed: int = 1) -> str:
+    """Абзацы из предложений случайной длины — детерминированно по seed."""
+    rng = random.Random(seed)
+    paras: List[str] = []
+    size = 0
+    while size < chars:
+        sentences = []
+        for _ in range(rng.randint(1, 8)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(3, 25))]
+            sentences.append(" ".join(words).capitalize() + rng.choice(".!?…"))
+        para = " ".join(sentences)
+        paras.append(para)
+        size += len(para) + 2
+    return "\n\n".join(paras)[:chars]
+
+
+def run_level(workers: int, manifest: Path, url: str, args: argparse.Namespace) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory(prefix="tts_e2e_") as tmp:
+        report = Path(tmp) / "report.json"
+        cmd = [
+            sys.executable, "-m", "scripts.tts_speechkit_v3",
+            "--backend", "mock", "--tts-url", url,
+            "--manifest", str(manifest), "--out-dir", str(Path(tmp) / "audio"),
+            "--workers", str(workers), "--rps", "0",
+            "--no-cache", "--dedup", "off",
+            "--retry-base", str(args.retry_base), "--retry-max", "1",
+            "--report", str(report),
+        ]
+        proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        stderr = proc.stderr.read()
+        # wait4, а не wait: нужен пиковый RSS именно этого процесса
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        if not report.exists():
+            raise RuntimeError(f"Прогон с --workers {workers} упал (код {proc.returncode}):\n{stderr[-2000:]}")
+        rep = json.loads(report.read_text(encoding="utf-8"))
+    tts = rep["stages"].get("tts", {})
+    ok = tts.get("count", 0) - tts.get("errors", 0)
+    return {
+        "chunks_per_s": round(ok / rep["wall_s"], 1) if rep["wall_s"] else 0.0,
+        "p50_s": tts.get("p50_s", 0.0),
+        "p95_s": tts.get("p95_s", 0.0),
+        "p99_s": tts.get("p99_s", 0.0),
+        "rss_mb": round(usage.ru_maxrss / 1024, 1),  # в Linux ru_maxrss — в КБ
+        "wall_s": rep["wall_s"],
+        "failed": int(proc.returncode != 0),
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """Что стало хуже базы больше чем на tolerance (доля)."""
+    regressions = []
+    for level, now in results.items():
+        base = baseline.get(level)
+        if base is None:
+            continue
+        for key, higher in HIGHER_IS_BETTER.items():
+            old, new = base.get(key), now.get(key)
+            if not old or new is None:
+                continue
+            worse = new < old * (1 - tolerance) if higher else new > old * (1 + tolerance)
+            if worse:
+                regressions.append(f"workers={level} {key}: {old} → {new}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Сквозной бенчмарк синтеза на заглушке: кусочки/с, хвосты задержки, память")
+    p.add_argument("--chars", type=int, default=1_000_000, help="Размер синтетической книги, символов")
+    p.add_argument("--workers", default="8,32,128", help="Уровни параллельности через запятую")
+    p.add_argument("--latency", default="lognormal:0.05,0.5", help="Задержка заглушки (см. benchmarks.stub_speechkit)")
+    p.add_argument("--errors", default="429:0.002,503:0.01", help="Доля ответов с ошибкой по кодам; каждый 429 ставит на паузу весь процесс (по умолчанию: 429:0.002,503:0.01)")
+    p.add_argument("--frames", type=int, default=4, help="Кадров NDJSON в ответе (отдаются по одному, chunked)")
+    p.add_argument("--retry-base", type=float, default=0.05, help="Первая пауза очереди повторов, сек")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--save", type=Path, default=None, help="Записать результаты в JSON — это будущая база для --compare")
+    p.add_argument("--compare", type=Path, default=None, help="Сравнить с сохранённой базой; регрессия — код возврата 1")
+    p.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение относительно базы, доля (по умолчанию: 0.2)")
+    args = p.parse_args(argv)
+    parse_latency(args.latency)
+    parse_errors(args.errors)
+    levels = [int(x) for x in args.workers.split(",") if x.strip()]
+
+    pieces = split_for_tts(make_book(args.chars, args.seed), settings.SPEECHKIT_CHUNK_SIZE, settings.SPEECHKIT_CHUNK_TARGET)
+    print(f"Книга: {args.chars:,} символов → {len(pieces):,} кусочков; заглушка: {args.latency}, ошибки {args.errors}")
+
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory(prefix="tts_e2e_") as tmp:
+        manifest = Path(tmp) / "chunks.jsonl"
+        write_jsonl([(f"{i:05d}", piece) for i, piece in enumerate(pieces, 1)], manifest)
+        server, url = serve(args.latency, frames=args.frames, errors=args.errors, chunked=True, seed=args.seed)
+        try:
+            print(f"{'workers':>7} {'кусочков/с':>11} {'p50':>7} {'p95':>7} {'p99':>7} {'RSS, МБ':>8} {'ошибок API':>10}")
+            for workers in levels:
+                server.statuses.clear()
+                t0 = time.perf_counter()
+                res = run_level(workers, manifest, url, args)
+                injected = sum(n for status, n in server.statuses.items() if status != 200)
+                results[str(workers)] = res
+                print(
+                    f"{workers:>7} {res['chunks_per_s']:>11.1f} {res['p50_s']:>7.3f} {res['p95_s']:>7.3f} {res['p99_s']:>7.3f} "
+                    f"{res['rss_mb']:>8.1f} {injected:>10}" + ("  FAIL" if res["failed"] else "") + f"  ({time.perf_counter() - t0:.1f}s)"
+                )
+        finally:
+            server.shutdown()
+
+    if args.save is not None:
+        params = {k: getattr(args, k) for k in ("chars", "latency", "errors", "frames", "seed")}
+        args.save.write_text(json.dumps({"params": params, "levels": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Результаты: {args.save}")
+    failed = any(res["failed"] for res in results.values())
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))["levels"]
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"[РЕГРЕССИЯ] {line}", file=sys.stderr)
+        if not regressions:
+            print(f"Регрессий нет (допуск {args.tolerance:.0%})")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,4 +1,6 @@
 import os
+from pathlib import Path
+
 from dotenv import load_dotenv
 
 # Подгрузим .env
@@ -6,10 +8,29 @@ load_dotenv()
 
 # Основные настройки
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-BOOK_PATH = os.getenv("BOOK_PATH", "./data/book.txt")
+BOOK_PATH = os.getenv("BOOK_PATH", "./data/book.txt")  # .txt или .pdf
 OUT_DIR = os.getenv("OUT_DIR", "./out")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5-nano")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # свой/локальный OpenAI-совместимый эндпоинт
+CLEAN_WORKERS = int(os.getenv("CLEAN_WORKERS", "4"))      # параллельных запросов на очистку
 MAX_CONTENT_TOKENS = int(os.getenv("MAX_CONTENT_TOKENS", "9500"))
+# Кэш словарей BPE для tiktoken: заполняется при первой загрузке, дальше работает без сети
+TIKTOKEN_CACHE_DIR = Path(os.getenv("TIKTOKEN_CACHE_DIR") or Path(__file__).resolve().parents[1] / ".cache" / "tiktoken")
+# Очистка: llm — правила + LLM, local — только правила (без LLM), raw — только LLM (как раньше)
+CLEAN_MODE = os.getenv("CLEAN_MODE", "llm")
+CLEAN_MODES = ("llm", "local", "raw")
 
 # Настройки для SpeechKit
-SPEECHKIT_CHUNK_SIZE = 200
+# Профили длины TTS-кусочков: предложения пакуются жадно до target символов,
+# max — жёсткий предел одного запроса (длиннее режем по словам).
+TTS_CHUNK_PROFILES = {
+    "speechkit_v3": {"target": 200, "max": 200},
+    # длинные реплики (SpeechKit сам делит их внутри, см. unsafeMode) — примерно в 5 раз меньше запросов
+    "speechkit_v3_long": {"target": 900, "max": 1000},
+}
+TTS_CHUNK_PROFILE = os.getenv("TTS_CHUNK_PROFILE", "speechkit_v3")
+_profile = TTS_CHUNK_PROFILES[TTS_CHUNK_PROFILE]
+SPEECHKIT_CHUNK_SIZE = int(os.getenv("SPEECHKIT_CHUNK_SIZE", _profile["max"]))
+SPEECHKIT_CHUNK_TARGET = int(os.getenv("SPEECHKIT_CHUNK_TARGET", _profile["target"]))
+# Формат папки speechkit_chunks: store (chunks.dat + chunks.idx), txt (файл на кусочек) или both
+CHUNK_FORMAT = os.getenv("CHUNK_FORMAT", "store")
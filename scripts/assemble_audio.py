@@ -0,0 +1,274 @@
+# scripts/assemble_audio.py
+
+"""
+Склейка out/audio/* в готовую книгу без ffmpeg и без перекодирования.
+
+  WAV — один RIFF-заголовок и PCM всех кусочков подряд (форматы должны совпадать);
+  MP3 — аудиокадры подряд, без ID3-тегов и служебных Xing/Info-кадров кусочков;
+  OGG — цепочка Ogg-потоков (chained Ogg), страницы копируются как есть.
+
+Файлы читаются и пишутся блоками, так что память не зависит от длины книги.
+Книгу можно сразу разбить на части по длительности и/или по главам:
+
+    python -m scripts.assemble_audio --max-minutes 60
+    python -m scripts.assemble_audio --chapter-pattern '^Глава\\s+\\d+'
+
+Перед склейкой аудио сверяется со списком кусочков (--chunks-dir, а без
+него — с failures.json синтеза): если каких-то нет, склейка не начинается,
+чтобы в книге молча не пропали фразы. --allow-gaps склеивает что есть.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import json
+import os
+import re
+import shutil
+import sys
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from scripts import audio_formats, dedup, retry_queue
+from scripts.chunk_store import iter_chunks, natural_key
+
+DEFAULT_AUDIO_DIR = Path("./out/audio")
+DEFAULT_CHUNKS_DIR = Path("./out/speechkit_chunks")
+DEFAULT_OUT_STEM = Path("./out/book_full")
+COPY_BLOCK = 1024 * 1024
+
+EXTENSIONS = (".mp3", ".wav", ".ogg")
+
+
+def _copy_range(src: BinaryIO, dst: BinaryIO, start: int, end: int) -> None:
+    src.seek(start)
+    left = end - start
+    while left > 0:
+        block = src.read(min(COPY_BLOCK, left))
+        if not block:
+            break
+        dst.write(block)
+        left -= len(block)
+
+
+# ---------- Писатели частей по форматам ----------
+
+class PartWriter:
+    """Одна выходная часть книги. append() дописывает кусочек, close() закрывает файл."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.out = path.open("wb")
+        self.seconds = 0.0
+        self.count = 0
+
+    def append(self, src: Path) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.out.close()
+
+
+def mp3_payload(data: bytes) -> memoryview:
+    """Аудиокадры кусочка для склейки: без ID3-тегов и служебного Xing/Info-кадра."""
+    start, end = audio_formats.mp3_audio_span(data)
+    first = next(audio_formats.iter_mp3_frames(data, start, end), None)
+    if first is not None and audio_formats.is_xing_frame(data, first[0], first[1]):
+        # Xing/Info описывает длину одного кусочка — в склейке он соврёт плееру
+        start = first[0] + first[1].size
+    elif first is not None:
+        start = first[0]
+    return memoryview(data)[start:end]
+
+
+class Mp3PartWriter(PartWriter):
+    def append(self, src: Path) -> None:
+        # кусочки SpeechKit — десятки КБ, читаем целиком, чтобы найти служебный кадр
+        self.out.write(mp3_payload(src.read_bytes()))
+
+
+class WavPartWriter(PartWriter):
+    def __init__(self, path: Path):
+        super().__init__(path)
+        self.fmt: Optional[bytes] = None
+        self.data_size = 0
+
+    def append(self, src: Path) -> None:
+        with src.open("rb") as f:
+            info = audio_formats.read_wav_info(f)
+            if self.fmt is None:
+                self.fmt = info.fmt
+                self.out.write(audio_formats.wav_header(self.fmt, 0))
+            elif info.fmt != self.fmt:
+                raise ValueError(f"{src.name}: формат WAV отличается от первого кусочка, склейка без перекодирования невозможна")
+            _copy_range(f, self.out, info.data_offset, info.data_offset + info.data_size)
+            self.data_size += info.data_size
+
+    def close(self) -> None:
+        if self.fmt is not None:
+            # размеры RIFF и data известны только в конце — переписываем заголовок на месте
+            self.out.seek(0)
+            self.out.write(audio_formats.wav_header(self.fmt, self.data_size))
+        super().close()
+
+
+class OggPartWriter(PartWriter):
+    def append(self, src: Path) -> None:
+        with src.open("rb") as f:
+            shutil.copyfileobj(f, self.out, COPY_BLOCK)
+
+
+WRITERS = {".mp3": Mp3PartWriter, ".wav": WavPartWriter, ".ogg": OggPartWriter}
+
+
+# ---------- Порядок и разбиение на части ----------
+
+def list_audio(audio_dir: Path, ext: str) -> List[Tuple[str, Path]]:
+    """
+    Кусочки в порядке книги. Дубликаты, которые есть только в dedup_manifest.json
+    (без своего файла), подставляются файлом первого вхождения.
+    """
+    # scandir, а не glob: тип файла приходит из каталога, без stat на каждый из тысяч кусочков
+    with os.scandir(audio_dir) as it:
+        files = {e.name[:-len(ext)]: Path(e.path) for e in it if e.name.endswith(ext) and e.is_file()}
+    for dup, canon in dedup.load_manifest(audio_dir).items():
+        if dup not in files and canon in files:
+            files[dup] = files[canon]
+    return [(stem, files[stem]) for stem in sorted(files, key=natural_key)]
+
+
+def missing_audio(audio_dir: Path, chunks_dir: Path, stems: Set[str]) -> Tuple[List[str], str]:
+    """
+    (id кусочков без аудио в порядке книги, откуда взят список). Список —
+    тексты кусочков в chunks_dir, а если их нет — failures.json синтеза.
+    """
+    if chunks_dir.is_dir():
+        ids = [chunk_id for chunk_id, _ in iter_chunks(chunks_dir)]
+        if ids:
+            return [chunk_id for chunk_id in ids if chunk_id not in stems], str(chunks_dir)
+    failures = audio_dir / retry_queue.FAILURES_NAME
+    if failures.is_file():
+        ids = [rec["id"] for rec in json.loads(failures.read_text(encoding="utf-8"))]
+        return sorted((i for i in ids if i not in stems), key=natural_key), str(failures)
+    return [], ""
+
+
+def shift_chapters(chapters: Set[str], missing: List[str], stems: List[str]) -> Set[str]:
+    """Глава, чей первый кусочек без аудио, начинается со следующего кусочка, у которого аудио есть."""
+    lost = chapters.intersection(missing)
+    if not lost:
+        return chapters
+    shifted = chapters - lost
+    keys = [natural_key(s) for s in stems]
+    for chunk_id in lost:
+        i = bisect.bisect_right(keys, natural_key(chunk_id))
+        if i < len(stems):
+            shifted.add(stems[i])
+    return shifted
+
+
+def detect_ext(audio_dir: Path) -> str:
+    found = [ext for ext in EXTENSIONS if any(audio_dir.glob(f"*{ext}"))]
+    if len(found) != 1:
+        raise ValueError(f"В {audio_dir} ожидался один формат аудио, найдено: {found or 'ничего'}")
+    return found[0]
+
+
+def chapter_starts(chunks_dir: Path, pattern: str) -> Set[str]:
+    """id кусочков, с которых начинается глава (текст совпал с регуляркой)."""
+    rx = re.compile(pattern, re.MULTILINE)
+    return {chunk_id for chunk_id, text in iter_chunks(chunks_dir) if rx.search(text)}
+
+
+def assemble(
+    files: Iterable[Tuple[str, Path]],
+    out_stem: Path,
+    ext: str,
+    max_seconds: float = 0.0,
+    chapters: Optional[Set[str]] = None,
+) -> Iterator[PartWriter]:
+    """
+    Склеивает files по порядку. Новая часть начинается на кусочке-начале главы
+    или когда следующая порция превысила бы max_seconds. Отдаёт закрытые части.
+    """
+    writer_cls = WRITERS[ext]
+    chapters = chapters or set()
+    part: Optional[PartWriter] = None
+    n = 0
+
+    def new_part() -> PartWriter:
+        nonlocal n
+        n += 1
+        return writer_cls(out_stem.with_name(f"{out_stem.name}_{n:03d}{ext}"))
+
+    for stem, src in files:
+        dur = audio_formats.duration(src) if (max_seconds or chapters) else 0.0
+        if part is not None and part.count and (
+            stem in chapters or (max_seconds and part.seconds + dur > max_seconds)
+        ):
+            part.close()
+            yield part
+            part = None
+        if part is None:
+            part = new_part()
+        part.append(src)
+        part.seconds += dur
+        part.count += 1
+    if part is not None:
+        part.close()
+        yield part
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Склейка аудио-кусочков в книгу без перекодирования")
+    p.add_argument("--audio-dir", type=Path, default=DEFAULT_AUDIO_DIR, help=f"Папка с кусочками (по умолчанию: {DEFAULT_AUDIO_DIR})")
+    p.add_argument("--out", type=Path, default=DEFAULT_OUT_STEM, help=f"Имя результата без расширения (по умолчанию: {DEFAULT_OUT_STEM})")
+    p.add_argument("--max-minutes", type=float, default=0.0, help="Разбить на части не длиннее N минут. 0 = без ограничения.")
+    p.add_argument("--chapter-pattern", default=None, help="Регулярка начала главы (ищется в тексте кусочка); каждая глава — отдельная часть.")
+    p.add_argument("--chunks-dir", type=Path, default=DEFAULT_CHUNKS_DIR, help=f"Тексты кусочков: проверка, что у всех есть аудио, и --chapter-pattern (по умолчанию: {DEFAULT_CHUNKS_DIR})")
+    p.add_argument("--allow-gaps", action="store_true", help="Склеить, даже если у части кусочков нет аудио (с предупреждением и кодом выхода 1).")
+    args = p.parse_args(argv)
+
+    if not args.audio_dir.is_dir():
+        print(f"[FATAL] Папка не найдена: {args.audio_dir}", file=sys.stderr)
+        return 1
+    try:
+        ext = detect_ext(args.audio_dir)
+    except ValueError as e:
+        print(f"[FATAL] {e}", file=sys.stderr)
+        return 1
+
+    files = list_audio(args.audio_dir, ext)
+    if not files:
+        print(f"[FATAL] Нет аудио в {args.audio_dir}", file=sys.stderr)
+        return 1
+    missing, source = missing_audio(args.audio_dir, args.chunks_dir, {stem for stem, _ in files})
+    if missing:
+        shown = ", ".join(missing[:20]) + (f" … и ещё {len(missing) - 20}" if len(missing) > 20 else "")
+        level = "WARN" if args.allow_gaps else "FATAL"
+        print(f"[{level}] Нет аудио у {len(missing)} кусочков из {source}: {shown}", file=sys.stderr)
+        if not args.allow_gaps:
+            print("Досинтезируйте их (повторный запуск синтеза возьмёт только недостающие) или склейте как есть с --allow-gaps.", file=sys.stderr)
+            return 1
+    chapters = chapter_starts(args.chunks_dir, args.chapter_pattern) if args.chapter_pattern else set()
+    chapters = shift_chapters(chapters, missing, [stem for stem, _ in files])
+    split = bool(args.max_minutes or chapters)
+    print(f"Кусочков: {len(files)} ({ext}), начал глав: {len(chapters)}")
+
+    parts = list(assemble(files, args.out, ext, max_seconds=args.max_minutes * 60, chapters=chapters))
+    if not split and len(parts) == 1:
+        # одна часть — без суффикса _001
+        final = args.out.with_suffix(ext)
+        parts[0].path.replace(final)
+        print(f"Готово: {final}")
+        return 1 if missing else 0
+    for part in parts:
+        dur = f", {part.seconds / 60:.1f} мин" if part.seconds else ""
+        print(f"OK → {part.path.name}{dur}")
+    print(f"Готово: {len(parts)} частей")
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
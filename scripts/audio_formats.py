@@ -0,0 +1,343 @@
+# scripts/audio_formats.py
+
+"""
+Разбор заголовков WAV / MP3 / Ogg без декодирования аудио.
+
+Нужен сборке книги (склейка без перекодирования) и подсчёту длительностей:
+WAV — по размеру блока data, MP3 — по заголовкам кадров (или Xing/Info),
+Ogg Opus — по granule position последней страницы.
+
+Длительность берётся без прохода по кадрам и страницам: у MP3 — из Xing/Info
+или по размеру при постоянном битрейте, у Ogg — из хвоста файла. Кадр за
+кадром считается только MP3 с переменным битрейтом без Xing.
+"""
+
+from __future__ import annotations
+
+import functools
+import struct
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+
+
+# ---------- WAV ----------
+
+class WavInfo(NamedTuple):
+    fmt: bytes          # содержимое блока fmt как есть
+    channels: int
+    sample_rate: int
+    byte_rate: int
+    bits: int
+    data_offset: int    # где начинаются PCM-данные
+    data_size: int
+
+
+def read_wav_info(f: BinaryIO) -> WavInfo:
+    f.seek(0)
+    head = f.read(12)
+    if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        raise ValueError("Не WAV (нет RIFF/WAVE)")
+    fmt = b""
+    while True:
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            raise ValueError("WAV без блока data")
+        cid, size = hdr[:4], struct.unpack("<I", hdr[4:])[0]
+        if cid == b"fmt ":
+            fmt = f.read(size)
+            if size % 2:
+                f.read(1)
+        elif cid == b"data":
+            if not fmt:
+                raise ValueError("WAV: блок data раньше fmt")
+            channels, rate, byte_rate, _align, bits = struct.unpack("<HIIHH", fmt[2:16])
+            data_offset = f.tell()
+            end = f.seek(0, 2)
+            # стриминговые WAV бывают с размером 0xFFFFFFFF — верим длине файла
+            data_size = min(size, end - data_offset)
+            return WavInfo(fmt, channels, rate, byte_rate, bits, data_offset, data_size)
+        else:
+            f.seek(size + (size % 2), 1)
+
+
+def wav_header(fmt: bytes, data_size: int) -> bytes:
+    """RIFF-заголовок с блоками fmt и data (размер data можно дописать позже)."""
+    riff_size = 4 + (8 + len(fmt)) + (8 + data_size)
+    return (
+        b"RIFF" + struct.pack("<I", min(riff_size, 0xFFFFFFFF)) + b"WAVE"
+        + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        + b"data" + struct.pack("<I", min(data_size, 0xFFFFFFFF))
+    )
+
+
+def wav_duration(path: Path) -> float:
+    with open(path, "rb") as f:
+        info = read_wav_info(f)
+    return info.data_size / info.byte_rate if info.byte_rate else 0.0
+
+
+# ---------- MP3 ----------
+
+_MP3_BITRATES = {
+    # (version_bits, layer_bits) -> таблица кбит/с
+    (3, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),      # MPEG1 L3
+    (3, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),     # MPEG1 L2
+    (3, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),  # MPEG1 L1
+    (2, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),          # MPEG2/2.5 L2/L3
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),     # MPEG2/2.5 L1
+}
+_MP3_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+MP3_HEAD_BYTES = 4096  # хватает на ID3v2 без обложки и первый кадр с Xing/Info
+
+
+class Mp3Frame(NamedTuple):
+    size: int
+    samples: int
+    sample_rate: int
+    side_info: int      # длина side info — нужна, чтобы найти Xing/Info
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_mp3_header(h: bytes) -> Optional[Mp3Frame]:
+    """Разбирает 4 байта заголовка кадра MPEG audio; None — если это не заголовок."""
+    if len(h) < 4 or h[0] != 0xFF or (h[1] & 0xE0) != 0xE0:
+        return None
+    version = (h[1] >> 3) & 3      # 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+    layer = (h[1] >> 1) & 3        # 1 = L3, 2 = L2, 3 = L1
+    br_idx = h[2] >> 4
+    sr_idx = (h[2] >> 2) & 3
+    padding = (h[2] >> 1) & 1
+    mono = (h[3] >> 6) == 3
+    if version == 1 or layer == 0 or br_idx in (0, 15) or sr_idx == 3:
+        return None
+    table = _MP3_BITRATES[(3 if version == 3 else 2, layer)]
+    bitrate = table[br_idx] * 1000
+    rate = _MP3_RATES[version][sr_idx]
+    if layer == 3:
+        samples = 384
+        size = (12 * bitrate // rate + padding) * 4
+    elif layer == 2 or version == 3:
+        samples = 1152
+        size = 144 * bitrate // rate + padding
+    else:  # MPEG2/2.5 Layer III
+        samples = 576
+        size = 72 * bitrate // rate + padding
+    if version == 3:
+        side = 17 if mono else 32
+    else:
+        side = 9 if mono else 17
+    return Mp3Frame(size, samples, rate, side)
+
+
+def _skip_id3v2(data: bytes, start: int = 0) -> int:
+    while data[start:start + 3] == b"ID3" and len(data) >= start + 10:
+        size = data[start + 6] << 21 | data[start + 7] << 14 | data[start + 8] << 7 | data[start + 9]
+        footer = 10 if data[start + 5] & 0x10 else 0
+        start += 10 + size + footer
+    return start
+
+
+def mp3_audio_span(data: bytes) -> Tuple[int, int]:
+    """(начало, конец) аудиокадров в файле без ID3v2-тега в начале и ID3v1 в конце."""
+    start = _skip_id3v2(data)
+    end = len(data)
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    return start, end
+
+
+def is_xing_frame(data: bytes, pos: int, frame: Mp3Frame) -> bool:
+    """Первый кадр с Xing/Info/VBRI — служебный: в нём нет звука, только сводка по файлу."""
+    tag_at = pos + 4 + frame.side_info
+    return data[tag_at:tag_at + 4] in (b"Xing", b"Info") or data[pos + 36:pos + 40] == b"VBRI"
+
+
+def iter_mp3_frames(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, Mp3Frame]]:
+    """(смещение, кадр) для каждого кадра в data[start:end]; мусор между кадрами пропускается."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 4 <= end:
+        frame = parse_mp3_header(data[pos:pos + 4])
+        if frame is None or frame.size <= 4:
+            nxt = data.find(b"\xff", pos + 1, end)
+            if nxt < 0:
+                return
+            pos = nxt
+            continue
+        yield pos, frame
+        pos += frame.size
+
+
+def xing_frame_count(data: bytes, pos: int, frame: Mp3Frame) -> Optional[int]:
+    """Число кадров из Xing/Info служебного кадра на pos; None — поля нет."""
+    tag_at = pos + 4 + frame.side_info
+    if data[tag_at:tag_at + 4] not in (b"Xing", b"Info") or len(data) < tag_at + 12:
+        return None
+    flags = struct.unpack(">I", data[tag_at + 4:tag_at + 8])[0]
+    return struct.unpack(">I", data[tag_at + 8:tag_at + 12])[0] if flags & 1 else None
+
+
+def _frames_seconds(data: bytes, start: int, end: int) -> float:
+    seconds = 0.0
+    for pos, frame in iter_mp3_frames(data, start, end):
+        if pos == start and is_xing_frame(data, pos, frame):
+            count = xing_frame_count(data, pos, frame)
+            if count is not None:
+                # в Xing есть число кадров — дальше можно не идти
+                return count * frame.samples / frame.sample_rate
+            continue
+        seconds += frame.samples / frame.sample_rate
+    return seconds
+
+
+def _first_audio_frame(data: bytes, start: int) -> Tuple[int, Optional[Mp3Frame]]:
+    """Первый кадр со звуком: служебный Xing/Info/VBRI пропускается."""
+    pos = start
+    frame = parse_mp3_header(data[pos:pos + 4])
+    if frame is not None and is_xing_frame(data, pos, frame):
+        pos += frame.size
+        frame = parse_mp3_header(data[pos:pos + 4])
+    if frame is None or frame.size <= 4:
+        return pos, None
+    return pos, frame
+
+
+def _same_headers(data: bytes, pos: int, end: int, step: int) -> bool:
+    """
+    Заголовки на pos, pos + step, … до end одинаковы. Размер кадра задают
+    первые три байта заголовка (версия, слой, битрейт, частота, padding), и
+    каждый проверяется срезом с шагом — это делает C, а не цикл Python.
+    """
+    for i in range(3):
+        column = data[pos + i:end:step]
+        if column != data[pos + i:pos + i + 1] * len(column):
+            return False
+    return True
+
+
+def _cbr_seconds(data: bytes, start: int, end: int) -> Optional[float]:
+    """
+    Длительность потока с постоянным битрейтом — по размеру, без прохода по
+    кадрам: кадры лежат с шагом frame.size. None — поток не такой.
+    """
+    pos, frame = _first_audio_frame(data, start)
+    if frame is None or (end - pos) % frame.size or not _same_headers(data, pos, end, frame.size):
+        return None
+    return (end - pos) // frame.size * frame.samples / frame.sample_rate
+
+
+def mp3_duration(path: Path) -> float:
+    """
+    Длительность MP3 по заголовкам: из Xing/Info в начале файла, иначе по
+    размеру, если битрейт постоянный, иначе суммой по всем кадрам (VBR без Xing).
+    Если битрейт меняется уже в первых MP3_HEAD_BYTES, проверка всего файла
+    на постоянный битрейт не делается.
+    """
+    with open(path, "rb") as f:
+        head = f.read(MP3_HEAD_BYTES)
+        start = _skip_id3v2(head)
+        frame = parse_mp3_header(head[start:start + 4])
+        if frame is not None and is_xing_frame(head, start, frame):
+            count = xing_frame_count(head, start, frame)
+            if count is not None:
+                return count * frame.samples / frame.sample_rate
+        pos, frame = _first_audio_frame(head, start)
+        vbr = frame is not None and not _same_headers(head, pos, len(head), frame.size)
+        data = head + f.read()
+    start, end = mp3_audio_span(data)
+    seconds = None if vbr else _cbr_seconds(data, start, end)
+    return seconds if seconds is not None else _frames_seconds(data, start, end)
+
+
+# ---------- Ogg ----------
+
+class OggPage(NamedTuple):
+    offset: int
+    size: int
+    header_type: int
+    granule: int
+    serial: int
+
+
+def iter_ogg_pages(f: BinaryIO) -> Iterator[OggPage]:
+    """Проходит по страницам Ogg, читая только 27-байтные заголовки и таблицы сегментов."""
+    f.seek(0)
+    offset = 0
+    while True:
+        hdr = f.read(27)
+        if len(hdr) < 27:
+            return
+        if hdr[:4] != b"OggS":
+            raise ValueError(f"Ogg: нет OggS на смещении {offset}")
+        header_type = hdr[5]
+        granule, serial = struct.unpack("<qI", hdr[6:18])
+        nsegs = hdr[26]
+        body = sum(f.read(nsegs))
+        size = 27 + nsegs + body
+        yield OggPage(offset, size, header_type, granule, serial)
+        offset += size
+        f.seek(offset)
+
+
+OGG_MAX_PAGE = 27 + 255 + 255 * 255
+
+
+def ogg_last_granule(f: BinaryIO) -> Optional[int]:
+    """
+    granule position последней страницы с ним — по хвосту файла, без прохода
+    по страницам: страница Ogg не длиннее OGG_MAX_PAGE. None — в хвосте нет
+    целой страницы (тогда нужен iter_ogg_pages).
+    """
+    size = f.seek(0, 2)
+    f.seek(max(0, size - OGG_MAX_PAGE))
+    tail = f.read()
+    at = len(tail)
+    while at > 0:
+        at = tail.rfind(b"OggS", 0, at)
+        if at < 0:
+            return None
+        hdr = tail[at:at + 27]
+        if len(hdr) < 27 or hdr[4] != 0:
+            continue
+        nsegs = hdr[26]
+        page_end = at + 27 + nsegs + sum(tail[at + 27:at + 27 + nsegs])
+        # "OggS" мог встретиться внутри пакета: настоящая страница кончается
+        # ровно на конце файла или на заголовке следующей
+        if page_end != len(tail) and tail[page_end:page_end + 4] != b"OggS":
+            continue
+        granule = struct.unpack("<q", hdr[6:14])[0]
+        if granule >= 0:
+            return granule
+    return None
+
+
+def ogg_duration(path: Path) -> float:
+    """Длительность Ogg Opus: granule последней страницы минус pre-skip, в 48 кГц."""
+    with open(path, "rb") as f:
+        head = f.read(28 + 255 + 19)
+        pre_skip = 0
+        at = head.find(b"OpusHead")
+        if at >= 0:
+            pre_skip = struct.unpack("<H", head[at + 10:at + 12])[0]
+        last = ogg_last_granule(f)
+        if last is None:
+            last = 0
+            for page in iter_ogg_pages(f):
+                if page.granule >= 0:
+                    last = page.granule
+    return max(0, last - pre_skip) / 48000
+
+
+# ---------- общее ----------
+
+def duration(path: Path) -> float:
+    """Длительность файла в секундах по расширению (.wav / .mp3 / .ogg)."""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".wav":
+        return wav_duration(path)
+    if suffix == ".mp3":
+        return mp3_duration(path)
+    if suffix in (".ogg", ".opus"):
+        return ogg_duration(path)
+    raise ValueError(f"Неизвестный формат аудио: {path}")
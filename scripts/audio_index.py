@@ -0,0 +1,346 @@
+# scripts/audio_index.py
+
+"""
+Оглавление озвученной книги без декодирования аудио.
+
+Длительность каждого кусочка out/audio/{id}{ext} берётся из заголовков
+(audio_formats): WAV — блок data, MP3 — Xing/Info или постоянный битрейт,
+Ogg — granule последней страницы. Порядок тот же, что у assemble_audio,
+поэтому таймкоды совпадают с книгой, собранной одним файлом. Длительности
+запоминаются в out/audio/.durations.tsv: повторный запуск читает только
+новые и изменившиеся файлы.
+
+Рядом с книгой (--out, по умолчанию out/book_full) пишутся:
+  book_full.index.tsv      — кусочек: начало и длительность в книге, символы в cleaned_full.txt;
+  book_full.vtt            — предложения с таймкодами (WebVTT);
+и при --chapter-pattern — главы:
+  book_full.cue            — CUE-лист для плееров;
+  book_full.chapters.txt   — «ЧЧ:ММ:СС.ммм Название», как у mp4chaps для M4B;
+  book_full.ffmetadata     — для ffmpeg: -i book_full.ffmetadata -map_metadata 1.
+
+Таймкоды предложений внутри кусочка — оценка: длительность кусочка делится
+между предложениями пропорционально числу символов.
+
+    python -m scripts.audio_index
+    python -m scripts.audio_index --chapter-pattern '^Глава\\s+\\d+'
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from project_config import settings
+from scripts import audio_formats
+from scripts.assemble_audio import DEFAULT_OUT_STEM, EXTENSIONS, detect_ext, list_audio
+from scripts.chunk_store import iter_chunks
+from scripts.utils import iter_sentences
+
+CACHE_NAME = ".durations.tsv"
+TITLE_CHARS = 80
+_WORD = re.compile(r"\S+")
+_CUE_FILE_TYPES = {".mp3": "MP3", ".wav": "WAVE", ".ogg": "WAVE"}
+
+
+class IndexEntry(NamedTuple):
+    chunk_id: str
+    start: float       # начало кусочка в книге, сек
+    seconds: float
+    text_start: int    # [text_start, text_end) — символы в cleaned_full.txt; -1 — не найден
+    text_end: int
+
+
+class Chapter(NamedTuple):
+    start: float
+    end: float
+    title: str
+
+
+# ---------- Индекс ----------
+
+def text_spans(full_text: str, chunks: Iterable[Tuple[str, str]]) -> Dict[str, Tuple[int, int]]:
+    """
+    Где текст каждого кусочка лежит в cleaned_full.txt. Кусочек — те же слова
+    подряд, в которых переводы строк стали пробелами, а пробелы между
+    предложениями схлопнулись в один. Обычно он совпадает с текстом книги
+    целиком; иначе сопоставление идёт по словам. Расхождение (текст правили
+    после нарезки) останавливает разметку: дальше спаны не находятся.
+    """
+    spans: Dict[str, Tuple[int, int]] = {}
+    at = 0
+    for chunk_id, text in chunks:
+        m = _WORD.search(full_text, at)
+        if m is None:
+            break
+        start = m.start()
+        end = start + len(text)
+        if full_text[start:end].replace("\n", " ") != text:
+            parts = text.split()
+            words = list(itertools.islice(_WORD.finditer(full_text, start), len(parts)))
+            if len(words) < len(parts) or words[0].group() != parts[0] or words[-1].group() != parts[-1]:
+                print(f"[WARN] Текст кусочка {chunk_id} не совпал с cleaned_full.txt: разметка текста дальше пропущена", file=sys.stderr)
+                break
+            end = words[-1].end()
+        spans[chunk_id] = (start, end)
+        at = end
+    return spans
+
+
+class DurationCache:
+    """
+    Длительности между запусками: audio_dir/.durations.tsv, строка на файл —
+    "<имя>\t<размер>\t<mtime_ns>\t<inode>\t<секунды>". Файл, у которого что-то
+    из этого поменялось (дописан, перезаписан, подставлен realign), читается заново.
+    """
+
+    def __init__(self, audio_dir: Path):
+        self.path = Path(audio_dir) / CACHE_NAME
+        self.rows: Dict[str, Tuple[int, int, int, float]] = {}
+        self.dirty = False
+        if self.path.is_file():
+            for line in self.path.read_text(encoding="utf-8").splitlines():
+                try:
+                    name, size, mtime, inode, seconds = line.split("\t")
+                    self.rows[name] = (int(size), int(mtime), int(inode), float(seconds))
+                except ValueError:
+                    continue
+
+    def duration(self, path: Path) -> float:
+        st = os.stat(path)
+        row = self.rows.get(path.name)
+        if row is not None and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return row[3]
+        seconds = audio_formats.duration(path)
+        self.rows[path.name] = (st.st_size, st.st_mtime_ns, st.st_ino, seconds)
+        self.dirty = True
+        return seconds
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text("".join(f"{name}\t{size}\t{mtime}\t{inode}\t{seconds!r}\n" for name, (size, mtime, inode, seconds) in self.rows.items()), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def build_index(
+    files: List[Tuple[str, Path]],
+    spans: Optional[Dict[str, Tuple[int, int]]] = None,
+    duration: Callable[[Path], float] = audio_formats.duration,
+) -> List[IndexEntry]:
+    """Записи индекса по файлам в порядке книги. Один файл на несколько id (dedup) читается один раз."""
+    spans = spans or {}
+    known: Dict[Path, float] = {}
+    entries: List[IndexEntry] = []
+    start = 0.0
+    for chunk_id, path in files:
+        seconds = known.get(path)
+        if seconds is None:
+            seconds = known[path] = duration(path)
+        text_start, text_end = spans.get(chunk_id, (-1, -1))
+        entries.append(IndexEntry(chunk_id, start, seconds, text_start, text_end))
+        start += seconds
+    return entries
+
+
+def write_index(path: Path, entries: List[IndexEntry]) -> None:
+    lines = ["# id\tstart\tseconds\ttext_start\ttext_end\n"]
+    lines.extend(f"{e.chunk_id}\t{e.start:.3f}\t{e.seconds:.3f}\t{e.text_start}\t{e.text_end}\n" for e in entries)
+    path.write_text("".join(lines), encoding="utf-8")
+
+
+def load_index(path: Path) -> List[IndexEntry]:
+    entries: List[IndexEntry] = []
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            chunk_id, start, seconds, text_start, text_end = line.rstrip("\n").split("\t")
+            entries.append(IndexEntry(chunk_id, float(start), float(seconds), int(text_start), int(text_end)))
+    return entries
+
+
+# ---------- Главы ----------
+
+def _title(text: str, at: int = 0) -> str:
+    """Первое предложение text начиная с at, не длиннее TITLE_CHARS."""
+    first = next(iter_sentences(text[at:]), (0, 0))
+    title = " ".join(text[at + first[0]:at + first[1]].split())
+    return title if len(title) <= TITLE_CHARS else title[:TITLE_CHARS - 1].rstrip() + "…"
+
+
+def find_chapters(entries: List[IndexEntry], texts: Dict[str, str], pattern: str) -> List[Chapter]:
+    """
+    Главы — кусочки, в тексте которых нашлась регулярка (как --chapter-pattern
+    у assemble_audio). Название — предложение с найденного места. Если первая
+    глава начинается не с начала книги, перед ней появляется глава с началом книги.
+    """
+    rx = re.compile(pattern, re.MULTILINE)
+    marks: List[Tuple[float, str]] = []
+    for e in entries:
+        m = rx.search(texts.get(e.chunk_id, ""))
+        if m:
+            marks.append((e.start, _title(texts[e.chunk_id], m.start())))
+    if not marks or not entries:
+        return []
+    if marks[0][0] > 0:
+        marks.insert(0, (0.0, _title(texts.get(entries[0].chunk_id, "")) or "Начало"))
+    total = entries[-1].start + entries[-1].seconds
+    ends = [start for start, _ in marks[1:]] + [total]
+    return [Chapter(start, end, title) for (start, title), end in zip(marks, ends)]
+
+
+def _hms(seconds: float) -> str:
+    ms = round(seconds * 1000)
+    return f"{ms // 3_600_000:02d}:{ms // 60_000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+
+def _quote(title: str) -> str:
+    return title.replace('"', "'")
+
+
+def write_cue(path: Path, audio_name: str, chapters: List[Chapter], title: str = "") -> None:
+    """CUE-лист: INDEX в минутах:секундах:кадрах (75 кадров в секунду)."""
+    ext = Path(audio_name).suffix.lower()
+    lines = [f'TITLE "{_quote(title)}"'] if title else []
+    lines.append(f'FILE "{_quote(audio_name)}" {_CUE_FILE_TYPES.get(ext, "WAVE")}')
+    for n, ch in enumerate(chapters, 1):
+        frames = round(ch.start * 75)
+        lines += [
+            f"  TRACK {n:02d} AUDIO",
+            f'    TITLE "{_quote(ch.title)}"',
+            f"    INDEX 01 {frames // 4500:02d}:{frames // 75 % 60:02d}:{frames % 75:02d}",
+        ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def write_chapters_txt(path: Path, chapters: List[Chapter]) -> None:
+    path.write_text("".join(f"{_hms(ch.start)} {ch.title}\n" for ch in chapters), encoding="utf-8")
+
+
+def _ffescape(value: str) -> str:
+    return re.sub(r"([=;#\\\n])", r"\\\1", value)
+
+
+def write_ffmetadata(path: Path, chapters: List[Chapter], title: str = "") -> None:
+    lines = [";FFMETADATA1"]
+    if title:
+        lines.append(f"title={_ffescape(title)}")
+    for ch in chapters:
+        lines += [
+            "", "[CHAPTER]", "TIMEBASE=1/1000",
+            f"START={round(ch.start * 1000)}", f"END={round(ch.end * 1000)}",
+            f"title={_ffescape(ch.title)}",
+        ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+# ---------- Предложения ----------
+
+def iter_sentence_times(entries: List[IndexEntry], texts: Dict[str, str]) -> Iterator[Tuple[str, float, float, str]]:
+    """(id кусочка, начало, конец, предложение): длительность кусочка делится по числу символов."""
+    for e in entries:
+        text = texts.get(e.chunk_id, "")
+        sentences = [text[a:b].strip() for a, b in iter_sentences(text)]
+        total = sum(len(s) for s in sentences)
+        if not total:
+            continue
+        at = e.start
+        for sentence in sentences:
+            end = at + e.seconds * len(sentence) / total
+            yield e.chunk_id, at, end, sentence
+            at = end
+
+
+def write_vtt(path: Path, entries: List[IndexEntry], texts: Dict[str, str]) -> int:
+    """WebVTT с предложением на реплику; идентификатор реплики — «id кусочка.номер». Возвращает число реплик."""
+    lines = ["WEBVTT", ""]
+    n = 0
+    prev, k = None, 0
+    for chunk_id, start, end, sentence in iter_sentence_times(entries, texts):
+        k = k + 1 if chunk_id == prev else 1
+        prev = chunk_id
+        lines += [f"{chunk_id}.{k}", f"{_hms(start)} --> {_hms(end)}", sentence.replace("-->", "->"), ""]
+        n += 1
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return n
+
+
+def _sidecar(out_stem: Path, suffix: str) -> Path:
+    return out_stem.with_name(out_stem.name + suffix)
+
+
+def main(argv: list[str] | None = None) -> int:
+    out_dir = Path(settings.OUT_DIR)
+    p = argparse.ArgumentParser(description="Индекс длительностей, главы и таймкоды предложений по заголовкам аудио, без декодирования")
+    p.add_argument("--audio-dir", type=Path, default=out_dir / "audio", help=f"Папка с кусочками (по умолчанию: {out_dir / 'audio'})")
+    p.add_argument("--chunks-dir", type=Path, default=out_dir / "speechkit_chunks", help=f"Тексты кусочков (по умолчанию: {out_dir / 'speechkit_chunks'})")
+    p.add_argument("--cleaned", type=Path, default=out_dir / "cleaned_full.txt", help=f"Текст книги для спанов в индексе (по умолчанию: {out_dir / 'cleaned_full.txt'})")
+    p.add_argument("--out", type=Path, default=DEFAULT_OUT_STEM, help=f"Имя книги без расширения; файлы пишутся рядом (по умолчанию: {DEFAULT_OUT_STEM})")
+    p.add_argument("--ext", default=None, choices=EXTENSIONS, help="Расширение аудио (по умолчанию: по файлам в --audio-dir)")
+    p.add_argument("--chapter-pattern", default=None, help="Регулярка начала главы в тексте кусочка; без неё главы не пишутся")
+    p.add_argument("--title", default="", help="Название книги для CUE и ffmetadata")
+    args = p.parse_args(argv)
+
+    if not args.audio_dir.is_dir():
+        print(f"[FATAL] Папка не найдена: {args.audio_dir}", file=sys.stderr)
+        return 1
+    try:
+        ext = args.ext or detect_ext(args.audio_dir)
+    except ValueError as e:
+        print(f"[FATAL] {e}", file=sys.stderr)
+        return 1
+    files = list_audio(args.audio_dir, ext)
+    if not files:
+        print(f"[FATAL] Нет аудио в {args.audio_dir}", file=sys.stderr)
+        return 1
+
+    t0 = time.perf_counter()
+    chunks = list(iter_chunks(args.chunks_dir)) if args.chunks_dir.is_dir() else []
+    texts = dict(chunks)
+    spans = text_spans(args.cleaned.read_text(encoding="utf-8"), chunks) if args.cleaned.is_file() else {}
+    cache = DurationCache(args.audio_dir)
+    try:
+        entries = build_index(files, spans, cache.duration)
+    except (OSError, ValueError) as e:
+        print(f"[FATAL] {e}", file=sys.stderr)
+        return 1
+    cache.save()
+    indexed = {e.chunk_id for e in entries}
+    missing = sum(1 for chunk_id, _ in chunks if chunk_id not in indexed)
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    written = [_sidecar(args.out, ".index.tsv")]
+    write_index(written[0], entries)
+    cues = 0
+    if texts:
+        written.append(_sidecar(args.out, ".vtt"))
+        cues = write_vtt(written[-1], entries, texts)
+    chapters = find_chapters(entries, texts, args.chapter_pattern) if args.chapter_pattern else []
+    if chapters:
+        written += [_sidecar(args.out, suffix) for suffix in (".cue", ".chapters.txt", ".ffmetadata")]
+        write_cue(written[-3], args.out.name + ext, chapters, args.title)
+        write_chapters_txt(written[-2], chapters)
+        write_ffmetadata(written[-1], chapters, args.title)
+    elapsed = time.perf_counter() - t0
+
+    total = entries[-1].start + entries[-1].seconds
+    print(f"Кусочков: {len(entries)} ({ext}), длительность {_hms(total)}, глав: {len(chapters)}, предложений: {cues} — {elapsed * 1000:.0f} мс")
+    if missing:
+        print(f"[WARN] Нет аудио у {missing} кусочков: таймкоды верны для книги, собранной из того, что есть", file=sys.stderr)
+    if args.chapter_pattern and not chapters:
+        print(f"[WARN] Регулярка {args.chapter_pattern!r} не нашлась ни в одном кусочке", file=sys.stderr)
+    for path in written:
+        print(f"OK → {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
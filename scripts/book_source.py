@@ -0,0 +1,180 @@
+# scripts/book_source.py
+
+"""
+Чтение исходной книги (TXT или PDF) блоками, без загрузки целиком.
+
+PDF разбирается на чистом Python (pypdf) и отдаётся по страницам. Ещё до LLM
+со страниц снимаются колонтитулы и номера страниц. Колонтитулом считается
+строка у верхнего или нижнего края страницы, которая с точностью до цифр
+повторяется на соседних страницах. Номером страницы — строка из одного числа
+у края, если у того же края соседних страниц стоят числа, идущие с ним
+подряд. Год или номер главы у края страницы остаются. Так LLM-чанки получаются меньше и дешевле,
+а внешний pdftotext больше не нужен.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import Counter, deque
+from pathlib import Path
+from typing import Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from scripts import utils
+
+TXT_BLOCK_CHARS = 1 << 20        # TXT читается целыми строками примерно такими блоками
+PDF_CACHE_RESET_PAGES = 64       # раз в столько страниц сбрасываем кэш объектов pypdf
+
+EDGE_LINES = 3                   # сколько строк сверху и снизу страницы проверять
+WINDOW_RADIUS = 4                # соседние страницы с каждой стороны для подсчёта повторов
+MIN_REPEATS = 3                  # на скольких страницах окна строка должна повториться
+PAGE_STEP = 3                    # на сколько номер может убежать вперёд за одну страницу
+
+# "12", "- 12 -", "стр. 12", "Page 12", "12 / 300", "xiv" (заглавные римские — это скорее номер главы)
+_PAGE_NUMBER = re.compile(
+    r"^[\s\-–—]*(?:(?:стр|с|page|p)\.?\s*)?(?:(\d{1,4})(?:\s*(?:/|из|of)\s*\d{1,4})?|(?-i:([ivxlcdm]{1,7})))[\s\-–—]*$",
+    re.IGNORECASE,
+)
+_ROMAN = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100, "d": 500, "m": 1000}
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+
+
+def is_pdf(path: Path) -> bool:
+    return Path(path).suffix.lower() == ".pdf"
+
+
+def iter_pdf_pages(path: Path) -> Iterator[str]:
+    """Текст PDF по страницам. Память не растёт с числом страниц: кэш разобранных объектов периодически сбрасывается."""
+    try:
+        from pypdf import PdfReader  # ~70 мс на импорт, TXT-книгам не нужен
+    except ImportError:
+        raise RuntimeError("Для PDF нужен пакет pypdf: pip install pypdf") from None
+    reader = PdfReader(str(path))
+    for n, page in enumerate(reader.pages, 1):
+        yield page.extract_text() or ""
+        if n % PDF_CACHE_RESET_PAGES == 0:
+            # иначе в кэше оседают картинки и шрифты всех прочитанных страниц (сканы — сотни МБ)
+            reader.resolved_objects.clear()
+
+
+def _roman(text: str) -> int:
+    values = [_ROMAN[ch] for ch in text]
+    return sum(-v if v < nxt else v for v, nxt in zip(values, values[1:] + [0]))
+
+
+def _page_number(line: str) -> Optional[int]:
+    """Число из строки-номера страницы ("- 12 -", "стр. 12", "xiv"); None — строка не такая."""
+    m = _PAGE_NUMBER.match(line)
+    if m is None:
+        return None
+    return int(m.group(1)) if m.group(1) else _roman(m.group(2))
+
+
+def _edge_key(line: str, top: bool) -> str:
+    """Ключ для сравнения колонтитулов: край страницы + строка без учёта цифр, регистра и пробелов."""
+    return ("t" if top else "b") + _SPACES.sub(" ", _DIGITS.sub("#", line.strip().lower()))
+
+
+class _Page(NamedTuple):
+    lines: List[str]
+    top: List[int]          # номера непустых строк у верхнего края
+    bottom: List[int]       # ... и у нижнего
+    keys: Set[str]          # ключи строк у краёв, кроме строк-чисел
+    numbers: Dict[int, Tuple[bool, int]]  # строка-число у края: номер строки → (верх, число)
+
+
+def _read_page(text: str, edge_lines: int) -> _Page:
+    lines = text.splitlines()
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    top = filled[:edge_lines]
+    bottom = [i for i in filled[-edge_lines:] if i not in top]
+    numbers: Dict[int, Tuple[bool, int]] = {}
+    keys = set()
+    for is_top, edge in ((True, top), (False, bottom)):
+        for i in edge:
+            n = _page_number(lines[i])
+            if n is not None:
+                numbers[i] = (is_top, n)  # числа решает последовательность, а не повторы «#»
+            else:
+                keys.add(_edge_key(lines[i], is_top))
+    return _Page(lines, top, bottom, keys, numbers)
+
+
+def _in_sequence(window: Deque[_Page], cur: int, is_top: bool, n: int) -> bool:
+    """У того же края соседних страниц окна есть число, идущее с n подряд: не дальше PAGE_STEP за страницу."""
+    for j, page in enumerate(window):
+        d = cur - j
+        if d == 0:
+            continue
+        for edge, m in page.numbers.values():
+            if edge == is_top and 0 < (n - m) * (1 if d > 0 else -1) <= PAGE_STEP * abs(d):
+                return True
+    return False
+
+
+def _strip_page(window: Deque[_Page], cur: int, counts: Counter, min_repeats: int) -> str:
+    page = window[cur]
+    drop = set()
+    for is_top, edge in ((True, page.top), (False, page.bottom)):
+        for i in edge:
+            number = page.numbers.get(i)
+            if number is not None:
+                if _in_sequence(window, cur, *number):
+                    drop.add(i)
+            elif counts[_edge_key(page.lines[i], is_top)] >= min_repeats:
+                drop.add(i)
+    return "\n".join(line for i, line in enumerate(page.lines) if i not in drop)
+
+
+def strip_running_lines(
+    pages: Iterable[str],
+    radius: int = WINDOW_RADIUS,
+    edge_lines: int = EDGE_LINES,
+    min_repeats: int = MIN_REPEATS,
+) -> Iterator[str]:
+    """
+    Убирает колонтитулы и номера страниц. Решение по странице принимается по
+    скользящему окну из radius страниц до и после неё, так что в памяти
+    держится не больше 2 * radius + 1 страниц. Чередующиеся колонтитулы
+    (название книги на чётных, главы на нечётных) тоже ловятся: в окне их
+    всё равно больше min_repeats.
+    """
+    window: Deque[_Page] = deque()
+    counts: Counter = Counter()
+    cur = 0  # позиция в окне следующей страницы на выдачу
+
+    def advance() -> str:
+        nonlocal cur
+        text = _strip_page(window, cur, counts, min_repeats)
+        cur += 1
+        if cur > radius:
+            counts.subtract(window.popleft().keys)
+            cur -= 1
+        return text
+
+    for text in pages:
+        page = _read_page(text, edge_lines)
+        window.append(page)
+        counts.update(page.keys)
+        if len(window) - 1 - cur >= radius:
+            yield advance()
+    while cur < len(window):
+        yield advance()
+
+
+def iter_book_text(path: Path) -> Iterator[str]:
+    """
+    Текст книги блоками после soft_normalize: PDF — по странице без колонтитулов,
+    TXT — целыми строками примерно по TXT_BLOCK_CHARS символов.
+    """
+    path = Path(path)
+    if is_pdf(path):
+        for page in strip_running_lines(iter_pdf_pages(path)):
+            yield utils.soft_normalize(page) + "\n"
+        return
+    with path.open("r", encoding="utf-8") as f:
+        while True:
+            lines = f.readlines(TXT_BLOCK_CHARS)
+            if not lines:
+                return
+            yield utils.soft_normalize("".join(lines))
@@ -0,0 +1,235 @@
+# scripts/chunk_store.py
+
+"""
+Компактное хранилище TTS-кусочков вместо тысяч файлов 00001.txt.
+
+В папке лежат два файла:
+  chunks.dat — тексты всех кусочков подряд в UTF-8;
+  chunks.idx — по строке на кусочек: "<id>\\t<смещение>\\t<длина в байтах>",
+               последняя строка "#\\t<размер chunks.dat>\\t<crc32 chunks.dat>".
+
+Данные читаются через mmap, любой кусочек достаётся по id без чтения остальных.
+Старая раскладка (папка с .txt) поддерживается для чтения и как формат экспорта:
+
+    python -m scripts.chunk_store export out/speechkit_chunks out/speechkit_txt
+    python -m scripts.chunk_store pack out/speechkit_chunks
+"""
+
+from __future__ import annotations
+
+import argparse
+import mmap
+import os
+import re
+import sys
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+DATA_NAME = "chunks.dat"
+INDEX_NAME = "chunks.idx"
+
+
+def natural_key(s: str):
+    """Ключ для «человеческой» сортировки имен файлов: 00001.txt < 00010.txt < 000100.txt."""
+    return [int(t) if t.isdigit() else t.lower() for t in re.split(r"(\d+)", s)]
+
+
+def is_store(path: Path) -> bool:
+    return (path / INDEX_NAME).is_file() and (path / DATA_NAME).is_file()
+
+
+class ChunkStoreWriter:
+    """
+    Пишет кусочки последовательно. Файлы собираются во временных копиях и
+    подменяются при close() по одному: сначала данные, потом индекс. Между
+    двумя os.replace (или после падения посередине) в папке лежат новые
+    данные со старым индексом — такую пару ChunkStore опознаёт по размеру и
+    crc32 данных в последней строке индекса и отказывается читать.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._data_tmp = self.root / f"{DATA_NAME}.tmp"
+        self._index_tmp = self.root / f"{INDEX_NAME}.tmp"
+        self._data = self._data_tmp.open("wb")
+        self._index = self._index_tmp.open("w", encoding="utf-8")
+        self._offset = 0
+        self._crc = 0
+        self.count = 0
+
+    def add(self, chunk_id: str, text: str) -> None:
+        if "\t" in chunk_id or "\n" in chunk_id or chunk_id == "#":
+            raise ValueError(f"Недопустимый id кусочка: {chunk_id!r}")
+        raw = text.encode("utf-8")
+        self._data.write(raw)
+        self._crc = zlib.crc32(raw, self._crc)
+        self._index.write(f"{chunk_id}\t{self._offset}\t{len(raw)}\n")
+        self._offset += len(raw)
+        self.count += 1
+
+    def close(self) -> None:
+        self._index.write(f"#\t{self._offset}\t{self._crc:08x}\n")
+        self._data.close()
+        self._index.close()
+        os.replace(self._data_tmp, self.root / DATA_NAME)
+        os.replace(self._index_tmp, self.root / INDEX_NAME)
+
+    def abort(self) -> None:
+        """Бросает недописанное хранилище; прежнее (если было) остаётся нетронутым."""
+        self._data.close()
+        self._index.close()
+        self._data_tmp.unlink(missing_ok=True)
+        self._index_tmp.unlink(missing_ok=True)
+
+    def __enter__(self) -> "ChunkStoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ChunkStore:
+    """
+    Чтение хранилища: len(), итерация по (id, text), доступ store[id].
+    Если chunks.dat не совпадает с размером и crc32 из индекса (хранилище
+    как раз подменяется или запись оборвалась между файлами), — ValueError.
+    Индекс без контрольной строки (записанный до её появления) не проверяется.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._ids: List[str] = []
+        self._pos: Dict[str, Tuple[int, int]] = {}
+        check: Optional[Tuple[int, int]] = None
+        with (self.root / INDEX_NAME).open("r", encoding="utf-8") as f:
+            for line in f:
+                chunk_id, offset, length = line.rstrip("\n").split("\t")
+                if chunk_id == "#":
+                    check = (int(offset), int(length, 16))
+                    continue
+                self._ids.append(chunk_id)
+                self._pos[chunk_id] = (int(offset), int(length))
+        self._file = (self.root / DATA_NAME).open("rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap нулевой длины не создаётся — пустое хранилище читаем без него
+        self._mm: Optional[mmap.mmap] = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        if check is not None and check != (size, zlib.crc32(self._mm) if self._mm is not None else 0):
+            self.close()
+            raise ValueError(
+                f"{self.root / INDEX_NAME} не соответствует {self.root / DATA_NAME}: "
+                "хранилище сейчас перезаписывается или запись оборвалась — повторите чтение или пересоберите кусочки"
+            )
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def ids(self) -> List[str]:
+        return list(self._ids)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._pos
+
+    def __getitem__(self, chunk_id: str) -> str:
+        offset, length = self._pos[chunk_id]
+        if not length:
+            return ""
+        return self._mm[offset:offset + length].decode("utf-8")
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for chunk_id in self._ids:
+            yield chunk_id, self[chunk_id]
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self) -> "ChunkStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_txt_dir(in_dir: Path) -> Iterator[Tuple[str, str]]:
+    """Старая раскладка: .txt файлы в «человеческом» порядке имён."""
+    files = sorted((p for p in in_dir.glob("*.txt") if p.is_file()), key=lambda p: natural_key(p.name))
+    for p in files:
+        yield p.stem, p.read_text(encoding="utf-8").strip()
+
+
+def iter_chunks(in_dir: Path) -> Iterator[Tuple[str, str]]:
+    """(id, text) из папки с кусочками — хранилища, если оно есть, иначе .txt файлов."""
+    if is_store(in_dir):
+        with ChunkStore(in_dir) as store:
+            yield from store
+    else:
+        yield from iter_txt_dir(in_dir)
+
+
+def write_txt_dir(chunks: Iterable[Tuple[str, str]], out_dir: Path) -> int:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n = 0
+    for chunk_id, text in chunks:
+        (out_dir / f"{chunk_id}.txt").write_text(text, encoding="utf-8")
+        n += 1
+    return n
+
+
+def write_chunks(chunks: Iterable[Tuple[str, str]], out_dir: Path, fmt: str = "store") -> int:
+    """
+    Сохраняет кусочки в out_dir: fmt = "store" (chunks.dat + chunks.idx),
+    "txt" (файл на кусочек) или "both". Возвращает число кусочков.
+    """
+    if fmt not in ("store", "txt", "both"):
+        raise ValueError(f"Неизвестный формат кусочков: {fmt}")
+    if fmt == "txt":
+        # иначе читатели продолжат брать старое хранилище вместо новых .txt
+        (out_dir / INDEX_NAME).unlink(missing_ok=True)
+        (out_dir / DATA_NAME).unlink(missing_ok=True)
+        return write_txt_dir(chunks, out_dir)
+    with ChunkStoreWriter(out_dir) as w:
+        for chunk_id, text in chunks:
+            w.add(chunk_id, text)
+            if fmt == "both":
+                (out_dir / f"{chunk_id}.txt").write_text(text, encoding="utf-8")
+    return w.count
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Хранилище TTS-кусочков: упаковка и экспорт в .txt")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    pack = sub.add_parser("pack", help="Упаковать папку .txt кусочков в chunks.dat + chunks.idx")
+    pack.add_argument("dir", type=Path)
+    pack.add_argument("--remove-txt", action="store_true", help="Удалить .txt после упаковки.")
+
+    export = sub.add_parser("export", help="Выгрузить хранилище в папку с файлами <id>.txt")
+    export.add_argument("store", type=Path)
+    export.add_argument("out_dir", type=Path)
+
+    args = p.parse_args(argv)
+
+    if args.cmd == "pack":
+        txt_files = [p for p in args.dir.glob("*.txt") if p.is_file()]
+        n = write_chunks(iter_txt_dir(args.dir), args.dir, fmt="store")
+        if args.remove_txt:
+            for f in txt_files:
+                f.unlink()
+        print(f"OK: {n} кусочков → {args.dir / DATA_NAME}")
+    else:
+        if not is_store(args.store):
+            print(f"[FATAL] В {args.store} нет {INDEX_NAME}/{DATA_NAME}", file=sys.stderr)
+            return 1
+        n = write_txt_dir(iter_chunks(args.store), args.out_dir)
+        print(f"OK: {n} файлов → {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
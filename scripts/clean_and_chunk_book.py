@@ -1,12 +1,24 @@
 # scripts/clean_and_chunk_book.py
 
+from __future__ import annotations
+
+import argparse
 import os
 import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Deque, Iterable, Iterator, List, Optional, Tuple
 
 from project_config import settings
-from scripts import utils
+from scripts import metrics, plan, realign, utils
+from scripts.book_source import iter_book_text
+from scripts.clean_journal import CleanJournal
+from scripts.metrics import RUN
 
 # === Промпт для очистки ===
 CLEAN_PROMPT = """Ты — чистильщик текста для подготовки к озвучке.
@@ -30,14 +42,60 @@ CLEAN_PROMPT = """Ты — чистильщик текста для подгот
 """
 
 
-from openai import OpenAI, BadRequestError
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+_client: Optional[OpenAI] = None
+_client_lock = threading.Lock()
+
+
+def _openai():
+    """
+    Модуль openai. Импортируется при первом запросе к LLM: сам импорт длится
+    почти секунду, а --plan, режим local и нарезке он не нужен.
+    """
+    import openai
+
+    return openai
 
-def openai_clean_chunk(chunk_text: str) -> str:
+
+def retryable_errors() -> Tuple[type, ...]:
+    """Ошибки, после которых имеет смысл повторить запрос."""
+    openai = _openai()
+    return (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def get_client() -> OpenAI:
+    """
+    Один клиент на процесс: он потокобезопасен и держит пул соединений,
+    так что воркеры очистки не открывают новое соединение на каждый чанк.
+    """
+    global _client
     if not settings.OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY не задан (см. .env)")
+    with _client_lock:
+        if _client is None:
+            # ретраи делаем сами (с бэкоффом и логом), встроенные выключаем
+            _client = _openai().OpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                max_retries=0,
+            )
+        return _client
+
 
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
+def _retry_delay(err: Exception, attempt: int) -> float:
+    """Retry-After от сервера, если он есть, иначе экспоненциальный бэкофф с джиттером."""
+    response = getattr(err, "response", None)
+    if response is not None:
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return min(2 ** attempt, 60) * (0.5 + random.random() / 2)
 
+
+def _clean_once(client: OpenAI, chunk_text: str) -> str:
     try:
         # Без temperature — у некоторых моделей допустимо только дефолтное значение
         resp = client.chat.completions.create(
@@ -48,7 +106,7 @@ def openai_clean_chunk(chunk_text: str) -> str:
             ],
         )
         return resp.choices[0].message.content.strip()
-    except BadRequestError:
+    except _openai().BadRequestError:
         # Фолбэк на Responses API
         r = client.responses.create(
             model=settings.OPENAI_MODEL,
@@ -56,63 +114,206 @@ def openai_clean_chunk(chunk_text: str) -> str:
             instructions=CLEAN_PROMPT,
         )
         return r.output_text.strip()
-    if not settings.OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY не задан (см. .env)")
 
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
-    resp = client.chat.completions.create(
-        model=settings.OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": CLEAN_PROMPT},
-            {"role": "user", "content": chunk_text},
-        ],
-    )
-    return resp.choices[0].message.content.strip()
+
+def openai_clean_chunk(chunk_text: str, client: Optional[OpenAI] = None, retries: int = 6) -> str:
+    client = client or get_client()
+    with RUN.timer("clean", chars=len(chunk_text)) as ev:
+        for attempt in range(retries):
+            ev["retries"] = attempt
+            try:
+                cleaned = _clean_once(client, chunk_text)
+                ev["chars_out"] = len(cleaned)
+                return cleaned
+            except retryable_errors() as e:
+                if attempt == retries - 1:
+                    raise
+                wait = _retry_delay(e, attempt)
+                print(f"[WARN] {type(e).__name__}, retry {attempt + 1}/{retries - 1} через {wait:.1f}s", file=sys.stderr)
+                time.sleep(wait)
+    raise RuntimeError("Не удалось очистить чанк после ретраев.")
+
+
+def iter_clean_chunks(
+    chunks: Iterable[Tuple[int, str]],
+    workers: int,
+    journal: Optional[CleanJournal] = None,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Чистит пары (номер, чанк) в `workers` потоков и отдаёт (номер, текст) строго
+    во входном порядке. В полёте не больше 2 * workers чанков: если ранний чанк
+    тормозит, более поздние не копятся в памяти без ограничений.
+
+    Если передан journal, результат пишется в него сразу в рабочем потоке —
+    до того, как до чанка дойдёт очередь на выдачу.
+    """
+    client = get_client()
+    workers = max(1, workers)
+
+    def work(idx: int, raw: str) -> str:
+        cleaned = openai_clean_chunk(raw, client)
+        if journal is not None:
+            journal.put(idx, raw, cleaned)
+        return cleaned
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        window: Deque[Tuple[int, Future]] = deque()
+        for idx, ch in chunks:
+            window.append((idx, pool.submit(work, idx, ch)))
+            if len(window) >= workers * 2:
+                i, fut = window.popleft()
+                yield i, fut.result()
+        while window:
+            i, fut = window.popleft()
+            yield i, fut.result()
 
 
 def save_text(path: Path, text: str):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(text, encoding="utf-8")
+    with RUN.timer("write_text", chars=len(text)):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
 
 
-def save_chunks(chunks: List[str], out_dir: Path):
-    out_dir.mkdir(parents=True, exist_ok=True)
-    for idx, piece in enumerate(chunks, 1):
-        fname = out_dir / f"{idx:05d}.txt"
-        fname.write_text(piece, encoding="utf-8")
+def save_chunks(
+    chunks: List[str],
+    out_dir: Path,
+    fmt: str = settings.CHUNK_FORMAT,
+    audio_dir: Optional[Path] = None,
+    ext: Optional[str] = None,
+):
+    """
+    Пишет кусочки 00001, 00002, ... С audio_dir готовое аудио переносится
+    под новую нумерацию (scripts.realign), и после правки текста в синтез
+    уходят только изменившиеся кусочки.
+    """
+    with RUN.timer("write_chunks", chunks=len(chunks)):
+        realigner = realign.rewrite_chunks(chunks, out_dir, fmt, audio_dir, ext)
+    if realigner is not None:
+        print(realigner.report())
+
+
+def read_book_chunks(
+    path: Path,
+    mode: str = settings.CLEAN_MODE,
+    stats: bool = True,
+) -> Tuple[List[str], Optional[utils.PreCleaner]]:
+    """
+    Читает книгу (TXT или PDF) блоками и режет на чанки по MAX_CONTENT_TOKENS.
+    Во всех режимах, кроме raw, текст до нарезки проходит детерминированную
+    предочистку; её счётчики возвращаются для отчёта (stats=False — без подсчёта токенов).
+    """
+    blocks = iter_book_text(path)
+    pre = None
+    if mode != "raw":
+        pre = utils.PreCleaner(with_tokens=stats)
+        blocks = pre.feed(blocks)
+    return list(utils.iter_chunks_by_tokens(blocks, settings.MAX_CONTENT_TOKENS)), pre
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Очистка книги через LLM и нарезка на кусочки для TTS.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.CLEAN_WORKERS,
+        help=f"Сколько чанков чистить параллельно (по умолчанию: {settings.CLEAN_WORKERS})",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=settings.CLEAN_MODES,
+        default=settings.CLEAN_MODE,
+        help="llm — правила + LLM, local — только правила без LLM, raw — только LLM (по умолчанию: CLEAN_MODE из .env)",
+    )
+    metrics.add_arguments(parser)
+    plan.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.plan:
+        return run_plan(args)
+    metrics.start(args)
+    try:
+        return run(args)
+    finally:
+        metrics.finish(args)
 
 
-def main():
+def run_plan(args: argparse.Namespace) -> int:
+    """
+    --plan: нарезка и оценка без запросов к LLM и без записи на диск.
+    Синтез оценивается с параметрами tts_speechkit_v3 по умолчанию;
+    с другими голосом/скоростью/--rps — python -m scripts.pipeline --plan.
+    """
+    started = time.perf_counter()
+    input_path = Path(settings.BOOK_PATH)
+    out_dir = Path(settings.OUT_DIR)
+    try:
+        chunks, _ = read_book_chunks(input_path, args.mode, stats=False)
+    except Exception as e:
+        print(f"[FATAL] Не удалось прочитать {input_path}: {e}", file=sys.stderr)
+        return 1
+    journal = None if args.mode == "local" else CleanJournal(out_dir / "clean_journal.jsonl", CLEAN_PROMPT, settings.OPENAI_MODEL)
+    return plan.run(args, chunks, journal, CLEAN_PROMPT, out_dir / "audio", args.workers, plan.TtsParams(), started)
+
+
+def run(args: argparse.Namespace) -> int:
+    started = time.perf_counter()
+
     input_path = Path(settings.BOOK_PATH)
     out_dir = Path(settings.OUT_DIR)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    raw = input_path.read_text(encoding="utf-8")
-    text = utils.soft_normalize(raw)
+    # Книга (TXT или PDF) читается блоками и сразу режется на чанки для LLM
+    try:
+        chunks, pre = read_book_chunks(input_path, args.mode)
+    except Exception as e:
+        print(f"[FATAL] Не удалось прочитать {input_path}: {e}", file=sys.stderr)
+        return 1
+    print(f"Исходный текст: {sum(map(len, chunks)):,} символов")
+    if pre is not None:
+        print(pre.report())
 
-    # Разбиваем на чанки для LLM
-    chunks = utils.chunk_by_tokens(text, settings.MAX_CONTENT_TOKENS)
-    print(f"Исходный текст: {len(text):,} символов")
-    print(f"Чанков для очистки: {len(chunks)}")
+    if args.mode == "local":
+        print("Режим local: LLM не вызывается")
+        cleaned_chunks: List[Optional[str]] = list(chunks)
+        todo: List[Tuple[int, str]] = []
+        journal = None
+    else:
+        print(f"Чанков для очистки: {len(chunks)}")
+        journal = CleanJournal(out_dir / "clean_journal.jsonl", CLEAN_PROMPT, settings.OPENAI_MODEL)
+        cleaned_chunks = [journal.get(i, ch) for i, ch in enumerate(chunks, 1)]
+        todo = [(i, ch) for i, ch in enumerate(chunks, 1) if cleaned_chunks[i - 1] is None]
+        if len(todo) < len(chunks):
+            print(f"Из журнала: {len(chunks) - len(todo)} чанков, к очистке: {len(todo)}")
 
-    cleaned_chunks = []
-    for i, ch in enumerate(chunks, 1):
-        tokens = utils.count_tokens(ch)
-        print(f"[{i}/{len(chunks)}] → {tokens:,} токенов, {len(ch):,} символов")
-        cleaned = openai_clean_chunk(ch)
-        cleaned_chunks.append(cleaned)
+    llm_started = time.perf_counter()
+    try:
+        for i, cleaned in iter_clean_chunks(todo, args.workers, journal=journal) if todo else ():
+            ch = chunks[i - 1]
+            tokens = utils.count_tokens(ch)
+            print(f"[{i}/{len(chunks)}] → {tokens:,} токенов, {len(ch):,} символов")
+            cleaned_chunks[i - 1] = cleaned
+    except Exception as e:
+        print(f"[FATAL] {e}", file=sys.stderr)
+        print(f"Готовые чанки сохранены в {journal.path}; повторный запуск продолжит с недостающих.", file=sys.stderr)
+        return 1
+    llm_seconds = time.perf_counter() - llm_started
 
+    if journal is not None:
+        journal.compact(len(chunks))
     cleaned_full = "\n\n".join(cleaned_chunks).strip()
     cleaned_path = out_dir / "cleaned_full.txt"
     save_text(cleaned_path, cleaned_full)
     print(f"Готово: {cleaned_path} ({len(cleaned_full):,} символов)")
 
     # Разбиваем для TTS
-    tts_chunks = utils.split_for_tts(cleaned_full, settings.SPEECHKIT_CHUNK_SIZE)
+    tts_chunks = utils.split_for_tts(cleaned_full, settings.SPEECHKIT_CHUNK_SIZE, settings.SPEECHKIT_CHUNK_TARGET)
     tts_dir = out_dir / "speechkit_chunks"
-    save_chunks(tts_chunks, tts_dir)
+    save_chunks(tts_chunks, tts_dir, audio_dir=out_dir / "audio")
     print(f"TTS-кусочки: {len(tts_chunks)} шт. → {tts_dir}")
+    pre_seconds = f"предочистка {pre.seconds:.1f} s, " if pre is not None else ""
+    print(f"Время: {pre_seconds}LLM {llm_seconds:.1f} s, всего {time.perf_counter() - started:.1f} s")
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
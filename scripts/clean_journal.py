@@ -0,0 +1,73 @@
+# scripts/clean_journal.py
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from scripts.metrics import RUN
+
+
+class CleanJournal:
+    """
+    Журнал очищенных чанков: одна JSON-строка на чанк
+    {"idx": 12, "hash": "...", "text": "..."}.
+
+    Хэш считается от сырого чанка + промпта + модели, так что при смене
+    любого из них чанк считается изменённым и чистится заново. Строки
+    дописываются сразу после ответа LLM, поэтому падение на чанке 47 из 60
+    не теряет уже оплаченные 46.
+    """
+
+    def __init__(self, path: Path, prompt: str, model: str):
+        self.path = Path(path)
+        self._salt = f"{model}\0{prompt}\0".encode("utf-8")
+        self._entries: Dict[int, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # недописанная строка после аварийного завершения
+                self._entries[int(rec["idx"])] = (rec["hash"], rec["text"])
+
+    def key(self, raw: str) -> str:
+        return hashlib.sha256(self._salt + raw.encode("utf-8")).hexdigest()
+
+    def get(self, idx: int, raw: str) -> Optional[str]:
+        """Очищенный текст чанка, если он есть в журнале и сырой текст не менялся."""
+        entry = self._entries.get(idx)
+        if entry and entry[0] == self.key(raw):
+            return entry[1]
+        return None
+
+    def put(self, idx: int, raw: str, cleaned: str) -> None:
+        rec = {"idx": idx, "hash": self.key(raw), "text": cleaned}
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock, RUN.timer("journal", chars=len(cleaned)):
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries[idx] = (rec["hash"], cleaned)
+
+    def compact(self, count: int) -> None:
+        """Переписывает журнал, оставляя только записи для чанков 1..count."""
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with self._lock:
+            with tmp.open("w", encoding="utf-8") as f:
+                for idx in sorted(i for i in self._entries if 1 <= i <= count):
+                    h, text = self._entries[idx]
+                    f.write(json.dumps({"idx": idx, "hash": h, "text": text}, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.path)
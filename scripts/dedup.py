@@ -0,0 +1,95 @@
+# scripts/dedup.py
+
+"""
+Дедупликация кусочков перед синтезом.
+
+Одинаковые (после нормализации пробелов и Unicode) тексты синтезируются один
+раз. Остальные копии получают аудио жёсткой ссылкой или копией файла, либо
+только записью в манифесте out/audio/dedup_manifest.json ({"00042": "00007", ...}),
+который понимает сборка книги.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+MANIFEST_NAME = "dedup_manifest.json"
+
+
+def normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class DedupPlan(NamedTuple):
+    unique: List[Tuple[str, str]]   # (id, text), которые реально нужно синтезировать
+    aliases: Dict[str, str]         # id дубликата → id первого вхождения
+    saved_chars: int
+
+
+def plan(chunks: Iterable[Tuple[str, str]]) -> DedupPlan:
+    first: Dict[str, str] = {}
+    unique: List[Tuple[str, str]] = []
+    aliases: Dict[str, str] = {}
+    saved = 0
+    for chunk_id, text in chunks:
+        key = normalize(text)
+        if key in first:
+            aliases[chunk_id] = first[key]
+            saved += len(text)
+        else:
+            first[key] = chunk_id
+            unique.append((chunk_id, text))
+    return DedupPlan(unique, aliases, saved)
+
+
+def load_manifest(audio_dir: Path) -> Dict[str, str]:
+    path = audio_dir / MANIFEST_NAME
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def write_manifest(audio_dir: Path, aliases: Dict[str, str], replace: bool = False) -> None:
+    """
+    Сливает новые соответствия с уже записанными (прогоны с --start/--limit
+    дополняют друг друга); replace=True — записывает только aliases.
+    """
+    merged = {} if replace else load_manifest(audio_dir)
+    merged.update(aliases)
+    # своё временное имя у каждого процесса и потока: общий .tmp одновременные писатели затирают друг другу
+    tmp = audio_dir / f"{MANIFEST_NAME}.{os.getpid()}.{threading.get_ident()}.tmp"
+    tmp.write_text(json.dumps(merged, ensure_ascii=False, indent=0, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, audio_dir / MANIFEST_NAME)
+
+
+def materialize(audio_dir: Path, ext: str, aliases: Dict[str, str]) -> Tuple[int, int]:
+    """
+    Создаёт файлы дубликатов из готового аудио первого вхождения: жёсткая ссылка,
+    а если ФС не умеет — копия. Возвращает (создано, пропущено из-за отсутствия оригинала).
+    """
+    made = missing = 0
+    for dup, canon in aliases.items():
+        target = audio_dir / f"{dup}{ext}"
+        source = audio_dir / f"{canon}{ext}"
+        if target.exists():
+            continue
+        if not source.exists():
+            missing += 1
+            continue
+        link_or_copy(source, target)
+        made += 1
+    return made, missing
+
+
+def link_or_copy(source: Path, target: Path) -> None:
+    """Жёсткая ссылка, а если ФС не умеет — копия файла."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
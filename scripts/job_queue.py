@@ -0,0 +1,488 @@
+# scripts/job_queue.py
+
+"""
+Очередь книг: много книг, один общий пул воркеров и один бюджет API.
+
+Книги и их работа хранятся в SQLite (по умолчанию out/jobs.sqlite3).
+Работа книги — это очистка каждого LLM-чанка (clean), одна нарезка
+очищенного текста на TTS-кусочки (split) и синтез каждого кусочка (tts).
+Один процесс `run` раздаёт эту работу общему пулу потоков:
+
+  * лимиты на API глобальные: не больше --clean-workers запросов к OpenAI и
+    --workers к SpeechKit одновременно, а --clean-rps / --rps — на все книги сразу;
+  * книги делят пул поровну: следующий слот получает книга, у которой сейчас
+    меньше всего работы в полёте, поэтому большая книга не задерживает маленькие;
+  * всё, что сделано, сразу записано в базу: после перезапуска прерванные
+    задачи возвращаются в очередь, а готовые не повторяются.
+
+    python -m scripts.job_queue add data/book1.pdf data/book2.txt
+    python -m scripts.job_queue run --clean-workers 4 --workers 8 --rps 10
+    python -m scripts.job_queue status
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from project_config import settings
+from scripts import dedup, metrics, utils
+from scripts.clean_and_chunk_book import (
+    CLEAN_PROMPT,
+    get_client,
+    openai_clean_chunk,
+    read_book_chunks,
+    save_chunks,
+    save_text,
+)
+from scripts.clean_journal import CleanJournal
+from scripts.ratelimit import TokenBucket
+from scripts.tts_speechkit_v3 import Synthesizer, add_synth_arguments, headers_from_args
+
+DEFAULT_DB = Path(settings.OUT_DIR) / "jobs.sqlite3"
+DEFAULT_MAX_ATTEMPTS = 3
+ETA_WINDOW_S = 600  # скорость для ETA — по последним 10 минутам работы книги
+
+KINDS = ("clean", "split", "tts")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL,
+    book_path   TEXT NOT NULL,
+    out_dir     TEXT NOT NULL UNIQUE,
+    mode        TEXT NOT NULL,
+    added_at    REAL NOT NULL,
+    aliases     TEXT,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS items (
+    book_id     INTEGER NOT NULL REFERENCES books(id),
+    kind        TEXT NOT NULL,
+    seq         INTEGER NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    chars       INTEGER NOT NULL DEFAULT 0,
+    text        TEXT,
+    result      TEXT,
+    error       TEXT,
+    started_at  REAL,
+    finished_at REAL,
+    PRIMARY KEY (book_id, kind, seq)
+);
+"""
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+# ---------- Добавление книг ----------
+
+def add_book(db: sqlite3.Connection, book: Path, out_dir: Path, mode: str, name: Optional[str] = None) -> int:
+    """
+    Читает и режет книгу на LLM-чанки сразу: границы чанков фиксируются в базе
+    и не поплывут между перезапусками. Чанки, уже очищенные прежним запуском
+    clean_and_chunk_book/pipeline в этой папке, берутся из их журнала.
+    """
+    chunks, _ = read_book_chunks(book, mode)
+    journal = None if mode == "local" else CleanJournal(out_dir / "clean_journal.jsonl", CLEAN_PROMPT, settings.OPENAI_MODEL)
+    now = time.time()
+    with db:
+        db.execute("BEGIN")
+        cur = db.execute(
+            "INSERT INTO books (name, book_path, out_dir, mode, added_at) VALUES (?, ?, ?, ?, ?)",
+            (name or book.stem, str(book), str(out_dir), mode, now),
+        )
+        book_id = cur.lastrowid
+        rows = []
+        for seq, raw in enumerate(chunks, 1):
+            cleaned = raw if journal is None else journal.get(seq, raw)
+            status = "pending" if cleaned is None else "done"
+            rows.append((book_id, "clean", seq, status, len(raw), raw, cleaned))
+        rows.append((book_id, "split", 0, "pending", 0, None, None))
+        db.executemany("INSERT INTO items (book_id, kind, seq, status, chars, text, result) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    return book_id
+
+
+# ---------- Планировщик ----------
+
+class _Book:
+    def __init__(self, book_id: int, name: str, out_dir: Path):
+        self.id = book_id
+        self.name = name
+        self.out_dir = out_dir
+        self.pending: Dict[str, Deque[int]] = {kind: deque() for kind in KINDS}
+        self.clean_left = 0     # очистка не done — нарезку начинать рано
+        self.running = 0
+        self.served = 0
+        self.failed = 0
+
+
+class Scheduler:
+    """
+    Раздаёт задачи потокам. Состояние очереди держится в памяти (выбор задачи —
+    O(число книг)), а каждое изменение статуса сразу пишется в базу.
+    """
+
+    def __init__(self, db: sqlite3.Connection, limits: Dict[str, int], max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.db = db
+        self.limits = limits
+        self.max_attempts = max_attempts
+        self.running: Dict[str, int] = dict.fromkeys(KINDS, 0)
+        self.books: Dict[int, _Book] = {}
+        self._cond = threading.Condition()
+        self.reload()
+
+    def reload(self) -> int:
+        """Подхватывает книги, добавленные после старта. Возвращает число новых."""
+        with self._cond:
+            if not self.books:
+                # прошлый run оборвался посреди задач — возвращаем их в очередь
+                self.db.execute("UPDATE items SET status = 'pending' WHERE status = 'running'")
+            rows = self.db.execute("SELECT id, name, out_dir FROM books WHERE finished_at IS NULL").fetchall()
+            new = [(i, n, o) for i, n, o in rows if i not in self.books]
+            for book_id, name, out_dir in new:
+                book = _Book(book_id, name, Path(out_dir))
+                for kind, seq, status in self.db.execute(
+                    "SELECT kind, seq, status FROM items WHERE book_id = ? ORDER BY kind, seq", (book_id,)
+                ):
+                    if status == "pending":
+                        book.pending[kind].append(seq)
+                    elif status == "failed":
+                        book.failed += 1
+                    if kind == "clean" and status != "done":
+                        book.clean_left += 1
+                self.books[book_id] = book
+            if new:
+                self._cond.notify_all()
+            return len(new)
+
+    def _claimable(self, book: _Book) -> List[str]:
+        kinds = []
+        for kind in KINDS:
+            if not book.pending[kind] or self.running[kind] >= self.limits[kind]:
+                continue
+            if kind == "split" and book.clean_left:
+                continue
+            kinds.append(kind)
+        return kinds
+
+    def claim(self, idle_timeout: float = 1.0) -> Optional[Tuple[_Book, str, int]]:
+        """
+        Следующая задача: среди книг, у которых есть что взять в рамках лимитов API,
+        выбирается та, у которой меньше всего задач в полёте (потом — реже обслуженная).
+        None — работы нет и не появится: всё в полёте уже завершилось.
+        """
+        with self._cond:
+            while True:
+                best = None
+                for book in self.books.values():
+                    kinds = self._claimable(book)
+                    if kinds and (best is None or (book.running, book.served) < (best[0].running, best[0].served)):
+                        best = (book, kinds[0])
+                if best is not None:
+                    book, kind = best
+                    seq = book.pending[kind].popleft()
+                    book.running += 1
+                    book.served += 1
+                    self.running[kind] += 1
+                    self.db.execute(
+                        "UPDATE items SET status = 'running', started_at = ?, attempts = attempts + 1 WHERE book_id = ? AND kind = ? AND seq = ?",
+                        (time.time(), book.id, kind, seq),
+                    )
+                    return book, kind, seq
+                if not any(self.running.values()):
+                    return None
+                self._cond.wait(idle_timeout)
+
+    def query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        """Соединение одно на все потоки, поэтому любой запрос — под замком."""
+        with self._cond:
+            return self.db.execute(sql, params).fetchall()
+
+    def text(self, book: _Book, kind: str, seq: int) -> str:
+        return self.query("SELECT text FROM items WHERE book_id = ? AND kind = ? AND seq = ?", (book.id, kind, seq))[0][0]
+
+    def complete(self, book: _Book, kind: str, seq: int, result: Optional[str] = None, error: Optional[BaseException] = None) -> bool:
+        """Записывает итог задачи. Ошибка с попытками в запасе — обратно в конец очереди. True — можно финализировать книгу."""
+        with self._cond:
+            book.running -= 1
+            self.running[kind] -= 1
+            now = time.time()
+            if error is None:
+                self.db.execute(
+                    "UPDATE items SET status = 'done', result = ?, error = NULL, finished_at = ? WHERE book_id = ? AND kind = ? AND seq = ?",
+                    (result, now, book.id, kind, seq),
+                )
+                if kind == "clean":
+                    book.clean_left -= 1
+            else:
+                attempts = self.db.execute(
+                    "SELECT attempts FROM items WHERE book_id = ? AND kind = ? AND seq = ?", (book.id, kind, seq)
+                ).fetchone()[0]
+                retry = attempts < self.max_attempts
+                self.db.execute(
+                    "UPDATE items SET status = ?, error = ?, finished_at = ? WHERE book_id = ? AND kind = ? AND seq = ?",
+                    ("pending" if retry else "failed", f"{type(error).__name__}: {error}"[:500], now, book.id, kind, seq),
+                )
+                if retry:
+                    book.pending[kind].append(seq)
+                else:
+                    book.failed += 1
+            self._cond.notify_all()
+            return book.running == 0 and book.failed == 0 and not any(book.pending.values())
+
+    def add_tts(self, book: _Book, pieces: List[Tuple[int, str, bool]]) -> None:
+        """Задачи синтеза после нарезки: (номер, текст, аудио уже есть)."""
+        with self._cond:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO items (book_id, kind, seq, status, chars, text) VALUES (?, 'tts', ?, ?, ?, ?)",
+                [(book.id, seq, "done" if ready else "pending", len(text), text) for seq, text, ready in pieces],
+            )
+            book.pending["tts"].extend(seq for seq, _, ready in pieces if not ready)
+            self._cond.notify_all()
+
+    def finish(self, book: _Book) -> None:
+        with self._cond:
+            self.db.execute("UPDATE books SET finished_at = ? WHERE id = ?", (time.time(), book.id))
+            self.books.pop(book.id, None)
+
+
+# ---------- Выполнение задач ----------
+
+class Worker:
+    """То, что пул делает с задачей каждого вида. Клиенты и лимитеры общие для всех книг."""
+
+    def __init__(self, sched: Scheduler, synth: Synthesizer, clean_limiter: Optional[TokenBucket], dedup_mode: str):
+        self.sched = sched
+        self.synth = synth
+        self.clean_limiter = clean_limiter
+        self.dedup_mode = dedup_mode
+        self._client = None
+
+    def run(self) -> None:
+        while (task := self.sched.claim()) is not None:
+            book, kind, seq = task
+            try:
+                result = getattr(self, f"do_{kind}")(book, seq)
+            except Exception as e:
+                print(f"[{book.name}] {kind} {seq} FAIL: {e}", file=sys.stderr)
+                finished = self.sched.complete(book, kind, seq, error=e)
+            else:
+                finished = self.sched.complete(book, kind, seq, result=result)
+            if finished:
+                self.finalize(book)
+
+    def do_clean(self, book: _Book, seq: int) -> str:
+        if self._client is None:
+            self._client = get_client()
+        if self.clean_limiter is not None:
+            self.clean_limiter.acquire()
+        return openai_clean_chunk(self.sched.text(book, "clean", seq), self._client)
+
+    def do_split(self, book: _Book, seq: int) -> None:
+        cleaned = [r for (r,) in self.sched.query("SELECT result FROM items WHERE book_id = ? AND kind = 'clean' ORDER BY seq", (book.id,))]
+        full = "\n\n".join(cleaned).strip()
+        save_text(book.out_dir / "cleaned_full.txt", full)
+        pieces = utils.split_for_tts(full, settings.SPEECHKIT_CHUNK_SIZE, settings.SPEECHKIT_CHUNK_TARGET)
+        audio_dir = book.out_dir / "audio"
+        # аудио прошлой нарезки переезжает под новую нумерацию до проверки «файл уже есть»
+        save_chunks(pieces, book.out_dir / "speechkit_chunks", audio_dir=audio_dir, ext=self.synth.ext)
+
+        numbered = [(f"{i:05d}", piece) for i, piece in enumerate(pieces, 1)]
+        aliases: Dict[str, str] = {}
+        if self.dedup_mode != "off":
+            plan = dedup.plan(numbered)
+            numbered, aliases = plan.unique, plan.aliases
+        self.sched.query("UPDATE books SET aliases = ? WHERE id = ?", (json.dumps(aliases), book.id))
+        audio_dir.mkdir(parents=True, exist_ok=True)
+        self.sched.add_tts(book, [(int(stem), text, (audio_dir / f"{stem}{self.synth.ext}").exists()) for stem, text in numbered])
+        print(f"[{book.name}] нарезка: {len(pieces)} кусочков, к синтезу {len(book.pending['tts'])}")
+        return None
+
+    def do_tts(self, book: _Book, seq: int) -> None:
+        self.synth.synth_to_file(self.sched.text(book, "tts", seq).strip(), book.out_dir / "audio" / f"{seq:05d}{self.synth.ext}")
+        return None
+
+    def finalize(self, book: _Book) -> None:
+        ((raw,),) = self.sched.query("SELECT aliases FROM books WHERE id = ?", (book.id,))
+        aliases = json.loads(raw or "{}")
+        audio_dir = book.out_dir / "audio"
+        if aliases:
+            dedup.write_manifest(audio_dir, aliases)
+            if self.dedup_mode == "link":
+                dedup.materialize(audio_dir, self.synth.ext, aliases)
+        self.sched.finish(book)
+        print(f"[{book.name}] готово → {audio_dir}")
+
+
+# ---------- Прогресс ----------
+
+def book_status(db: sqlite3.Connection, now: Optional[float] = None) -> List[Dict[str, object]]:
+    """Прогресс и ETA по книгам. ETA — по скорости каждой стадии книги за последние ETA_WINDOW_S секунд."""
+    now = now or time.time()
+    out = []
+    for book_id, name, out_dir, finished_at in db.execute("SELECT id, name, out_dir, finished_at FROM books ORDER BY id").fetchall():
+        stages: Dict[str, Dict[str, int]] = {}
+        for kind, status, n in db.execute("SELECT kind, status, COUNT(*) FROM items WHERE book_id = ? GROUP BY kind, status", (book_id,)):
+            stages.setdefault(kind, dict.fromkeys(("pending", "running", "done", "failed"), 0))[status] = n
+        eta = 0.0
+        for kind in ("clean", "tts"):
+            counts = stages.get(kind)
+            left = (counts["pending"] + counts["running"]) if counts else 0
+            if not left:
+                continue
+            (first, recent) = db.execute(
+                "SELECT MIN(started_at), COUNT(*) FROM items WHERE book_id = ? AND kind = ? AND status = 'done' AND finished_at >= ?",
+                (book_id, kind, now - ETA_WINDOW_S),
+            ).fetchone()
+            if not recent:
+                eta = None
+                break
+            rate = recent / max(1.0, now - first)
+            eta += left / rate
+        if "tts" not in stages and finished_at is None:
+            eta = None  # число кусочков станет известно только после нарезки
+        out.append({"id": book_id, "name": name, "out_dir": out_dir, "stages": stages, "finished": finished_at is not None, "eta_s": eta})
+    return out
+
+
+def _fmt_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    minutes = int(seconds // 60)
+    return f"{minutes // 60}ч {minutes % 60:02d}м" if minutes >= 60 else f"{minutes}м {int(seconds % 60):02d}с"
+
+
+def print_status(db: sqlite3.Connection) -> None:
+    for b in book_status(db):
+        parts = []
+        for kind in KINDS:
+            c = b["stages"].get(kind)
+            if c:
+                total = sum(c.values())
+                part = f"{kind} {c['done']}/{total}"
+                if c["failed"]:
+                    part += f" ({c['failed']} FAIL)"
+                parts.append(part)
+        state = "готово" if b["finished"] else f"ETA {_fmt_eta(b['eta_s'])}"
+        print(f"#{b['id']} {b['name']}: {', '.join(parts)} — {state}")
+
+
+# ---------- CLI ----------
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Очередь книг с общим пулом воркеров и общими лимитами API")
+    p.add_argument("--db", type=Path, default=DEFAULT_DB, help=f"База очереди (по умолчанию: {DEFAULT_DB})")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    add = sub.add_parser("add", help="Поставить книги в очередь")
+    add.add_argument("books", type=Path, nargs="+", help="TXT или PDF")
+    add.add_argument("--out", type=Path, default=None, help=f"Папка результата; для нескольких книг — родительская (по умолчанию: {settings.OUT_DIR}/<имя книги>)")
+    add.add_argument("--mode", choices=settings.CLEAN_MODES, default=settings.CLEAN_MODE, help="Режим очистки, как у clean_and_chunk_book")
+
+    run_p = sub.add_parser("run", help="Обработать очередь общим пулом")
+    run_p.add_argument("--clean-workers", type=int, default=settings.CLEAN_WORKERS, help=f"Запросов к OpenAI в полёте на все книги (по умолчанию: {settings.CLEAN_WORKERS})")
+    run_p.add_argument("--clean-rps", type=float, default=None, help="Лимит запросов к OpenAI в секунду на все книги (по умолчанию: без лимита)")
+    run_p.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help=f"Попыток на задачу, потом failed (по умолчанию: {DEFAULT_MAX_ATTEMPTS})")
+    run_p.add_argument("--follow", action="store_true", help="Не выходить, когда очередь пуста: ждать новых книг.")
+    add_synth_arguments(run_p)
+    metrics.add_arguments(run_p)
+
+    sub.add_parser("status", help="Прогресс и ETA по книгам")
+
+    retry = sub.add_parser("retry", help="Вернуть failed-задачи в очередь")
+    retry.add_argument("--book", type=int, default=None, help="Только эта книга (по умолчанию: все)")
+
+    args = p.parse_args(argv)
+    db = connect(args.db)
+
+    if args.cmd == "add":
+        for book in args.books:
+            if args.out is None:
+                out_dir = Path(settings.OUT_DIR) / book.stem
+            else:
+                out_dir = args.out / book.stem if len(args.books) > 1 else args.out
+            try:
+                book_id = add_book(db, book, out_dir, args.mode)
+            except sqlite3.IntegrityError:
+                print(f"[WARN] {out_dir} уже в очереди — пропускаю {book}", file=sys.stderr)
+                continue
+            except Exception as e:
+                print(f"[FATAL] Не удалось прочитать {book}: {e}", file=sys.stderr)
+                return 1
+            print(f"#{book_id} {book} → {out_dir}")
+        return 0
+
+    if args.cmd == "status":
+        print_status(db)
+        return 0
+
+    if args.cmd == "retry":
+        where, params = ("AND book_id = ?", (args.book,)) if args.book else ("", ())
+        n = db.execute(f"UPDATE items SET status = 'pending', attempts = 0 WHERE status = 'failed' {where}", params).rowcount
+        db.execute(f"UPDATE books SET finished_at = NULL WHERE id IN (SELECT book_id FROM items WHERE status = 'pending' {where})", params)
+        print(f"В очередь возвращено задач: {n}")
+        return 0
+
+    metrics.start(args)
+    try:
+        return run(args, db)
+    finally:
+        metrics.finish(args)
+
+
+def run(args: argparse.Namespace, db: sqlite3.Connection) -> int:
+    try:
+        headers = headers_from_args(args)
+    except Exception as e:
+        print(f"[FATAL] {e}", file=sys.stderr)
+        return 2
+
+    limits = {"clean": max(1, args.clean_workers), "split": 1, "tts": max(1, args.workers)}
+    sched = Scheduler(db, limits, args.max_attempts)
+    synth = Synthesizer.from_args(args, headers)
+    clean_limiter = TokenBucket(args.clean_rps, burst=limits["clean"]) if args.clean_rps else None
+    print(f"Книг в работе: {len(sched.books)}; OpenAI ≤ {limits['clean']} в полёте, SpeechKit ≤ {limits['tts']} в полёте")
+
+    try:
+        while True:
+            threads = [
+                threading.Thread(target=Worker(sched, synth, clean_limiter, args.dedup).run, name=f"job-{n}", daemon=True)
+                for n in range(sum(limits.values()))
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if sched.reload():
+                continue
+            if not args.follow:
+                break
+            time.sleep(5)
+    except KeyboardInterrupt:
+        print("Прервано: незаконченные задачи вернутся в очередь при следующем run.", file=sys.stderr)
+        return 130
+    finally:
+        synth.close()
+
+    print_status(db)
+    failed = db.execute("SELECT COUNT(*) FROM items WHERE status = 'failed'").fetchone()[0]
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
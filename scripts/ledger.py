@@ -0,0 +1,253 @@
+# scripts/ledger.py
+
+"""
+Шардирование синтеза и журнал статусов кусочков.
+
+Одну книгу (или очередь книг) можно озвучивать несколькими процессами или
+машинами: каждый берёт свою долю манифеста speechkit_chunks.jsonl по
+`--shard i/N`. Доля определяется хэшем id, поэтому не зависит от порядка
+строк, --start/--limit и от того, где запущен процесс, а доли не пересекаются.
+
+Каждый шард ведёт свой журнал out/audio/ledger/shard-<i>-of-<N>.jsonl:
+строка на попытку {"id", "status": done|failed, "attempts", "bytes", "t"}.
+Шаг merge сводит журналы всех шардов с манифестом и проверяет, что у каждого
+id есть аудио нужного размера:
+
+    python -m scripts.tts_speechkit_v3 --manifest out/speechkit_chunks.jsonl --shard 0/4
+    python -m scripts.ledger merge --manifest out/speechkit_chunks.jsonl --out-dir out/audio
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from scripts import dedup
+from scripts.assemble_audio import EXTENSIONS, detect_ext
+from scripts.prepare_jsonl import read_jsonl
+
+LEDGER_DIRNAME = "ledger"
+STATUSES = ("pending", "done", "failed")
+
+
+class Shard(NamedTuple):
+    index: int
+    count: int
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    def owns(self, chunk_id: str) -> bool:
+        return shard_of(chunk_id, self.count) == self.index
+
+
+ALL = Shard(0, 1)
+
+
+def parse_shard(value: str) -> Shard:
+    """'2/8' → Shard(2, 8); номера шардов с нуля. Для argparse type=."""
+    try:
+        index, count = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Ожидается i/N, например 0/4, а не {value!r}") from None
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Нужно 0 <= i < N: {value!r}")
+    return Shard(index, count)
+
+
+def shard_of(chunk_id: str, count: int) -> int:
+    """Стабильный между процессами и машинами номер шарда (hash() для строк солится на каждый запуск)."""
+    digest = hashlib.blake2b(chunk_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+class Entry(NamedTuple):
+    status: str
+    attempts: int
+    bytes: int
+    t: float
+    error: Optional[str] = None
+
+
+def _read(path: Path) -> Dict[str, Entry]:
+    entries: Dict[str, Entry] = {}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # недописанная строка после аварийного завершения
+            entries[rec["id"]] = Entry(rec["status"], rec["attempts"], rec.get("bytes", 0), rec.get("t", 0.0), rec.get("error"))
+    return entries
+
+
+def _dumps(chunk_id: str, entry: Entry) -> str:
+    rec = {"id": chunk_id, "status": entry.status, "attempts": entry.attempts, "bytes": entry.bytes, "t": round(entry.t, 3)}
+    if entry.error:
+        rec["error"] = entry.error
+    return json.dumps(rec, ensure_ascii=False) + "\n"
+
+
+class SynthLedger:
+    """
+    Журнал одного шарда. Строки дописываются и сбрасываются на диск сразу после
+    результата; последняя строка по id — актуальная. Истина о готовности —
+    сам аудиофайл (он пишется атомарно), журнал добавляет к нему попытки и ошибки.
+    """
+
+    def __init__(self, audio_dir: Path, shard: Shard = ALL):
+        self.path = Path(audio_dir) / LEDGER_DIRNAME / f"shard-{shard.index:03d}-of-{shard.count:03d}.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._entries = _read(self.path) if self.path.exists() else {}
+        self._lock = threading.Lock()
+        self._f = self.path.open("a", encoding="utf-8")
+
+    def get(self, chunk_id: str) -> Optional[Entry]:
+        return self._entries.get(chunk_id)
+
+    def _put(self, chunk_id: str, entry: Entry) -> None:
+        with self._lock:
+            self._f.write(_dumps(chunk_id, entry))
+            self._f.flush()
+            self._entries[chunk_id] = entry
+
+    def _attempts(self, chunk_id: str) -> int:
+        prev = self._entries.get(chunk_id)
+        return prev.attempts if prev else 0
+
+    def done(self, chunk_id: str, size: int, attempts: int = 1) -> None:
+        """attempts=0 — аудио уже было на диске (например, от прошлого запуска без журнала)."""
+        prev = self._entries.get(chunk_id)
+        if not attempts and prev is not None and prev.status == "done" and prev.bytes == size:
+            return
+        self._put(chunk_id, Entry("done", self._attempts(chunk_id) + attempts, size, time.time()))
+
+    def failed(self, chunk_id: str, error: BaseException, attempts: int = 1) -> None:
+        self._put(chunk_id, Entry("failed", self._attempts(chunk_id) + attempts, 0, time.time(), f"{type(error).__name__}: {error}"[:500]))
+
+    def close(self) -> None:
+        self._f.close()
+
+
+def load_all(audio_dir: Path) -> Dict[str, Entry]:
+    """
+    Сводит журналы всех шардов. Если id встречается в нескольких (книгу
+    перешардировали), побеждает done, а среди равных — более поздняя запись.
+    """
+    merged: Dict[str, Entry] = {}
+    for path in sorted((Path(audio_dir) / LEDGER_DIRNAME).glob("shard-*.jsonl")):
+        for chunk_id, entry in _read(path).items():
+            prev = merged.get(chunk_id)
+            if prev is None or (entry.status == "done", entry.t) > (prev.status == "done", prev.t):
+                merged[chunk_id] = entry
+    return merged
+
+
+def remap(audio_dir: Path, sources: Dict[str, str]) -> None:
+    """
+    После переноса аудио под новую нумерацию (scripts.realign) записи
+    переезжают вслед за файлами: sources — новый id → старый id, чьё аудио в
+    нём теперь. Остальные записи отбрасываются, журналы всех шардов сводятся
+    в один shard-000-of-001.jsonl.
+    """
+    ledger_dir = Path(audio_dir) / LEDGER_DIRNAME
+    if not ledger_dir.is_dir():
+        return
+    entries = load_all(audio_dir)
+    tmp = ledger_dir / "remap.tmp"
+    with tmp.open("w", encoding="utf-8") as f:
+        for new_id, old_id in sources.items():
+            entry = entries.get(old_id)
+            if entry is not None:
+                f.write(_dumps(new_id, entry))
+    for path in ledger_dir.glob("shard-*.jsonl"):
+        path.unlink()
+    os.replace(tmp, ledger_dir / f"shard-{ALL.index:03d}-of-{ALL.count:03d}.jsonl")
+
+
+class MergeReport(NamedTuple):
+    counts: Dict[str, int]                # pending/done/failed по всем id манифеста
+    problems: List[Tuple[str, str]]       # (id, что не так)
+    aliases: Dict[str, str]
+
+    @property
+    def complete(self) -> bool:
+        return self.counts["done"] == sum(self.counts.values())
+
+
+def merge(chunks: List[Tuple[str, str]], audio_dir: Path, ext: str, use_dedup: bool = True) -> MergeReport:
+    """
+    Проверяет каждый id манифеста: журнал говорит done, а файл на месте и
+    нужного размера. Дубликаты (тот же dedup.plan, что у шардов) готовы, если
+    готов их оригинал.
+    """
+    ledger = load_all(audio_dir)
+    aliases = dedup.plan(chunks).aliases if use_dedup else {}
+    counts = dict.fromkeys(STATUSES, 0)
+    problems: List[Tuple[str, str]] = []
+    for chunk_id, _ in chunks:
+        canon = aliases.get(chunk_id, chunk_id)
+        entry = ledger.get(canon)
+        audio = audio_dir / f"{canon}{ext}"
+        size = audio.stat().st_size if audio.exists() else None
+        if size is not None and (entry is None or entry.status != "done" or entry.bytes == size):
+            status = "done"
+        elif size is not None:
+            status = "failed"
+            problems.append((chunk_id, f"размер {size} байт, по журналу {entry.bytes}"))
+        elif entry is not None and entry.status == "done":
+            status = "failed"
+            problems.append((chunk_id, f"по журналу готов, но нет файла {audio.name}"))
+        elif entry is not None and entry.status == "failed":
+            status = "failed"
+            problems.append((chunk_id, f"{entry.attempts} попыток: {entry.error}"))
+        else:
+            status = "pending"
+        counts[status] += 1
+    return MergeReport(counts, problems, aliases)
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Сводка журналов синтеза всех шардов и проверка полноты книги")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("merge", help="Свести журналы шардов с манифестом; код возврата 0 — книга озвучена целиком")
+    m.add_argument("--manifest", type=Path, required=True, help="speechkit_chunks.jsonl, по которому шёл синтез")
+    m.add_argument("--out-dir", type=Path, default=Path("./out/audio"), help="Папка с аудио и ledger/ (по умолчанию: ./out/audio)")
+    m.add_argument("--ext", default=None, choices=EXTENSIONS, help="Расширение аудио (по умолчанию: по файлам в --out-dir)")
+    m.add_argument("--dedup", default="link", choices=["link", "manifest", "off"], help="Как шарды обходились с дубликатами (по умолчанию: link)")
+    m.add_argument("--show", type=int, default=20, help="Сколько проблемных id напечатать")
+    args = p.parse_args(argv)
+
+    chunks = list(read_jsonl(args.manifest))
+    try:
+        ext = args.ext or detect_ext(args.out_dir)
+    except ValueError as e:
+        print(f"[FATAL] {e}. Укажите --ext.", file=sys.stderr)
+        return 2
+    report = merge(chunks, args.out_dir, ext, use_dedup=args.dedup != "off")
+
+    if report.aliases and args.out_dir.is_dir():
+        # оригиналы дубликатов могли оказаться в других шардах — доделываем здесь
+        dedup.write_manifest(args.out_dir, report.aliases)
+        if args.dedup == "link":
+            dedup.materialize(args.out_dir, ext, report.aliases)
+
+    c = report.counts
+    print(f"Кусочков: {len(chunks)} — готово {c['done']}, ошибок {c['failed']}, не начато {c['pending']}")
+    for chunk_id, why in report.problems[:args.show]:
+        print(f"  {chunk_id}: {why}", file=sys.stderr)
+    if len(report.problems) > args.show:
+        print(f"  … и ещё {len(report.problems) - args.show}", file=sys.stderr)
+    print("Книга озвучена целиком." if report.complete else "Книга озвучена не целиком: перезапустите шарды, готовое они пропустят.")
+    return 0 if report.complete else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,503 @@
+# scripts/listen.py
+
+"""
+Слушать книгу, пока она озвучивается.
+
+Локальный HTTP-сервер отдаёт книгу одним прогрессивным потоком. Кусочки из
+out/audio склеиваются на лету так же, как у assemble_audio, а на ещё не
+озвученном кусочке поток ждёт. Синтез идёт в том же процессе, и очередь
+следует за слушателем: первым озвучивается ближайший неготовый кусочек
+впереди места, которое поток отдаёт сейчас, или места, куда слушатель
+перемотал. Первый звук приходит примерно через один запрос к TTS, а не
+после всей книги.
+
+    python -m scripts.listen --workers 4                 # плеер на http://127.0.0.1:8000/
+    mpv 'http://127.0.0.1:8000/book.mp3?t=1:00:00'       # с первого часа
+    curl 'http://127.0.0.1:8000/book.mp3?chunk=00420' > from_420.mp3
+    curl http://127.0.0.1:8000/status
+
+Перемотка — новый запрос с ?t=СЕКУНДЫ (или Ч:ММ:СС) или ?chunk=ID. Время
+ещё не озвученной части оценивается по темпу уже готового аудио. Если
+потоков несколько, очередь следует за последним открытым: перемотка
+открывает новый, а старый до закрытия соединения позицию уже не двигает.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import contextlib
+import html
+import json
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from scripts import audio_formats, ledger, metrics, retry_queue
+from scripts.assemble_audio import mp3_payload
+from scripts.chunk_store import natural_key
+from scripts.metrics import RUN
+from scripts.plan import SPEECH_CHARS_PER_SEC
+from scripts.tts_speechkit_v3 import (
+    Synthesizer,
+    add_input_arguments,
+    add_synth_arguments,
+    finish_aliases,
+    headers_from_args,
+    select_chunks,
+)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+WAIT_POLL = 1.0  # как часто ждущий поток перепроверяет файл, сек: его мог дописать другой процесс
+CONTENT_TYPES = {".mp3": "audio/mpeg", ".wav": "audio/wav", ".ogg": "audio/ogg"}
+
+Item = Tuple[int, str, str]  # (позиция в книге, id, текст)
+
+
+class PlayheadQueue:
+    """
+    Источник кусочков для iter_pool_retrying в порядке близости к слушателю:
+    сначала то, что поток ждёт вне очереди (request), затем неготовые кусочки
+    от позиции seek() к концу книги, затем от начала книги. Пул берёт
+    кусочки лениво, так что новая позиция действует со следующего свободного
+    места в окне пула, а не после уже набранной очереди.
+    """
+
+    def __init__(self, items: Iterable[Item]):
+        self._items: Dict[int, Item] = {item[0]: item for item in items}
+        self._order = sorted(self._items)  # позиции ещё не выданных кусочков
+        self._urgent: List[int] = []
+        self._cursor = 0
+        self._listener = 0
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._order)
+
+    @property
+    def cursor(self) -> int:
+        return self._cursor
+
+    def listen(self) -> int:
+        """Новый поток: с этого момента позицию задаёт только он. Возвращает его номер."""
+        with self._lock:
+            self._listener += 1
+            return self._listener
+
+    def seek(self, pos: int, listener: Optional[int] = None) -> None:
+        with self._lock:
+            if listener is None or listener == self._listener:
+                self._cursor = pos
+
+    def request(self, pos: int, listener: Optional[int] = None) -> None:
+        """Кусочек pos нужен раньше остальных (например, оригинал дубликата, на котором стоит поток)."""
+        with self._lock:
+            if (listener is None or listener == self._listener) and pos in self._items and pos not in self._urgent:
+                self._urgent.append(pos)
+
+    def close(self) -> None:
+        """Больше ничего не выдавать: синтез доделает то, что уже в полёте, и остановится."""
+        with self._lock:
+            self.closed = True
+
+    def __iter__(self) -> "PlayheadQueue":
+        return self
+
+    def __next__(self) -> Item:
+        with self._lock:
+            if self.closed or not self._order:
+                raise StopIteration
+            urgent = [pos for pos in self._urgent if pos in self._items]
+            self._urgent.clear()
+            if urgent:
+                pos = urgent[0]
+                self._urgent.extend(urgent[1:])
+            else:
+                at = bisect.bisect_left(self._order, self._cursor)
+                pos = self._order[at if at < len(self._order) else 0]
+            del self._order[bisect.bisect_left(self._order, pos)]
+            return self._items.pop(pos)
+
+
+class Book:
+    """
+    Кусочки книги по порядку и их готовность. Аудио позиции — файл {id}{ext},
+    у дубликата — файл его оригинала. Синтез отмечает исходы через settle(),
+    потоки ждут их в wait().
+    """
+
+    def __init__(self, texts: Dict[str, str], aliases: Dict[str, str], out_dir: Path, ext: str, speed: float):
+        self.stems = sorted(texts, key=natural_key)
+        self.pos = {stem: i for i, stem in enumerate(self.stems)}
+        self.texts = texts
+        self.aliases = aliases
+        self.out_dir = out_dir
+        self.ext = ext
+        self.speed = speed
+        self.failed: Set[str] = set()
+        self.finished = False
+        self._seconds: Dict[str, float] = {}
+        self._cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.stems)
+
+    def source(self, pos: int) -> str:
+        stem = self.stems[pos]
+        return self.aliases.get(stem, stem)
+
+    def path(self, pos: int) -> Path:
+        return self.out_dir / f"{self.source(pos)}{self.ext}"
+
+    def settle(self, stem: str, ok: bool) -> None:
+        with self._cond:
+            if not ok:
+                self.failed.add(stem)
+            self._cond.notify_all()
+
+    def finish(self) -> None:
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+
+    def wait(self, pos: int, timeout: float = WAIT_POLL) -> Optional[bool]:
+        """True — аудио готово; False — его не будет (ошибка или синтез закончен без него); None — ждать дальше."""
+        path = self.path(pos)
+        with self._cond:
+            # проверка под тем же замком, что у settle(): готовность между проверкой и wait не потеряется
+            if path.exists():
+                return True
+            if self.source(pos) in self.failed or self.finished:
+                return False
+            self._cond.wait(timeout)
+            return True if path.exists() else None
+
+    def ready_count(self) -> int:
+        return sum(1 for pos in range(len(self.stems)) if self.path(pos).exists())
+
+    def _duration(self, pos: int) -> Optional[float]:
+        """Длительность готового аудио по заголовкам; None — файла нет или он не читается."""
+        source = self.source(pos)
+        if source in self._seconds:
+            return self._seconds[source]
+        path = self.path(pos)
+        if not path.exists():
+            return None
+        try:
+            seconds = audio_formats.duration(path)
+        except (ValueError, OSError, struct.error):
+            return None
+        self._seconds[source] = seconds
+        return seconds
+
+    def locate(self, t: float) -> int:
+        """
+        Позиция, на которую приходится секунда t от начала книги: готовые
+        кусочки — по заголовкам, остальные — по темпу готового аудио в
+        символах в секунду (пока его нет — по оценке из plan).
+        """
+        known = [(pos, self._duration(pos)) for pos in range(len(self.stems))]
+        chars = sum(len(self.texts[self.stems[pos]]) for pos, seconds in known if seconds)
+        spoken = sum(seconds for _, seconds in known if seconds)
+        rate = chars / spoken if spoken else SPEECH_CHARS_PER_SEC * self.speed
+        at = 0.0
+        for pos, seconds in known:
+            at += seconds if seconds else len(self.texts[self.stems[pos]]) / rate
+            if at > t:
+                return pos
+        return max(0, len(self.stems) - 1)
+
+
+def iter_stream(book: Book, queue: PlayheadQueue, start: int) -> Iterator[bytes]:
+    """
+    Байты книги с позиции start. Перед каждым кусочком очередь синтеза
+    переводится на него; неготовый кусочек поток ждёт, а кусочек с ошибкой
+    синтеза пропускает. Синтез остановлен — поток кончается.
+    """
+    me = queue.listen()
+    fmt: Optional[bytes] = None
+    for pos in range(start, len(book)):
+        queue.seek(pos, me)
+        source = book.pos.get(book.source(pos), pos)
+        state = book.wait(pos)
+        while state is None:
+            if source != pos:
+                queue.request(source, me)
+            state = book.wait(pos)
+        if not state and queue.closed:
+            return
+        if not state:
+            print(f"[WARN] Поток: нет аудио для {book.stems[pos]}, пропускаю", file=sys.stderr)
+            continue
+        path = book.path(pos)
+        if book.ext == ".mp3":
+            yield mp3_payload(path.read_bytes())
+        elif book.ext == ".wav":
+            with path.open("rb") as f:
+                info = audio_formats.read_wav_info(f)
+                if fmt is None:
+                    fmt = info.fmt
+                    # длина потока неизвестна: размеры RIFF и data — максимальные, как у стриминговых WAV
+                    yield audio_formats.wav_header(fmt, 0xFFFFFFFF)
+                elif info.fmt != fmt:
+                    print(f"[WARN] Поток: формат {path.name} отличается от первого кусочка, пропускаю", file=sys.stderr)
+                    continue
+                f.seek(info.data_offset)
+                yield f.read(info.data_size)
+        else:
+            # OGG: цепочка Ogg-потоков, как у assemble_audio
+            yield path.read_bytes()
+
+
+def parse_time(value: str) -> float:
+    """'90', '1:30', '1:00:00' → секунды."""
+    seconds = 0.0
+    for part in value.strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+# ---------- HTTP ----------
+
+_PAGE = """<!doctype html>
+<meta charset="utf-8">
+<title>{title}</title>
+<h1>{title}</h1>
+<p>Озвучено {ready} из {total} кусочков{state}.</p>
+<audio controls autoplay preload="none" src="{src}"></audio>
+<form>
+  <label>С времени <input name="t" placeholder="1:23:45" size="8"></label>
+  <label>или с кусочка <input name="chunk" placeholder="{first}" size="8"></label>
+  <button>Слушать</button>
+</form>
+"""
+
+
+class ListenServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], book: Book, queue: PlayheadQueue, title: str):
+        super().__init__(address, ListenHandler)
+        self.book = book
+        self.queue = queue
+        self.title = title
+
+
+class ListenHandler(BaseHTTPRequestHandler):
+    server: ListenServer
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        book = self.server.book
+        if url.path == f"/book{book.ext}":
+            self._stream(query)
+        elif url.path == "/status":
+            self._send(200, "application/json", json.dumps(self._status(), ensure_ascii=False).encode("utf-8"))
+        elif url.path == "/":
+            src = f"/book{book.ext}" + (f"?{url.query}" if url.query else "")
+            page = _PAGE.format(
+                title=html.escape(self.server.title or "Книга"),
+                ready=book.ready_count(),
+                total=len(book),
+                state=", синтез закончен" if book.finished else "",
+                src=html.escape(src),
+                first=html.escape(book.stems[0] if book.stems else ""),
+            )
+            self._send(200, "text/html; charset=utf-8", page.encode("utf-8"))
+        else:
+            self._send(404, "text/plain; charset=utf-8", "Нет такой страницы\n".encode("utf-8"))
+
+    def _send(self, status: int, content_type: str, payload: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _status(self) -> Dict[str, object]:
+        book, queue = self.server.book, self.server.queue
+        return {
+            "chunks": len(book),
+            "ready": book.ready_count(),
+            "failed": len(book.failed),
+            "queued": len(queue),
+            "playhead": book.stems[min(queue.cursor, len(book) - 1)] if len(book) else None,
+            "finished": book.finished,
+        }
+
+    def _start(self, query: Dict[str, str]) -> int:
+        book = self.server.book
+        if "chunk" in query and query["chunk"].strip():
+            chunk = query["chunk"].strip()
+            if chunk not in book.pos:
+                raise ValueError(f"Нет кусочка {chunk}")
+            return book.pos[chunk]
+        if "t" in query and query["t"].strip():
+            return book.locate(parse_time(query["t"]))
+        return 0
+
+    def _stream(self, query: Dict[str, str]) -> None:
+        book, queue = self.server.book, self.server.queue
+        try:
+            start = self._start(query)
+        except ValueError as e:
+            self._send(400, "text/plain; charset=utf-8", f"{e}\n".encode("utf-8"))
+            return
+        t0 = time.monotonic()
+        # заголовки сразу: плеер не должен отвалиться по таймауту, пока озвучивается первый кусочек
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES[book.ext])
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.close_connection = True  # длина неизвестна: поток кончается закрытием соединения
+        first = True
+        try:
+            for block in iter_stream(book, queue, start):
+                self.wfile.write(block)
+                if first and len(block):
+                    first = False
+                    wait = time.monotonic() - t0
+                    RUN.record("listen_first_audio", wait)
+                    print(f"Поток с {book.stems[start]}: первый звук через {wait:.2f}s")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # слушатель закрыл плеер или перемотал
+
+    def log_message(self, format, *args):  # noqa: A002 - сигнатура BaseHTTPRequestHandler
+        pass
+
+
+# ---------- Синтез в фоне ----------
+
+def synthesize(
+    args: argparse.Namespace,
+    synth: Synthesizer,
+    status: ledger.SynthLedger,
+    book: Book,
+    queue: PlayheadQueue,
+    aliases: Dict[str, str],
+) -> List[Dict[str, object]]:
+    """Озвучивает кусочки из queue, пока она не опустеет или не закрыта. Возвращает записи ошибок."""
+    out_dir, ext = book.out_dir, book.ext
+    policy, breaker = retry_queue.from_args(args, synth.limiter)
+    total = len(book)
+
+    def work(item: Item) -> int:
+        _, stem, text = item
+        size = synth.synth_to_file(text.strip(), out_dir / f"{stem}{ext}")
+        book.settle(stem, True)  # поток ждёт этот файл — будим сразу, не дожидаясь цикла ниже
+        return size
+
+    def deferred(item: Item, err: BaseException, attempt: int, delay: float) -> None:
+        pos, stem, _ = item
+        print(f"[{pos + 1}/{total}] RETRY {stem} через {delay:.1f}s (попытка {attempt}/{policy.max_attempts}): {err}", file=sys.stderr)
+
+    failures: List[Dict[str, object]] = []
+    outcomes = retry_queue.iter_pool_retrying(work, queue, args.workers, policy, breaker, on_defer=deferred)
+    with contextlib.closing(outcomes):
+        for outcome in outcomes:
+            pos, stem, _ = outcome.item
+            if outcome.error is not None:
+                status.failed(stem, outcome.error, outcome.attempts)
+                failures.append(retry_queue.failure_record(stem, outcome))
+                book.settle(stem, False)
+                print(f"[{pos + 1}/{total}] FAIL {stem}: {outcome.error}", file=sys.stderr)
+            else:
+                status.done(stem, outcome.result, outcome.attempts)
+                print(f"[{pos + 1}/{total}] OK   → {stem}{ext} ({outcome.result} bytes)")
+            if queue.closed:
+                break
+    synth.close()
+    status.close()
+    book.finish()
+    finish_aliases(args, out_dir, ext, aliases)
+    manifest = retry_queue.write_failures(out_dir, failures)
+    if manifest is not None:
+        print(f"Не удалось: {len(failures)} кусочков, список — {manifest}", file=sys.stderr)
+    if not queue.closed:
+        print(f"Книга озвучена целиком: {out_dir}. Сервер продолжает отдавать поток, остановка — Ctrl+C.")
+    return failures
+
+
+# ---------- CLI ----------
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Слушать книгу во время озвучки: локальный HTTP-поток, синтез идёт от позиции слушателя")
+    add_input_arguments(p)
+    add_synth_arguments(p)
+    retry_queue.add_arguments(p)
+    metrics.add_arguments(p)
+    p.add_argument("--host", default=DEFAULT_HOST, help=f"Адрес сервера (по умолчанию: {DEFAULT_HOST}, только этот компьютер)")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Порт сервера (по умолчанию: {DEFAULT_PORT})")
+    p.add_argument("--title", default="", help="Название книги на странице плеера")
+    args = p.parse_args(argv)
+
+    metrics.start(args)
+    try:
+        return run(args)
+    finally:
+        metrics.finish(args)
+
+
+def run(args: argparse.Namespace) -> int:
+    try:
+        headers = headers_from_args(args)
+    except Exception as e:
+        print(f"[FATAL] {e}", file=sys.stderr)
+        return 2
+
+    out_dir: Path = args.out_dir
+    out_dir.mkdir(parents=True, exist_ok=True)
+    selected = select_chunks(args)
+    if selected is None:
+        return 1
+    chunks, aliases = selected
+
+    synth = Synthesizer.from_args(args, headers, retries=1)
+    texts = dict(chunks)
+    texts.update((dup, texts.get(canon, "")) for dup, canon in aliases.items())
+    book = Book(texts, aliases, out_dir, synth.ext, args.speed)
+    status = ledger.SynthLedger(out_dir, args.shard)
+    items = []
+    for stem, text in chunks:
+        target = out_dir / f"{stem}{synth.ext}"
+        if target.exists():
+            status.done(stem, target.stat().st_size, attempts=0)
+        else:
+            items.append((book.pos[stem], stem, text))
+    queue = PlayheadQueue(items)
+
+    try:
+        server = ListenServer((args.host, args.port), book, queue, args.title)
+    except OSError as e:
+        print(f"[FATAL] Не удалось открыть {args.host}:{args.port}: {e}", file=sys.stderr)
+        synth.close()
+        status.close()
+        return 1
+    print(f"Кусочков: {len(book)}, готово: {book.ready_count()}, к синтезу: {len(items)} (backend={args.backend}, workers={args.workers})")
+    print(f"Слушать: http://{args.host}:{args.port}/  (поток: http://{args.host}:{args.port}/book{synth.ext})")
+
+    failures: List[Dict[str, object]] = []
+    worker = threading.Thread(target=lambda: failures.extend(synthesize(args, synth, status, book, queue, aliases)), name="synth", daemon=True)
+    worker.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nОстановка: дожидаюсь запросов синтеза в полёте…", file=sys.stderr)
+    finally:
+        queue.close()
+        server.server_close()
+        worker.join()
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
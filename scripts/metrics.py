@@ -0,0 +1,186 @@
+# scripts/metrics.py
+
+"""
+Замеры по стадиям пайплайна и машиночитаемый отчёт о прогоне.
+
+Стадии (clean, tts, chunk, split, запись файлов) пишут события в общий на
+процесс регистратор RUN. Пока он не включён через enable(), запись ничего
+не стоит. Отчёт — JSON с p50/p95/p99 по стадиям, запросами и символами в
+секунду и секундами готового аудио. Трассировка — NDJSON, строка на событие:
+
+    python -m scripts.tts_speechkit_v3 --report out/run_report.json --trace out/trace.ndjson
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, TextIO
+
+# Поля события с этими именами считаются по значениям, а не складываются
+COUNTED_FIELDS = ("status",)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу; sorted_values уже отсортирован."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(q / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def _latency_summary(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "p50_s": round(percentile(values, 50), 4),
+        "p95_s": round(percentile(values, 95), 4),
+        "p99_s": round(percentile(values, 99), 4),
+        "max_s": round(values[-1], 4) if values else 0.0,
+    }
+
+
+class _Stage:
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.seconds: List[float] = []
+        self.latencies: Dict[str, List[float]] = {}   # поля *_s, например first_audio_s
+        self.totals: Dict[str, float] = {}            # числовые поля: chars, bytes, retries...
+        self.counts: Dict[str, Counter] = {}          # status и строковые поля
+
+    def add(self, seconds: float, fields: Dict[str, Any]) -> None:
+        self.count += 1
+        self.seconds.append(seconds)
+        if fields.get("error"):
+            self.errors += 1
+        for key, value in fields.items():
+            if value is None or key == "error":
+                continue
+            if key in COUNTED_FIELDS or isinstance(value, (str, bool)):
+                self.counts.setdefault(key, Counter())[str(value)] += 1
+            elif key.endswith("_s"):
+                self.latencies.setdefault(key, []).append(float(value))
+            else:
+                self.totals[key] = self.totals.get(key, 0) + value
+
+    def summary(self, wall: float) -> Dict[str, Any]:
+        total = sum(self.seconds)
+        out: Dict[str, Any] = {"count": self.count, "errors": self.errors, "total_s": round(total, 3)}
+        out.update(_latency_summary(self.seconds))
+        out["per_sec"] = round(self.count / wall, 3) if wall else 0.0
+        for key, values in self.latencies.items():
+            out[key] = _latency_summary(values)
+        for key, value in self.totals.items():
+            out[key] = round(value, 3) if isinstance(value, float) else value
+        if "chars" in self.totals and wall:
+            out["chars_per_sec"] = round(self.totals["chars"] / wall, 1)
+        for key, counter in self.counts.items():
+            out[key] = dict(counter)
+        return out
+
+
+class Metrics:
+    """Потокобезопасный сборщик событий: record()/timer() из любых потоков."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Stage] = {}
+        self._trace: Optional[TextIO] = None
+        self._t0 = time.monotonic()
+        self._started_at = datetime.now(timezone.utc)
+
+    def enable(self, trace_path: Optional[Path] = None) -> None:
+        """Начинает новый прогон: счётчики обнуляются, трасса (если задана) пишется с нуля."""
+        with self._lock:
+            self.enabled = True
+            self._stages.clear()
+            self._t0 = time.monotonic()
+            self._started_at = datetime.now(timezone.utc)
+            if trace_path is not None:
+                Path(trace_path).parent.mkdir(parents=True, exist_ok=True)
+                self._trace = Path(trace_path).open("w", encoding="utf-8")
+
+    def record(self, stage: str, seconds: float, **fields: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._stages.setdefault(stage, _Stage()).add(seconds, fields)
+            if self._trace is not None:
+                event = {"t": round(time.monotonic() - self._t0, 4), "stage": stage, "seconds": round(seconds, 4)}
+                event.update((k, v) for k, v in fields.items() if v is not None)
+                self._trace.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    @contextmanager
+    def timer(self, stage: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Замеряет блок кода. Внутри можно дописать поля события в отданный словарь
+        (status, retries, bytes...). Исключение записывается как error и пробрасывается.
+        """
+        if not self.enabled:
+            yield fields
+            return
+        t0 = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - t0, **fields)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            wall = time.monotonic() - self._t0
+            stages = {name: stage.summary(wall) for name, stage in sorted(self._stages.items())}
+        audio = sum(s.get("audio_seconds", 0.0) for s in stages.values())
+        return {
+            "started_at": self._started_at.isoformat(timespec="seconds"),
+            "argv": sys.argv,
+            "wall_s": round(wall, 3),
+            "audio_seconds": round(audio, 3),
+            "audio_per_wall": round(audio / wall, 3) if wall else 0.0,
+            "stages": stages,
+        }
+
+    def write_report(self, path: Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(self.report(), ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+
+RUN = Metrics()
+
+
+def add_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--report", type=Path, default=None, help="Записать JSON-отчёт о прогоне: задержки p50/p95/p99 по стадиям, запросы/с, символы/с, секунды аудио.")
+    p.add_argument("--trace", type=Path, default=None, help="Дополнительно писать NDJSON-трассу: строка на каждый запрос/запись файла.")
+
+
+def start(args: argparse.Namespace) -> None:
+    """Включает замеры, если в командной строке просили отчёт или трассу."""
+    if args.report or args.trace:
+        RUN.enable(args.trace)
+
+
+def finish(args: argparse.Namespace) -> None:
+    if args.report:
+        RUN.write_report(args.report)
+        print(f"Отчёт о прогоне: {args.report}")
+    RUN.close()
@@ -0,0 +1,245 @@
+# scripts/pipeline.py
+
+"""
+Сквозной потоковый пайплайн: очистка → нарезка для TTS → синтез.
+
+Очищенные чанки не копятся до конца книги. Каждый из них сразу режется
+на кусочки, и кусочки уходят в SpeechKit, пока LLM чистит следующие чанки.
+Стадии связаны ограниченной очередью, поэтому память ограничена её
+размером, а первое аудио появляется через пару запросов, а не после всей очистки.
+
+    python -m scripts.pipeline --clean-workers 4 --workers 4
+    python -m scripts.pipeline --plan --workers 8 --rps 20   # оценка без запросов
+"""
+
+from __future__ import annotations
+
+import argparse
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from project_config import settings
+from scripts import dedup, metrics, plan, realign, retry_queue, utils
+from scripts.chunk_store import ChunkStoreWriter
+from scripts.clean_and_chunk_book import CLEAN_PROMPT, iter_clean_chunks, read_book_chunks, save_text
+from scripts.clean_journal import CleanJournal
+from scripts.metrics import RUN
+from scripts.tts_speechkit_v3 import Synthesizer, add_synth_arguments, headers_from_args
+
+DEFAULT_QUEUE_SIZE = 64
+
+_DONE = object()
+
+
+def iter_tts_pieces(
+    raw_chunks: List[str],
+    clean_workers: int,
+    journal: Optional[CleanJournal],
+    cleaned_path: Path,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Чистит чанки (в порядке книги), дописывает их в cleaned_full.txt и
+    отдаёт кусочки для TTS со сквозной нумерацией 1, 2, 3...
+    Уже очищенные ранее чанки берутся из журнала без обращения к LLM.
+    Без журнала (режим local) чанки идут дальше как есть, LLM не вызывается.
+    """
+    if journal is None:
+        todo: List[Tuple[int, str]] = []
+    else:
+        todo = [(i, ch) for i, ch in enumerate(raw_chunks, 1) if journal.get(i, ch) is None]
+    todo_ids = {i for i, _ in todo}
+    fresh = iter_clean_chunks(todo, clean_workers, journal=journal) if todo else iter(())
+
+    idx = 0
+    with cleaned_path.open("w", encoding="utf-8") as full:
+        for i, raw in enumerate(raw_chunks, 1):
+            if i in todo_ids:
+                # fresh отдаёт чанки из todo строго по возрастанию номера
+                _, cleaned = next(fresh)
+            elif journal is not None:
+                cleaned = journal.get(i, raw)
+            else:
+                cleaned = raw
+            full.write(("\n\n" if i > 1 else "") + cleaned)
+            full.flush()
+            for piece in utils.split_for_tts(cleaned, settings.SPEECHKIT_CHUNK_SIZE, settings.SPEECHKIT_CHUNK_TARGET):
+                idx += 1
+                yield idx, piece
+
+
+def iter_bounded(source: Iterator[Tuple[int, str]], maxsize: int) -> Iterator[Tuple[int, str]]:
+    """
+    Прокачивает генератор в отдельном потоке через очередь на `maxsize` элементов.
+    Производитель (очистка) не убегает вперёд потребителя (синтеза) больше чем на очередь,
+    а потребитель не ждёт, пока производитель сделает очередной шаг.
+    """
+    q: "queue.Queue[object]" = queue.Queue(maxsize=maxsize)
+    errors: List[BaseException] = []
+
+    def produce() -> None:
+        try:
+            for item in source:
+                q.put(item)
+        except BaseException as e:  # noqa: BLE001 - пробрасываем в поток потребителя
+            errors.append(e)
+        finally:
+            q.put(_DONE)
+
+    threading.Thread(target=produce, name="pipeline-clean", daemon=True).start()
+    while True:
+        item = q.get()
+        if item is _DONE:
+            break
+        yield item  # type: ignore[misc]
+    if errors:
+        raise errors[0]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Потоковый пайплайн: очистка → нарезка → синтез без ожидания всей книги.")
+    p.add_argument("--book", type=Path, default=Path(settings.BOOK_PATH), help=f"Исходная книга, TXT или PDF (по умолчанию: {settings.BOOK_PATH})")
+    p.add_argument("--out", type=Path, default=Path(settings.OUT_DIR), help=f"Папка результата (по умолчанию: {settings.OUT_DIR})")
+    p.add_argument("--clean-workers", type=int, default=settings.CLEAN_WORKERS, help=f"Параллельных запросов к LLM (по умолчанию: {settings.CLEAN_WORKERS})")
+    p.add_argument("--mode", choices=settings.CLEAN_MODES, default=settings.CLEAN_MODE, help="llm — правила + LLM, local — только правила без LLM, raw — только LLM (по умолчанию: CLEAN_MODE из .env)")
+    p.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help=f"Сколько готовых кусочков может ждать синтеза (по умолчанию: {DEFAULT_QUEUE_SIZE})")
+    add_synth_arguments(p)
+    retry_queue.add_arguments(p)
+    metrics.add_arguments(p)
+    plan.add_arguments(p)
+    args = p.parse_args(argv)
+
+    if args.plan:
+        return run_plan(args)
+    metrics.start(args)
+    try:
+        return run(args)
+    finally:
+        metrics.finish(args)
+
+
+def run_plan(args: argparse.Namespace) -> int:
+    """--plan: та же нарезка книги, что в run, но без кредов, запросов и записи на диск."""
+    started = time.perf_counter()
+    try:
+        raw_chunks, _ = read_book_chunks(args.book, args.mode, stats=False)
+    except Exception as e:
+        print(f"[FATAL] Не удалось прочитать {args.book}: {e}", file=sys.stderr)
+        return 1
+    journal = None if args.mode == "local" else CleanJournal(args.out / "clean_journal.jsonl", CLEAN_PROMPT, settings.OPENAI_MODEL)
+    tts = plan.TtsParams.from_args(args)
+    return plan.run(args, raw_chunks, journal, CLEAN_PROMPT, args.out / "audio", args.clean_workers, tts, started)
+
+
+def run(args: argparse.Namespace) -> int:
+    try:
+        headers = headers_from_args(args)
+    except Exception as e:
+        print(f"[FATAL] {e}", file=sys.stderr)
+        return 2
+
+    out_dir: Path = args.out
+    tts_dir = out_dir / "speechkit_chunks"
+    audio_dir = out_dir / "audio"
+    tts_dir.mkdir(parents=True, exist_ok=True)
+    audio_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        raw_chunks, pre = read_book_chunks(args.book, args.mode)
+    except Exception as e:
+        print(f"[FATAL] Не удалось прочитать {args.book}: {e}", file=sys.stderr)
+        return 1
+    if pre is not None:
+        print(pre.report())
+    print(f"Чанков для очистки: {len(raw_chunks)}" + (" (режим local, без LLM)" if args.mode == "local" else ""))
+
+    journal = None if args.mode == "local" else CleanJournal(out_dir / "clean_journal.jsonl", CLEAN_PROMPT, settings.OPENAI_MODEL)
+    synth = Synthesizer.from_args(args, headers, retries=1)
+    ext = synth.ext
+    policy, breaker = retry_queue.from_args(args, synth.limiter)
+
+    pieces = iter_tts_pieces(raw_chunks, args.clean_workers, journal, out_dir / "cleaned_full.txt")
+
+    # аудио прошлого прогона подгоняется под новую нумерацию по мере нарезки
+    realigner = realign.open_realigner(tts_dir, audio_dir, ext)
+    writer = ChunkStoreWriter(tts_dir) if settings.CHUNK_FORMAT in ("store", "both") else None
+
+    first_seen: Dict[str, str] = {}
+    aliases: Dict[str, str] = {}
+
+    def pending() -> Iterator[Tuple[int, str]]:
+        for idx, piece in iter_bounded(pieces, args.queue_size):
+            stem = f"{idx:05d}"
+            if writer is not None:
+                writer.add(stem, piece)
+            if settings.CHUNK_FORMAT in ("txt", "both"):
+                save_text(tts_dir / f"{stem}.txt", piece)
+            ready = realigner.claim(stem, piece) if realigner is not None else (audio_dir / f"{stem}{ext}").exists()
+            if args.dedup != "off":
+                key = dedup.normalize(piece)
+                if key in first_seen:
+                    aliases[stem] = first_seen[key]
+                    continue
+                first_seen[key] = stem
+            if ready:
+                continue
+            yield idx, piece
+
+    def work(item: Tuple[int, str]) -> int:
+        idx, piece = item
+        return synth.synth_to_file(piece, audio_dir / f"{idx:05d}{ext}")
+
+    t0 = time.monotonic()
+    first_audio: Optional[float] = None
+
+    def deferred(item: Tuple[int, str], err: BaseException, attempt: int, delay: float) -> None:
+        print(f"[{item[0]}] RETRY через {delay:.1f}s (попытка {attempt}/{policy.max_attempts}): {err}", file=sys.stderr)
+
+    ok = failed = 0
+    failures = []
+    try:
+        for outcome in retry_queue.iter_pool_retrying(work, pending(), args.workers, policy, breaker, on_defer=deferred):
+            (idx, _), size, err = outcome.item, outcome.result, outcome.error
+            if err is not None:
+                failed += 1
+                failures.append(retry_queue.failure_record(f"{idx:05d}", outcome))
+                print(f"[{idx}] FAIL: {err}", file=sys.stderr)
+                continue
+            ok += 1
+            if first_audio is None:
+                first_audio = time.monotonic() - t0
+                RUN.record("pipeline_first_audio", first_audio)
+                print(f"Первое аудио через {first_audio:.1f}s")
+            print(f"[{idx}] OK   → {idx:05d}{ext} ({size} bytes)")
+    except Exception as e:
+        if writer is not None:
+            writer.abort()
+        print(f"[FATAL] {e}", file=sys.stderr)
+        print("Очищенные чанки сохранены в журнале, готовое аудио — в out/audio; повторный запуск продолжит.", file=sys.stderr)
+        return 1
+    finally:
+        synth.close()
+
+    if writer is not None:
+        writer.close()
+    if realigner is not None:
+        realigner.finish()
+        print(realigner.report())
+    if aliases:
+        dedup.write_manifest(audio_dir, aliases)
+        if args.dedup == "link":
+            dedup.materialize(audio_dir, ext, aliases)
+        print(f"Дубликатов: {len(aliases)} — сэкономлено {len(aliases)} запросов")
+    if journal is not None:
+        journal.compact(len(raw_chunks))
+    if retry_queue.write_failures(audio_dir, failures) is not None:
+        print(f"Не удалось: {failed} кусочков, список — {audio_dir / retry_queue.FAILURES_NAME}", file=sys.stderr)
+    print(f"Готово за {time.monotonic() - t0:.1f}s: {ok} OK, {failed} FAIL → {audio_dir}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
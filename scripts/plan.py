@@ -0,0 +1,341 @@
+# scripts/plan.py
+
+"""
+План прогона до того, как потрачен бюджет API: сколько запросов, токенов
+OpenAI и символов SpeechKit уйдёт, сколько часов аудио получится и сколько
+это займёт по времени при заданных --workers/--rps.
+
+Всё считается локально теми же функциями, что и настоящий прогон:
+предочистка, нарезка на чанки по токенам, нарезка для TTS, дедупликация,
+журнал очистки, кэш аудио и уже готовые файлы. В сеть ничего не уходит,
+на диск ничего не пишется.
+
+    python -m scripts.pipeline --plan --workers 8 --rps 20
+    python -m scripts.clean_and_chunk_book --plan
+    python -m scripts.pipeline --plan --calibrate out/run_report.json
+
+Время — модель, а не замер: задержка запроса SpeechKit и скорость генерации
+LLM берутся из флагов или из отчёта прошлого прогона (--calibrate).
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Type
+
+from project_config import settings
+from scripts import dedup, tts_backend, utils
+from scripts.clean_journal import CleanJournal
+from scripts.tts_backend import TtsBackend
+from scripts.tts_cache import DEFAULT_CACHE_DIR, cache_key, cached_keys
+from scripts.tts_speechkit_v3 import (
+    DEFAULT_CONTAINER,
+    DEFAULT_ROLE,
+    DEFAULT_RPS,
+    DEFAULT_SPEED,
+    DEFAULT_VOICE,
+    DEFAULT_WORKERS,
+    SAFE_TEXT_CHARS,
+    SpeechKitV3Backend,
+    add_synth_arguments,
+    audio_ext,
+    make_request_body,
+    rps_from_args,
+)
+
+# Символов в секунду речи при скорости 1.0 (русский текст, диктор в среднем темпе)
+SPEECH_CHARS_PER_SEC = 15.0
+DEFAULT_TTS_LATENCY = 1.0         # сек на запрос SpeechKit с кусочком до 200 символов
+DEFAULT_LLM_LATENCY = 2.0         # сек на запрос LLM до первого токена
+DEFAULT_LLM_TOKENS_PER_SEC = 60.0  # скорость генерации ответа LLM, токенов/с на запрос
+
+
+class TtsParams(NamedTuple):
+    """Параметры синтеза, от которых зависят ключи кэша, имена файлов и время."""
+    voice: str = DEFAULT_VOICE
+    role: str = DEFAULT_ROLE
+    speed: float = DEFAULT_SPEED
+    container: str = DEFAULT_CONTAINER
+    workers: int = DEFAULT_WORKERS
+    rps: float = DEFAULT_RPS
+    cache_dir: Optional[Path] = DEFAULT_CACHE_DIR
+    dedup: bool = True
+    backend: Type[TtsBackend] = SpeechKitV3Backend
+    tts_url: Optional[str] = None
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> "TtsParams":
+        """Из флагов add_synth_arguments — с тем же выбором rps, что у Synthesizer.from_args."""
+        return cls(
+            voice=args.voice,
+            role=args.role,
+            speed=args.speed,
+            container=args.container,
+            workers=args.workers,
+            rps=rps_from_args(args),
+            cache_dir=None if args.no_cache else args.cache_dir,
+            dedup=args.dedup != "off",
+            backend=tts_backend.load(args.backend),
+            tts_url=args.tts_url,
+        )
+
+    def make_backend(self) -> TtsBackend:
+        """Бэкенд без кредов — ради cache_body и ext; запросов план не шлёт."""
+        p = argparse.ArgumentParser()
+        add_synth_arguments(p)
+        args = p.parse_args([])
+        args.voice, args.role, args.speed, args.container = self.voice, self.role, self.speed, self.container
+        args.workers, args.tts_url = 1, self.tts_url
+        return self.backend.from_args(args, {})
+
+
+class Rates(NamedTuple):
+    """Модель скорости: из чего считается время и длительность аудио."""
+    tts_latency: float = DEFAULT_TTS_LATENCY
+    llm_latency: float = DEFAULT_LLM_LATENCY
+    llm_tokens_per_sec: float = DEFAULT_LLM_TOKENS_PER_SEC
+    llm_sec_per_char: Optional[float] = None  # из отчёта прошлого прогона, вместо двух полей выше
+    speech_chars_per_sec: float = SPEECH_CHARS_PER_SEC
+
+    def llm_seconds(self, chars: int, tokens: int) -> float:
+        if self.llm_sec_per_char is not None:
+            return chars * self.llm_sec_per_char
+        return self.llm_latency + tokens / self.llm_tokens_per_sec
+
+
+class Plan(NamedTuple):
+    book_chars: int
+    # очистка LLM
+    llm_chunks: int
+    llm_from_journal: int
+    llm_requests: int
+    llm_request_chars: int
+    llm_tokens_in: int                 # вместе с системным промптом на каждый запрос
+    llm_tokens_out: int                # ≈ токены чанка: очищенный текст почти той же длины
+    llm_seconds: List[float]           # модельная длительность каждого запроса
+    # синтез
+    tts_pieces: int
+    tts_chars: int
+    duplicates: int
+    duplicate_chars: int
+    audio_ready: int                   # файл уже лежит в папке аудио
+    cache_hits: int
+    cache_lookups: int
+    tts_requests: int
+    tts_request_chars: int
+    audio_seconds: float
+    plan_seconds: float
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cache_hits / self.cache_lookups if self.cache_lookups else 0.0
+
+
+def _cache_keyer(tts: TtsParams, backend: Optional[TtsBackend]) -> Callable[[str], str]:
+    """
+    То же, что cache_key(backend.cache_body(text)). Для SpeechKitV3Backend —
+    без json.dumps всего тела на каждый кусочек: тела отличаются только текстом
+    (и unsafeMode для длинных), поэтому сериализуем шаблон один раз и
+    подставляем в него текст. Остальные бэкенды (mock, module:Class) кладут
+    в тело своё, их ключи считаются честно.
+    """
+    if backend is not None:
+        return lambda text: cache_key(backend.cache_body(text))
+    marker = "\0"
+    templates = []
+    for text in (marker, marker * (SAFE_TEXT_CHARS + 1)):
+        body = make_request_body(text, tts.voice, tts.role, tts.speed, tts.container)
+        body["text"] = marker
+        raw = json.dumps(body, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        head, tail = raw.split(json.dumps(marker), 1)
+        templates.append((head.encode("utf-8"), tail.encode("utf-8")))
+
+    def key(text: str) -> str:
+        head, tail = templates[len(text) > SAFE_TEXT_CHARS]
+        return hashlib.sha256(head + json.dumps(text, ensure_ascii=False).encode("utf-8") + tail).hexdigest()
+
+    return key
+
+
+def estimate(
+    raw_chunks: List[str],
+    journal: Optional[CleanJournal],
+    prompt: str,
+    audio_dir: Path,
+    tts: TtsParams = TtsParams(),
+    rates: Rates = Rates(),
+    started: Optional[float] = None,
+) -> Plan:
+    """
+    raw_chunks — результат read_book_chunks; journal — None в режиме local.
+    Текст для TTS — очищенные чанки из журнала, а для ещё не очищенных —
+    сам чанк после предочистки: LLM меняет его длину на считанные проценты.
+    """
+    started = time.perf_counter() if started is None else started
+
+    texts: List[str] = []
+    todo: List[str] = []
+    for i, raw in enumerate(raw_chunks, 1):
+        cleaned = journal.get(i, raw) if journal is not None else raw
+        if cleaned is None:
+            todo.append(raw)
+            cleaned = raw
+        texts.append(cleaned)
+    todo_tokens = utils.count_tokens_many(todo) if todo else []
+    prompt_tokens = utils.count_tokens(prompt) if todo else 0
+
+    pieces = utils.split_for_tts("\n\n".join(texts).strip(), settings.SPEECHKIT_CHUNK_SIZE, settings.SPEECHKIT_CHUNK_TARGET)
+    chunks = [(f"{idx:05d}", piece) for idx, piece in enumerate(pieces, 1)]
+    unique = dedup.plan(chunks) if tts.dedup else dedup.DedupPlan(chunks, {}, 0)
+
+    backend = None if tts.backend is SpeechKitV3Backend else tts.make_backend()
+    try:
+        ext = audio_ext(tts.container) if backend is None else backend.ext
+        ready = set(os.listdir(audio_dir)) if audio_dir.is_dir() else set()
+        to_synth = [(cid, text) for cid, text in unique.unique if f"{cid}{ext}" not in ready]
+        keys = cached_keys(tts.cache_dir) if tts.cache_dir is not None and tts.cache_dir.is_dir() else set()
+        key = _cache_keyer(tts, backend)
+        hits = request_chars = 0
+        for _, text in to_synth:
+            # пустой кэш — незачем хэшировать тела запросов
+            if keys and key(text) in keys:
+                hits += 1
+            else:
+                request_chars += len(text)
+    finally:
+        if backend is not None:
+            backend.close()
+    tts_chars = sum(map(len, pieces))
+
+    return Plan(
+        book_chars=sum(map(len, raw_chunks)),
+        llm_chunks=len(raw_chunks) if journal is not None else 0,
+        llm_from_journal=len(raw_chunks) - len(todo) if journal is not None else 0,
+        llm_requests=len(todo),
+        llm_request_chars=sum(map(len, todo)),
+        llm_tokens_in=sum(todo_tokens) + prompt_tokens * len(todo),
+        llm_tokens_out=sum(todo_tokens),
+        llm_seconds=[rates.llm_seconds(len(ch), n) for ch, n in zip(todo, todo_tokens)],
+        tts_pieces=len(pieces),
+        tts_chars=tts_chars,
+        duplicates=len(unique.aliases),
+        duplicate_chars=unique.saved_chars,
+        audio_ready=len(unique.unique) - len(to_synth),
+        cache_hits=hits,
+        cache_lookups=len(to_synth),
+        tts_requests=len(to_synth) - hits,
+        tts_request_chars=request_chars,
+        audio_seconds=tts_chars / (rates.speech_chars_per_sec * tts.speed),
+        plan_seconds=time.perf_counter() - started,
+    )
+
+
+class WallTime(NamedTuple):
+    llm: float
+    tts: float
+    tts_bound: str          # что ограничивает синтез: rps или воркеры
+    pipeline: float         # scripts.pipeline: очистка и синтез идут одновременно
+    sequential: float       # clean_and_chunk_book, затем tts_speechkit_v3
+
+
+def wall_time(plan: Plan, clean_workers: int, tts: TtsParams, rates: Rates) -> WallTime:
+    """
+    LLM: запросы раскладываются по clean_workers, но не быстрее самого долгого.
+    TTS: пропускная способность — меньшее из --rps (0 — без лимита) и workers / задержка запроса.
+    """
+    llm = 0.0
+    if plan.llm_seconds:
+        llm = max(sum(plan.llm_seconds) / max(1, clean_workers), max(plan.llm_seconds))
+    by_workers = max(1, tts.workers) / rates.tts_latency
+    throughput = min(tts.rps, by_workers) if tts.rps else by_workers
+    tts_s = plan.tts_requests / throughput if plan.tts_requests else 0.0
+    bound = "rps" if throughput < by_workers else "workers"
+    first = plan.llm_seconds[0] if plan.llm_seconds else 0.0
+    return WallTime(llm, tts_s, bound, max(llm, first + tts_s), llm + tts_s)
+
+
+# ---------- CLI ----------
+
+def add_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--plan", action="store_true", help="Ничего не отправлять: посчитать запросы, токены, символы, длительность аудио и время прогона.")
+    p.add_argument("--calibrate", type=Path, default=None, help="Взять задержки и темп речи из отчёта прошлого прогона (--report) вместо значений по умолчанию.")
+    p.add_argument("--tts-latency", type=float, default=DEFAULT_TTS_LATENCY, help=f"Для --plan: секунд на запрос SpeechKit (по умолчанию: {DEFAULT_TTS_LATENCY:g})")
+    p.add_argument("--llm-tokens-per-sec", type=float, default=DEFAULT_LLM_TOKENS_PER_SEC, help=f"Для --plan: токенов/с ответа LLM на запрос (по умолчанию: {DEFAULT_LLM_TOKENS_PER_SEC:g})")
+
+
+def rates_from_args(args: argparse.Namespace, speed: float = DEFAULT_SPEED) -> Rates:
+    """
+    Из флагов, а с --calibrate — из отчёта metrics: средняя задержка стадии tts,
+    секунды очистки на символ и символы на секунду готового аудио.
+    """
+    rates = Rates(tts_latency=args.tts_latency, llm_tokens_per_sec=args.llm_tokens_per_sec)
+    if args.calibrate is None:
+        return rates
+    stages = json.loads(args.calibrate.read_text(encoding="utf-8")).get("stages", {})
+    tts, clean = stages.get("tts", {}), stages.get("clean", {})
+    if tts.get("count"):
+        rates = rates._replace(tts_latency=tts["total_s"] / tts["count"])
+    if clean.get("chars"):
+        rates = rates._replace(llm_sec_per_char=clean["total_s"] / clean["chars"])
+    audio = stages.get("write_audio", {}).get("audio_seconds", 0.0)
+    chars = tts.get("chars", 0) + stages.get("tts_cache_hit", {}).get("chars", 0)
+    if audio and chars:
+        rates = rates._replace(speech_chars_per_sec=chars / audio / speed)
+    return rates
+
+
+def _duration(seconds: float) -> str:
+    minutes = math.ceil(seconds / 60)
+    if minutes < 60:
+        return f"{seconds:.0f} s" if seconds < 60 else f"{minutes} мин"
+    return f"{minutes // 60} ч {minutes % 60:02d} мин"
+
+
+def format_plan(plan: Plan, wall: WallTime, clean_workers: int, tts: TtsParams, rates: Rates) -> str:
+    lines = [f"План прогона (в API ничего не отправлялось, посчитано за {plan.plan_seconds:.2f} s):"]
+    lines.append(f"  Книга: символов {plan.book_chars:,} после предочистки")
+    if plan.llm_chunks:
+        lines.append(
+            f"  Очистка LLM: чанков {plan.llm_chunks}, из журнала {plan.llm_from_journal}, "
+            f"к запросу {plan.llm_requests} ({plan.llm_request_chars:,} символов)"
+        )
+        lines.append(f"    токены: вход ~{plan.llm_tokens_in:,} (с промптом), выход ~{plan.llm_tokens_out:,}")
+    else:
+        lines.append("  Очистка LLM: не нужна (режим local)")
+    lines.append(f"  TTS: кусочков {plan.tts_pieces:,}, символов {plan.tts_chars:,}")
+    lines.append(
+        f"    дубликатов {plan.duplicates:,} (−{plan.duplicate_chars:,} символов), аудио уже есть {plan.audio_ready:,}, "
+        f"в кэше {plan.cache_hits:,} из {plan.cache_lookups:,} ({plan.cache_hit_rate:.1%})"
+    )
+    lines.append(f"    к запросу: кусочков {plan.tts_requests:,}, символов {plan.tts_request_chars:,}")
+    lines.append(f"  Аудио: ~{_duration(plan.audio_seconds)} при скорости {tts.speed:g}")
+    if plan.llm_requests:
+        lines.append(f"  Время LLM: ~{_duration(wall.llm)}, параллельно {clean_workers}")
+    limit = f"--rps {tts.rps:g}" if wall.tts_bound == "rps" else f"--workers {tts.workers} при {rates.tts_latency:.2f} s на запрос"
+    lines.append(f"  Время TTS: ~{_duration(wall.tts)} (упор в {limit})")
+    if plan.llm_requests:
+        lines.append(f"  Всего: ~{_duration(wall.pipeline)} через scripts.pipeline, ~{_duration(wall.sequential)} по шагам")
+    return "\n".join(lines)
+
+
+def run(
+    args: argparse.Namespace,
+    raw_chunks: List[str],
+    journal: Optional[CleanJournal],
+    prompt: str,
+    audio_dir: Path,
+    clean_workers: int,
+    tts: TtsParams,
+    started: float,
+) -> int:
+    """Общая часть --plan для точек входа: считает и печатает план."""
+    rates = rates_from_args(args, tts.speed)
+    plan = estimate(raw_chunks, journal, prompt, audio_dir, tts, rates, started)
+    print(format_plan(plan, wall_time(plan, clean_workers, tts, rates), clean_workers, tts, rates))
+    return 0
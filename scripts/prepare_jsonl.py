@@ -4,6 +4,7 @@ import argparse
 import json
 import sys
 from pathlib import Path
+from typing import Iterator
 
 # 1) Настройки из .env (если есть)
 try:
@@ -12,6 +13,8 @@ try:
 except Exception:
     pass
 
+from scripts.chunk_store import iter_chunks, natural_key, write_chunks  # noqa: F401 - natural_key оставлен для совместимости
+
 # 2) Настройки из config/settings.py (если есть)
 DEFAULT_OUT_DIR = "./out"
 DEFAULT_CHUNK_DIRNAME = "speechkit_chunks"
@@ -29,30 +32,18 @@ except Exception:
     CFG_MAX_CHARS = DEFAULT_MAX_CHARS
 
 
-def natural_key(s: str):
-    """Ключ для «человеческой» сортировки имен файлов: 00001.txt < 00010.txt < 000100.txt."""
-    import re
-    return [int(t) if t.isdigit() else t.lower() for t in re.split(r"(\d+)", s)]
-
-
 def read_chunks(in_dir: Path) -> list[tuple[str, str]]:
     """
-    Читает все .txt в директории, возвращает список (id, text).
-    id — имя файла без расширения.
+    Читает кусочки из директории — хранилища chunks.dat/chunks.idx или .txt файлов.
+    Возвращает список (id, text); id — имя файла без расширения.
     """
     if not in_dir.exists() or not in_dir.is_dir():
         raise FileNotFoundError(f"Директория с чанками не найдена: {in_dir}")
 
-    files = sorted((p for p in in_dir.glob("*.txt") if p.is_file()),
-                   key=lambda p: natural_key(p.name))
+    items = [(stem, text.strip()) for stem, text in iter_chunks(in_dir)]
 
-    if not files:
-        raise FileNotFoundError(f"В {in_dir} нет .txt файлов с чанками")
-
-    items: list[tuple[str, str]] = []
-    for p in files:
-        text = p.read_text(encoding="utf-8", errors="strict").strip()
-        items.append((p.stem, text))
+    if not items:
+        raise FileNotFoundError(f"В {in_dir} нет кусочков (ни chunks.idx, ни .txt файлов)")
     return items
 
 
@@ -78,15 +69,24 @@ def write_jsonl(items: list[tuple[str, str]], out_path: Path) -> None:
             f.write(json.dumps(line, ensure_ascii=False) + "\n")
 
 
+def read_jsonl(path: Path) -> Iterator[tuple[str, str]]:
+    """Обратное write_jsonl: (id, text) по строкам манифеста."""
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                rec = json.loads(line)
+                yield str(rec["id"]), rec["text"]
+
+
 def main(argv=None) -> int:
     parser = argparse.ArgumentParser(
-        description="Собирает чанки TTS (.txt) в один JSONL для Yandex SpeechKit."
+        description="Собирает чанки TTS (.txt или хранилище) в один JSONL для Yandex SpeechKit."
     )
     parser.add_argument(
         "--in-dir",
         type=Path,
         default=Path(CFG_OUT_DIR) / DEFAULT_CHUNK_DIRNAME,
-        help=f"Папка с .txt чанками (по умолчанию: {Path(CFG_OUT_DIR) / DEFAULT_CHUNK_DIRNAME})",
+        help=f"Папка с чанками: хранилище или .txt (по умолчанию: {Path(CFG_OUT_DIR) / DEFAULT_CHUNK_DIRNAME})",
     )
     parser.add_argument(
         "--out",
@@ -100,6 +100,11 @@ def main(argv=None) -> int:
         default=CFG_MAX_CHARS,
         help=f"Максимальная длина кусочка в символах (для валидации; по умолчанию: {CFG_MAX_CHARS})",
     )
+    parser.add_argument(
+        "--pack",
+        action="store_true",
+        help="Заодно упаковать кусочки в хранилище chunks.dat + chunks.idx в той же папке.",
+    )
     parser.add_argument(
         "--no-validate",
         action="store_true",
@@ -110,6 +115,10 @@ def main(argv=None) -> int:
 
     items = read_chunks(args.in_dir)
 
+    if args.pack:
+        n = write_chunks(items, args.in_dir, fmt="store")
+        print(f"OK: {n} кусочков упаковано в {args.in_dir}")
+
     if not args.no_validate:
         warns = validate_lengths(items, args.max_chars)
         for w in warns:
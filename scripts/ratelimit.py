@@ -0,0 +1,78 @@
+# scripts/ratelimit.py
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Потокобезопасный token bucket: не больше `rate` запросов в секунду,
+    допускаются всплески до `burst` запросов подряд. rate=0 — без лимита.
+
+    Кроме того, умеет глобальную паузу: если любой поток получил 429,
+    он вызывает pause(), и все остальные потоки ждут до её окончания.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate < 0:
+            raise ValueError("rate должен быть >= 0")
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self) -> float:
+        """Берёт токен, если можно, и возвращает 0; иначе — сколько секунд подождать до следующей попытки."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if not self.rate:
+                return 0.0
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Блокирует поток, пока не появится токен и не закончится глобальная пауза."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """То же для asyncio: ждёт, не блокируя цикл событий."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def paused_for(self) -> float:
+        """Сколько секунд ещё длится глобальная пауза (0 — паузы нет)."""
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def pause(self, seconds: float) -> None:
+        """Глобальный бэкофф: никто не получает токены ближайшие `seconds` секунд."""
+        with self._lock:
+            until = time.monotonic() + seconds
+            if until > self._paused_until:
+                self._paused_until = until
+                # после паузы не даём накопленному всплеску ударить по API
+                self._tokens = 0.0
+                self._updated = until
@@ -0,0 +1,276 @@
+# scripts/realign.py
+
+"""
+Перенос готового аудио после правки текста.
+
+Правка опечатки в cleaned_full.txt сдвигает нумерацию кусочков после места
+правки. Файлы out/audio/00042.mp3 названы по позиции, а не по тексту: без
+этого шага синтез пропустил бы их как готовые, и книга заговорила бы чужим
+текстом, либо пришлось бы озвучивать всё заново.
+
+У каждого кусочка есть ключ из содержимого — хэш текста после той же
+нормализации, что у dedup. Старый список кусочков (хранилище до перезаписи)
+говорит, какой ключ озвучен в каждом файле. Новый список проходит по порядку:
+  * файл на своём месте с тем же ключом остаётся;
+  * аудио с нужным ключом из другой позиции подставляется жёсткой ссылкой,
+    без декодирования;
+  * остальное уходит в синтез, а аудио исчезнувшего текста удаляется.
+Имена файлов остаются позиционными: по ним идут сборка книги, --start и шарды.
+
+clean_and_chunk_book, pipeline и job_queue делают это сами. Перенарезать
+вручную поправленный cleaned_full.txt:
+
+    python -m scripts.realign --dry-run   # только посчитать
+    python -m scripts.realign
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from project_config import settings
+from scripts import dedup, ledger
+from scripts.assemble_audio import EXTENSIONS
+from scripts.chunk_store import iter_chunks, write_chunks
+from scripts.utils import split_for_tts
+
+STATE_DIRNAME = ".realign"
+OVERLAY_NAME = "keys.jsonl"
+
+
+def content_key(text: str) -> str:
+    """Ключ кусочка из содержимого: одинаковый для текстов, которые dedup считает одинаковыми."""
+    return hashlib.blake2b(dedup.normalize(text).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _read_overlay(path: Path) -> Dict[str, str]:
+    keys: Dict[str, str] = {}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # недописанная строка после аварийного завершения
+            keys[rec["id"]] = rec["key"]
+    return keys
+
+
+class AudioRealigner:
+    """
+    Подгоняет аудио в audio_dir под новый список кусочков, по одному кусочку:
+    пайплайн узнаёт кусочки по мере очистки. claim() вызывается для каждого
+    кусочка в порядке книги, finish() — когда новое хранилище записано.
+
+    Пока новое хранилище не записано, что лежит в файлах, говорят старое
+    хранилище и журнал .realign/keys.jsonl. Туда до переноса пишется, чей
+    текст будет в файле, так что упавший посередине прогон продолжится с того же
+    места. Вытесненное аудио ждёт в .realign/<ключ><ext>: его текст может
+    найтись дальше по книге.
+    """
+
+    def __init__(self, audio_dir: Path, ext: str, old_keys: Dict[str, str], dry_run: bool = False):
+        self.audio_dir = Path(audio_dir)
+        self.ext = ext
+        self.dry_run = dry_run
+        self.state_dir = self.audio_dir / STATE_DIRNAME
+        self.old_keys = old_keys
+        self.keys = dict(old_keys)
+        overlay = self.state_dir / OVERLAY_NAME
+        if overlay.exists():
+            self.keys.update(_read_overlay(overlay))
+        self.by_key: Dict[str, List[str]] = {}
+        for stem, key in self.keys.items():
+            self.by_key.setdefault(key, []).append(stem)
+        self.present: Set[str] = {p.stem for p in self.audio_dir.glob(f"*{ext}") if p.is_file()}
+        # ключ → старый id, чьё аудио вытеснено (None — вытеснено прошлым, упавшим прогоном)
+        self.staged: Dict[str, Optional[str]] = {p.stem: None for p in self.state_dir.glob(f"*{ext}")}
+        self.claimed: Set[str] = set()
+        self.sources: Dict[str, str] = {}  # новый id → старый id, чьё аудио теперь в файле
+        self.unchanged: Set[str] = set()   # id, текст которых не изменился
+        self.kept = self.linked = self.missing = self.removed = 0
+        self._overlay = None
+
+    def _path(self, stem: str) -> Path:
+        return self.audio_dir / f"{stem}{self.ext}"
+
+    def _note(self, stem: str, key: str) -> None:
+        self.keys[stem] = key
+        self.by_key.setdefault(key, []).append(stem)
+        if self.dry_run:
+            return
+        if self._overlay is None:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            self._overlay = (self.state_dir / OVERLAY_NAME).open("a", encoding="utf-8")
+        self._overlay.write(json.dumps({"id": stem, "key": key}) + "\n")
+        self._overlay.flush()
+
+    def _stash(self, stem: str, key: str) -> None:
+        """Убирает файл stem с дороги, сохранив аудио под его ключом."""
+        self.present.discard(stem)
+        if key in self.staged:
+            if not self.dry_run:
+                self._path(stem).unlink()
+            return
+        self.staged[key] = stem
+        if not self.dry_run:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            os.replace(self._path(stem), self.state_dir / f"{key}{self.ext}")
+
+    def _find(self, key: str) -> Optional[Tuple[Path, Optional[str]]]:
+        """Где лежит аудио с ключом key: (файл, старый id или None)."""
+        if key in self.staged:
+            return self.state_dir / f"{key}{self.ext}", self.staged[key]
+        for stem in self.by_key.get(key, ()):
+            if stem in self.present and self.keys.get(stem) == key:
+                return self._path(stem), self.sources.get(stem, stem)
+        return None
+
+    def claim(self, stem: str, text: str) -> bool:
+        """
+        Готовит файл stem под text. True — аудио на месте (было или подставлено),
+        False — кусочек нужно синтезировать.
+        """
+        key = content_key(text)
+        self.claimed.add(stem)
+        have = self.keys.get(stem)
+        if self.old_keys.get(stem) == key:
+            self.unchanged.add(stem)
+        if stem in self.present:
+            if have is None or have == key:
+                # про файл без записи в хранилище ничего не известно — считаем готовым, как раньше
+                self.sources[stem] = stem
+                self.kept += 1
+                return True
+            self._stash(stem, have)
+        elif have == key:
+            # текст тот же, аудио ещё не было (или оно у дубликата в dedup_manifest.json)
+            self.missing += 1
+            return False
+
+        self._note(stem, key)
+        found = self._find(key)
+        if found is None:
+            self.missing += 1
+            return False
+        source, origin = found
+        if not self.dry_run:
+            dedup.link_or_copy(source, self._path(stem))
+        self.present.add(stem)
+        if origin is not None:
+            self.sources[stem] = origin
+        self.linked += 1
+        return True
+
+    def finish(self) -> None:
+        """
+        Новое хранилище записано: удаляет аудио исчезнувшего текста, переносит
+        записи журнала синтеза вслед за аудио и чистит манифест дубликатов.
+        """
+        if self._overlay is not None:
+            self._overlay.close()
+        tail = [stem for stem in self.present if stem in self.keys and stem not in self.claimed]
+        # удалено — аудио, текста которого в новой книге больше нет
+        kept_keys = {self.keys[stem] for stem in self.claimed if stem in self.present}
+        self.removed = len((self.staged.keys() | {self.keys[stem] for stem in tail}) - kept_keys)
+        if self.dry_run:
+            return
+        for stem in tail:
+            self._path(stem).unlink()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+        ledger.remap(self.audio_dir, self.sources)
+        aliases = dedup.load_manifest(self.audio_dir)
+        if aliases:
+            kept = {dup: canon for dup, canon in aliases.items() if dup in self.unchanged and canon in self.unchanged}
+            if len(kept) < len(aliases):
+                dedup.write_manifest(self.audio_dir, kept, replace=True)
+
+    def report(self) -> str:
+        return f"Аудио после правки текста: на месте {self.kept}, перенесено {self.linked}, к синтезу {self.missing}, удалено {self.removed}"
+
+
+def open_realigner(chunks_dir: Path, audio_dir: Path, ext: Optional[str] = None, dry_run: bool = False) -> Optional[AudioRealigner]:
+    """
+    Реалайнер для перезаписи кусочков в chunks_dir или None, если переносить
+    нечего: нет аудио или нет старых кусочков. Вызывать до перезаписи.
+    """
+    audio_dir = Path(audio_dir)
+    if not audio_dir.is_dir():
+        return None
+    if ext is None:
+        found = [e for e in EXTENSIONS if any(audio_dir.glob(f"*{e}"))]
+        if len(found) > 1:
+            print(f"[WARN] В {audio_dir} несколько форматов аудио ({', '.join(found)}): перенос под новую нумерацию пропущен", file=sys.stderr)
+        if len(found) != 1:
+            return None
+        ext = found[0]
+    resumed = (audio_dir / STATE_DIRNAME / OVERLAY_NAME).exists()
+    if not resumed and not any(audio_dir.glob(f"*{ext}")):
+        return None
+    old_keys = {stem: content_key(text) for stem, text in iter_chunks(chunks_dir)} if Path(chunks_dir).is_dir() else {}
+    if not old_keys and not resumed:
+        return None
+    return AudioRealigner(audio_dir, ext, old_keys, dry_run=dry_run)
+
+
+def rewrite_chunks(
+    pieces: Iterable[str],
+    chunks_dir: Path,
+    fmt: str,
+    audio_dir: Optional[Path] = None,
+    ext: Optional[str] = None,
+) -> Optional[AudioRealigner]:
+    """
+    Пишет кусочки 00001, 00002, ... и, если задан audio_dir, подгоняет под
+    них готовое аудио. Возвращает реалайнер (для отчёта) или None.
+    """
+    numbered = [(f"{idx:05d}", piece) for idx, piece in enumerate(pieces, 1)]
+    realigner = open_realigner(chunks_dir, audio_dir, ext) if audio_dir is not None else None
+    if realigner is not None:
+        for stem, piece in numbered:
+            realigner.claim(stem, piece)
+    write_chunks(numbered, chunks_dir, fmt=fmt)
+    if realigner is not None:
+        realigner.finish()
+    return realigner
+
+
+def main(argv: list[str] | None = None) -> int:
+    out_dir = Path(settings.OUT_DIR)
+    p = argparse.ArgumentParser(description="Перенарезка правленого текста с переносом готового аудио под новую нумерацию")
+    p.add_argument("--cleaned", type=Path, default=out_dir / "cleaned_full.txt", help=f"Правленый текст (по умолчанию: {out_dir / 'cleaned_full.txt'})")
+    p.add_argument("--chunks-dir", type=Path, default=out_dir / "speechkit_chunks", help=f"Кусочки, по которым озвучено аудио (по умолчанию: {out_dir / 'speechkit_chunks'})")
+    p.add_argument("--audio-dir", type=Path, default=out_dir / "audio", help=f"Готовое аудио (по умолчанию: {out_dir / 'audio'})")
+    p.add_argument("--ext", default=None, choices=EXTENSIONS, help="Расширение аудио (по умолчанию: по файлам в --audio-dir)")
+    p.add_argument("--dry-run", action="store_true", help="Только посчитать, что останется, что переедет и что уйдёт в синтез.")
+    args = p.parse_args(argv)
+
+    if not args.cleaned.is_file():
+        print(f"[FATAL] Файл не найден: {args.cleaned}", file=sys.stderr)
+        return 1
+    pieces = split_for_tts(args.cleaned.read_text(encoding="utf-8"), settings.SPEECHKIT_CHUNK_SIZE, settings.SPEECHKIT_CHUNK_TARGET)
+    print(f"Кусочков: {len(pieces)}")
+    if args.dry_run:
+        realigner = open_realigner(args.chunks_dir, args.audio_dir, args.ext, dry_run=True)
+        if realigner is None:
+            print("Переносить нечего: нет аудио или старых кусочков.")
+            return 0
+        for idx, piece in enumerate(pieces, 1):
+            realigner.claim(f"{idx:05d}", piece)
+        realigner.finish()
+    else:
+        realigner = rewrite_chunks(pieces, args.chunks_dir, settings.CHUNK_FORMAT, args.audio_dir, args.ext)
+        print(f"Кусочки → {args.chunks_dir}")
+    if realigner is not None:
+        print(realigner.report())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
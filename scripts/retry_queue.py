@@ -0,0 +1,250 @@
+# scripts/retry_queue.py
+
+"""
+Пул воркеров с отложенными повторами вместо «FAIL и дальше».
+
+Упавший из-за 429/5xx/сети кусочек не повторяется тут же в том же потоке
+со сном, а откладывается в очередь повторов с экспоненциальной паузой и
+джиттером. Пока он ждёт, пул берёт следующие здоровые кусочки. Если ошибок
+в последних запросах слишком много, срабатывает предохранитель: лимитер
+ставит на паузу все воркеры разом, а не каждый долбится в лежащий API сам.
+Кусочки, которые исчерпали попытки или упали с неповторяемой ошибкой,
+в конце прогона получают ещё одну попытку. То, что не удалось и тогда,
+попадает в манифест ошибок failures.json рядом с аудио.
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+
+from scripts.ratelimit import TokenBucket
+
+FAILURES_NAME = "failures.json"
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE = 1.0
+DEFAULT_RETRY_MAX = 60.0
+DEFAULT_BREAKER_WINDOW = 20
+DEFAULT_BREAKER_THRESHOLD = 0.5
+DEFAULT_BREAKER_COOLDOWN = 15.0
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class TransientError(RuntimeError):
+    """Ошибка, которая может пройти сама: троттлинг, 5xx. status — HTTP-код, если он был."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+def is_transient(err: BaseException) -> bool:
+    if isinstance(err, (TransientError, ConnectionError, TimeoutError)):
+        return True
+    # asyncio-клиент: сервер оборвал тело ответа на середине
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is not None and isinstance(err, asyncio.IncompleteReadError):
+        return True
+    # requests импортируется лениво: если его нет в процессе, то нет и его ошибок
+    requests = sys.modules.get("requests")
+    return requests is not None and isinstance(err, (requests.ConnectionError, requests.Timeout))
+
+
+class RetryPolicy(NamedTuple):
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+    base: float = DEFAULT_RETRY_BASE
+    cap: float = DEFAULT_RETRY_MAX
+
+    def delay(self, attempt: int) -> float:
+        """Пауза после неудачной попытки номер attempt: base·2^(n-1), не больше cap, джиттер ±50%."""
+        d = min(self.cap, self.base * 2 ** (attempt - 1))
+        return d * (0.5 + random.random() / 2)
+
+
+class CircuitBreaker:
+    """
+    Смотрит на исходы последних `window` запросов. Если доля временных ошибок
+    дошла до `threshold`, ставит лимитер на паузу — это останавливает все
+    воркеры. Пауза удваивается, если сразу после неё ошибки продолжаются,
+    и возвращается к исходной, когда окно проходит без ошибок.
+    """
+
+    def __init__(
+        self,
+        limiter: TokenBucket,
+        window: int = DEFAULT_BREAKER_WINDOW,
+        threshold: float = DEFAULT_BREAKER_THRESHOLD,
+        cooldown: float = DEFAULT_BREAKER_COOLDOWN,
+        max_cooldown: float = 300.0,
+    ):
+        self.limiter = limiter
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.trips = 0
+        self._cooldown = cooldown
+        self._outcomes: Deque[bool] = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._outcomes.append(ok)
+            if len(self._outcomes) < self._outcomes.maxlen:
+                return
+            errors = self._outcomes.count(False)
+            if errors == 0:
+                self._cooldown = self.base_cooldown
+            elif errors / len(self._outcomes) >= self.threshold:
+                self.trips += 1
+                print(
+                    f"[WARN] {errors}/{len(self._outcomes)} последних запросов с ошибкой — пауза всем воркерам на {self._cooldown:.0f}s",
+                    file=sys.stderr,
+                )
+                self.limiter.pause(self._cooldown)
+                self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+                self._outcomes.clear()
+
+
+class Outcome(NamedTuple):
+    item: object
+    result: object
+    error: Optional[BaseException]
+    attempts: int
+
+
+def iter_pool_retrying(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    workers: int,
+    policy: RetryPolicy = RetryPolicy(),
+    breaker: Optional[CircuitBreaker] = None,
+    on_defer: Optional[Callable[[T, BaseException, int, float], None]] = None,
+) -> Iterator[Outcome]:
+    """
+    Как iter_pool, но отдаёт только окончательные исходы. Временная ошибка
+    откладывает элемент на policy.delay(attempt) секунд; созревшие повторы
+    идут в пул раньше новых элементов. В конце — ещё одна попытка для всего,
+    что не удалось (включая неповторяемые ошибки), и только её итог отдаётся
+    как ошибка. Если среди них есть временные ошибки, перед финальным проходом
+    выдерживается пауза policy.delay(max_attempts), но не меньше остатка паузы
+    предохранителя, — иначе при сбое API последняя попытка сгорит за миллисекунды.
+    """
+    workers = max(1, workers)
+    window = workers * 2
+    source = iter(items)
+    exhausted = False
+    order = itertools.count()
+    deferred: List[Tuple[float, int, T, int]] = []   # (когда, порядок, элемент, сделано попыток)
+    given_up: List[Tuple[T, int, bool]] = []  # (элемент, сделано попыток, ошибка временная)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending: Dict[Future, Tuple[T, int]] = {}
+
+        def submit(item: T, attempt: int) -> None:
+            pending[pool.submit(func, item)] = (item, attempt)
+
+        while True:
+            now = time.monotonic()
+            while len(pending) < window:
+                if deferred and deferred[0][0] <= now:
+                    _, _, item, done_attempts = heapq.heappop(deferred)
+                    submit(item, done_attempts + 1)
+                elif not exhausted:
+                    try:
+                        submit(next(source), 1)
+                    except StopIteration:
+                        exhausted = True
+                else:
+                    break
+            if not pending and not deferred:
+                break
+            timeout = max(0.0, deferred[0][0] - now) if deferred else None
+            if not pending:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                item, attempt = pending.pop(fut)
+                err = fut.exception()
+                transient = err is not None and is_transient(err)
+                if breaker is not None and (err is None or transient):
+                    breaker.record(err is None)
+                if err is None:
+                    yield Outcome(item, fut.result(), None, attempt)
+                elif transient and attempt < policy.max_attempts:
+                    delay = policy.delay(attempt)
+                    if on_defer is not None:
+                        on_defer(item, err, attempt, delay)
+                    heapq.heappush(deferred, (time.monotonic() + delay, next(order), item, attempt))
+                else:
+                    given_up.append((item, attempt, transient))
+
+        if given_up:
+            pause = 0.0
+            if any(transient for _, _, transient in given_up):
+                pause = policy.delay(policy.max_attempts)
+                if breaker is not None:
+                    pause = max(pause, breaker.limiter.paused_for())
+            print(f"Финальный проход через {pause:.0f}s: ещё одна попытка для {len(given_up)} кусочков", file=sys.stderr)
+            time.sleep(pause)
+            rest = iter(given_up)
+            while True:
+                for item, attempt, _ in itertools.islice(rest, window - len(pending)):
+                    submit(item, attempt + 1)
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    item, attempt = pending.pop(fut)
+                    err = fut.exception()
+                    if breaker is not None and (err is None or is_transient(err)):
+                        breaker.record(err is None)
+                    yield Outcome(item, None if err else fut.result(), err, attempt)
+
+
+# ---------- CLI и манифест ошибок ----------
+
+def add_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help=f"Попыток на кусочек при 429/5xx/сетевых ошибках, не считая финального прохода (по умолчанию: {DEFAULT_MAX_ATTEMPTS})")
+    p.add_argument("--retry-base", type=float, default=DEFAULT_RETRY_BASE, help=f"Первая пауза перед повтором, сек; дальше удваивается, с джиттером (по умолчанию: {DEFAULT_RETRY_BASE:g})")
+    p.add_argument("--retry-max", type=float, default=DEFAULT_RETRY_MAX, help=f"Предельная пауза перед повтором, сек (по умолчанию: {DEFAULT_RETRY_MAX:g})")
+    p.add_argument("--breaker-window", type=int, default=DEFAULT_BREAKER_WINDOW, help=f"Сколько последних запросов смотрит предохранитель (по умолчанию: {DEFAULT_BREAKER_WINDOW})")
+    p.add_argument("--breaker-threshold", type=float, default=DEFAULT_BREAKER_THRESHOLD, help=f"Доля ошибок в окне, при которой все воркеры встают на паузу (по умолчанию: {DEFAULT_BREAKER_THRESHOLD:g})")
+    p.add_argument("--breaker-cooldown", type=float, default=DEFAULT_BREAKER_COOLDOWN, help=f"Пауза предохранителя, сек; удваивается, если не помогло (по умолчанию: {DEFAULT_BREAKER_COOLDOWN:g})")
+
+
+def from_args(args: argparse.Namespace, limiter: TokenBucket) -> Tuple[RetryPolicy, CircuitBreaker]:
+    policy = RetryPolicy(max(1, args.max_attempts), args.retry_base, args.retry_max)
+    breaker = CircuitBreaker(limiter, args.breaker_window, args.breaker_threshold, args.breaker_cooldown)
+    return policy, breaker
+
+
+def write_failures(out_dir: Path, failures: List[Dict[str, object]]) -> Optional[Path]:
+    """failures.json: [{"id", "attempts", "transient", "error"}]. Без ошибок старый манифест удаляется."""
+    path = out_dir / FAILURES_NAME
+    if not failures:
+        path.unlink(missing_ok=True)
+        return None
+    tmp = out_dir / f"{FAILURES_NAME}.tmp"
+    tmp.write_text(json.dumps(failures, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+
+def failure_record(chunk_id: str, outcome: Outcome) -> Dict[str, object]:
+    err = outcome.error
+    return {"id": chunk_id, "attempts": outcome.attempts, "transient": is_transient(err), "error": f"{type(err).__name__}: {err}"}
@@ -0,0 +1,450 @@
+# scripts/tts_async.py
+
+"""
+Асинхронный клиент SpeechKit v3 на asyncio без сторонних HTTP-библиотек.
+
+Ответ разбирается по мере прихода: NDJSON-кадры audioChunk декодируются
+сразу и дописываются во временный файл рядом с целевым, который после
+успеха атомарно переименовывается. Память на запрос не зависит от длины
+аудио, а оборванный запрос не оставляет файла, который следующий запуск
+принял бы за готовый. Тысячи запросов в полёте обслуживает один поток:
+
+    python -m scripts.tts_async --workers 256 --rps 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import sys
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Type
+from urllib.parse import urlsplit
+
+from scripts import ledger, metrics, retry_queue, tts_backend
+from scripts.metrics import RUN
+from scripts.ratelimit import TokenBucket
+from scripts.tts_cache import SynthCache, cache_key
+from scripts.tts_speechkit_v3 import (
+    DEFAULT_CONTAINER,
+    DEFAULT_ROLE,
+    DEFAULT_RPS,
+    DEFAULT_SPEED,
+    DEFAULT_VOICE,
+    STREAM_BLOCK,
+    NdjsonAudioDecoder,
+    SpeechKitV3Backend,
+    _audio_seconds,
+    add_input_arguments,
+    add_synth_arguments,
+    finish_aliases,
+    headers_from_args,
+    is_binary_audio,
+    make_request_body,
+    note_malformed,
+    rps_from_args,
+    select_chunks,
+    temp_path,
+    write_atomic,
+)
+
+DEFAULT_ASYNC_WORKERS = 32
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+# ---------- HTTP/1.1 поверх asyncio-потоков ----------
+
+class AsyncResponse:
+    """Статус, заголовки и тело, которое читается из сокета по мере итерации."""
+
+    def __init__(self, status: int, headers: Dict[str, str], conn: "_Connection"):
+        self.status = status
+        self.headers = headers
+        self._conn = conn
+        self._done = False
+
+    async def iter_body(self) -> AsyncIterator[bytes]:
+        if self._done:
+            raise RuntimeError("Тело ответа уже прочитано")
+        self._done = True
+        reader, timeout = self._conn.reader, self._conn.timeout
+        if self.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size_line = await asyncio.wait_for(reader.readline(), timeout)
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # трейлеры до пустой строки
+                    while (await asyncio.wait_for(reader.readline(), timeout)).strip():
+                        pass
+                    break
+                yield await asyncio.wait_for(reader.readexactly(size), timeout)
+                await asyncio.wait_for(reader.readexactly(2), timeout)
+        elif "content-length" in self.headers:
+            left = int(self.headers["content-length"])
+            while left > 0:
+                block = await asyncio.wait_for(reader.read(min(left, STREAM_BLOCK)), timeout)
+                if not block:
+                    raise ConnectionError(f"Соединение закрыто, не дочитано {left} байт ответа")
+                left -= len(block)
+                yield block
+        else:
+            # ни длины, ни chunked: тело до закрытия соединения
+            self._conn.reusable = False
+            while block := await asyncio.wait_for(reader.read(STREAM_BLOCK), timeout):
+                yield block
+        self._conn.body_read = True
+
+    async def read(self) -> bytes:
+        return b"".join([block async for block in self.iter_body()])
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, timeout: float):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.reusable = True
+        self.body_read = False
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class AsyncHttpPool:
+    """
+    Keep-alive соединения к одному хосту: не больше `size` открытых, свободные
+    переиспользуются. Как make_session, только для asyncio и без зависимостей.
+    """
+
+    def __init__(self, url: str, headers: Dict[str, str], size: int, timeout: float = 90):
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname or ""
+        self.port = parts.port or (443 if self.https else 80)
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.headers = dict(headers)
+        self.timeout = timeout
+        self._ssl = ssl.create_default_context() if self.https else None
+        self._slots = asyncio.Semaphore(max(1, size))
+        self._idle: List[_Connection] = []
+
+    async def _open(self) -> _Connection:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, ssl=self._ssl, limit=STREAM_BLOCK * 4),
+            self.timeout,
+        )
+        return _Connection(reader, writer, self.timeout)
+
+    def _request_bytes(self, body: bytes) -> bytes:
+        host = self.host if self.port in (80, 443) else f"{self.host}:{self.port}"
+        lines = [f"POST {self.path} HTTP/1.1", f"Host: {host}", f"Content-Length: {len(body)}", "Connection: keep-alive"]
+        lines += [f"{k}: {v}" for k, v in self.headers.items() if k.lower() not in ("host", "content-length", "connection")]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+    async def _send(self, conn: _Connection, payload: bytes) -> AsyncResponse:
+        conn.writer.write(payload)
+        await asyncio.wait_for(conn.writer.drain(), self.timeout)
+        status_line = await asyncio.wait_for(conn.reader.readline(), self.timeout)
+        if not status_line:
+            raise ConnectionResetError("Сервер закрыл соединение до ответа")
+        status = int(status_line.split(None, 2)[1])
+        headers: Dict[str, str] = {}
+        while True:
+            line = await asyncio.wait_for(conn.reader.readline(), self.timeout)
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if headers.get("connection", "").lower() == "close":
+            conn.reusable = False
+        return AsyncResponse(status, headers, conn)
+
+    def post(self, body: bytes) -> "_Exchange":
+        return _Exchange(self, self._request_bytes(body))
+
+    async def close(self) -> None:
+        for conn in self._idle:
+            conn.close()
+        self._idle.clear()
+
+
+class _Exchange:
+    """
+    async with: берёт соединение из пула, отправляет запрос, отдаёт ответ.
+    На выходе соединение возвращается в пул, только если тело дочитано до конца.
+    """
+
+    def __init__(self, pool: AsyncHttpPool, payload: bytes):
+        self._pool = pool
+        self._payload = payload
+        self._conn: Optional[_Connection] = None
+
+    async def __aenter__(self) -> AsyncResponse:
+        pool = self._pool
+        await pool._slots.acquire()
+        try:
+            while pool._idle:
+                self._conn = pool._idle.pop()
+                try:
+                    return await pool._send(self._conn, self._payload)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # сервер закрыл простаивавшее соединение — берём следующее
+                    self._conn.close()
+                    self._conn = None
+            self._conn = await pool._open()
+            return await pool._send(self._conn, self._payload)
+        except BaseException:
+            if self._conn is not None:
+                self._conn.close()
+            pool._slots.release()
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        conn = self._conn
+        if conn is not None:
+            if exc_type is None and conn.reusable and conn.body_read:
+                conn.body_read = False
+                self._pool._idle.append(conn)
+            else:
+                conn.close()
+        self._pool._slots.release()
+
+
+# ---------- Синтез ----------
+
+class AsyncSynthesizer:
+    """
+    Асинхронный аналог Synthesizer: тот же кэш, лимитер и ретраи, но аудио
+    не собирается в памяти, а пишется в файл прямо из сокета.
+    """
+
+    def __init__(
+        self,
+        headers: Dict[str, str],
+        voice: str = DEFAULT_VOICE,
+        role: str = DEFAULT_ROLE,
+        speed: float = DEFAULT_SPEED,
+        container: str = DEFAULT_CONTAINER,
+        workers: int = DEFAULT_ASYNC_WORKERS,
+        rps: float = DEFAULT_RPS,
+        cache: Optional[SynthCache] = None,
+        url: Optional[str] = None,
+        retries: int = 3,
+        timeout: float = 90,
+        backend_cls: Type[SpeechKitV3Backend] = SpeechKitV3Backend,
+    ):
+        self.voice = voice
+        self.role = role
+        self.speed = speed
+        self.container = container
+        # протокол, адрес и ключ кэша — от бэкенда, транспорт — свой, асинхронный
+        self.backend = backend_cls(headers, voice, role, speed, container, workers=1, url=url)
+        self.ext = self.backend.ext
+        self.retries = retries
+        self.limiter = TokenBucket(rate=rps, burst=max(1, workers))
+        self.http = AsyncHttpPool(self.backend.url, headers, size=workers, timeout=timeout)
+        self.cache = cache
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace, headers: Dict[str, str]) -> "AsyncSynthesizer":
+        backend_cls = tts_backend.load(args.backend)
+        if not issubclass(backend_cls, SpeechKitV3Backend):
+            raise RuntimeError(f"asyncio-клиент говорит только по протоколу SpeechKit v3, а --backend {args.backend} — нет")
+        cache = None if args.no_cache else SynthCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+        return cls(
+            headers,
+            voice=args.voice,
+            role=args.role,
+            speed=args.speed,
+            container=args.container,
+            workers=args.workers,
+            rps=rps_from_args(args),
+            cache=cache,
+            url=args.tts_url,
+            backend_cls=backend_cls,
+        )
+
+    async def synth_to_file(self, text: str, target: Path) -> int:
+        body = make_request_body(text, voice=self.voice, role=self.role, speed=self.speed, container=self.container)
+        key = None
+        if self.cache is not None:
+            key = cache_key(self.backend.cache_body(text))
+            audio = self.cache.get(key)
+            if audio is not None:
+                RUN.record("tts_cache_hit", 0.0, chars=len(text), bytes=len(audio))
+                write_atomic(target, audio)
+                return len(audio)
+
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        tmp = temp_path(target)
+        try:
+            with RUN.timer("tts", chars=len(text)) as ev:
+                size = await self._stream(payload, tmp, ev)
+            os.replace(tmp, target)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        if self.cache is not None:
+            self.cache.put_file(key, target)
+        if RUN.enabled:
+            RUN.record("write_audio", 0.0, bytes=size, audio_seconds=_audio_seconds(target))
+        return size
+
+    async def _stream(self, payload: bytes, tmp: Path, ev: Dict[str, Any]) -> int:
+        waited = 0.0
+        for attempt in range(1, self.retries + 1):
+            ev["retries"] = attempt - 1
+            t_wait = time.perf_counter()
+            await self.limiter.acquire_async()
+            waited += time.perf_counter() - t_wait
+            ev["limiter_wait"] = waited
+            t_send = time.perf_counter()
+            wait = min(2 ** (attempt - 1), 8)
+            tries = f" после {self.retries} попыток" if self.retries > 1 else ""
+
+            try:
+                async with self.http.post(payload) as r:
+                    ev["status"] = r.status
+                    if r.status == 200:
+                        size = await self._write_body(r, tmp, ev, t_send)
+                        if size:
+                            ev["bytes"] = size
+                            return size
+                        raise RuntimeError("HTTP 200, но пустой аудио-ответ (нет audioChunk.data).")
+                    err = (await r.read()).decode("utf-8", "replace")
+            except Exception as e:
+                # сброс соединения, обрыв тела, таймаут — как 5xx: при сотнях запросов в полёте это обычное дело
+                if not retry_queue.is_transient(e):
+                    raise
+                if attempt == self.retries:
+                    raise retry_queue.TransientError(f"{type(e).__name__}: {e}{tries}") from e
+                print(f"[WARN] {type(e).__name__}: {e}, retry {attempt}/{self.retries} через {wait}s", file=sys.stderr)
+                await asyncio.sleep(wait)
+                continue
+
+            if r.status in RETRY_STATUSES:
+                if r.status == 429:
+                    # троттлинг касается всего процесса: тормозим все корутины разом
+                    self.limiter.pause(wait)
+                if attempt == self.retries:
+                    raise retry_queue.TransientError(f"HTTP {r.status}{tries}", status=r.status)
+                print(f"[WARN] HTTP {r.status}, retry {attempt}/{self.retries} через {wait}s", file=sys.stderr)
+                if r.status != 429:
+                    await asyncio.sleep(wait)
+                continue
+            raise RuntimeError(f"TTS error HTTP {r.status}: {err}")
+
+        raise RuntimeError("Не удалось синтезировать после ретраев.")
+
+    @staticmethod
+    async def _write_body(r: AsyncResponse, tmp: Path, ev: Dict[str, Any], t_send: float) -> int:
+        size = 0
+        binary = is_binary_audio(r.headers.get("content-type", ""))
+        decoder = NdjsonAudioDecoder()
+        with tmp.open("wb") as f:
+            async for block in r.iter_body():
+                for audio in ([block] if binary else decoder.feed(block)):
+                    if not size:
+                        ev["first_audio_s"] = time.perf_counter() - t_send
+                    f.write(audio)
+                    size += len(audio)
+            for audio in decoder.flush():
+                f.write(audio)
+                size += len(audio)
+        note_malformed(decoder, ev)
+        return size
+
+    async def close(self) -> None:
+        await self.http.close()
+        self.backend.close()
+        if self.cache is not None:
+            print(self.cache.stats_line())
+
+
+# ---------- CLI ----------
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Batch TTS через Yandex SpeechKit v3 (REST), asyncio-клиент со стримингом в файл")
+    add_input_arguments(p)
+    add_synth_arguments(p)
+    p.set_defaults(workers=DEFAULT_ASYNC_WORKERS)
+    metrics.add_arguments(p)
+
+    args = p.parse_args(argv)
+
+    metrics.start(args)
+    try:
+        return asyncio.run(run(args))
+    finally:
+        metrics.finish(args)
+
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        headers = headers_from_args(args)
+    except Exception as e:
+        print(f"[FATAL] {e}", file=sys.stderr)
+        return 2
+
+    out_dir: Path = args.out_dir
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    selected = select_chunks(args)
+    if selected is None:
+        return 1
+    chunks, aliases = selected
+
+    total = len(chunks)
+    print(f"Файлов для синтеза: {total} (voice={args.voice}, speed={args.speed}, container={args.container}, workers={args.workers}, asyncio)")
+
+    try:
+        synth = AsyncSynthesizer.from_args(args, headers)
+    except RuntimeError as e:
+        print(f"[FATAL] {e}", file=sys.stderr)
+        return 2
+    ext = synth.ext
+    status = ledger.SynthLedger(out_dir, args.shard)
+
+    def pending_chunks() -> Iterator[Tuple[int, str, str]]:
+        for i, (stem, text) in enumerate(chunks, 1):
+            target = out_dir / f"{stem}{ext}"
+            if target.exists():
+                print(f"[{i}/{total}] SKIP {target.name} (уже есть)")
+                status.done(stem, target.stat().st_size, attempts=0)
+                continue
+            yield i, stem, text
+
+    todo = pending_chunks()
+    failed = 0
+
+    async def worker() -> None:
+        nonlocal failed
+        # генератор общий: в одном потоке next() не пересекается между корутинами
+        for i, stem, text in todo:
+            try:
+                size = await synth.synth_to_file(text.strip(), out_dir / f"{stem}{ext}")
+            except Exception as e:
+                failed += 1
+                status.failed(stem, e)
+                print(f"[{i}/{total}] FAIL {stem}: {e}", file=sys.stderr)
+            else:
+                status.done(stem, size)
+                print(f"[{i}/{total}] OK   → {stem}{ext} ({size} bytes)")
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, args.workers))))
+    finally:
+        await synth.close()
+        status.close()
+
+    finish_aliases(args, out_dir, ext, aliases)
+    print(f"Готово: {out_dir}" + (f" ({failed} FAIL)" if failed else ""))
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
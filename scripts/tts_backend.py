@@ -0,0 +1,81 @@
+# scripts/tts_backend.py
+
+"""
+Интерфейс бэкенда синтеза и реестр бэкендов.
+
+Synthesizer отвечает за общее для всех сервисов: лимитер, кэш, метрики,
+атомарную запись файла, а бэкенд — за то, что у каждого сервиса своё:
+авторизацию, тело запроса, транспорт, повторы внутри запроса и разбор
+ответа. Бэкенд выбирается флагом --backend. Это имя из BACKENDS или путь
+module:Class к своему классу:
+
+    python -m scripts.tts_speechkit_v3 --backend speechkit_v3      # по умолчанию
+    python -m scripts.tts_speechkit_v3 --backend mock --tts-url http://127.0.0.1:8765/tts/v3/utteranceSynthesis
+    python -m scripts.tts_speechkit_v3 --backend mypkg.tts:MyBackend
+
+Модули бэкендов импортируются только при выборе, поэтому реестр не тянет
+зависимости всех сервисов сразу.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+from typing import Any, Dict, Optional, Type
+
+from scripts.ratelimit import TokenBucket
+
+DEFAULT_BACKEND = "speechkit_v3"
+
+BACKENDS = {
+    "speechkit_v3": "scripts.tts_speechkit_v3:SpeechKitV3Backend",
+    # тот же протокол без кредов, для локальной заглушки: python -m benchmarks.stub_speechkit
+    "mock": "scripts.tts_speechkit_v3:MockSpeechKitBackend",
+}
+
+
+class TtsBackend:
+    """
+    Один сервис синтеза. Экземпляр создаётся на прогон и делится между
+    потоками, поэтому synth() должен быть потокобезопасным.
+    """
+
+    name = ""
+    ext = ".mp3"
+
+    @classmethod
+    def auth_headers(cls, args: argparse.Namespace) -> Dict[str, str]:
+        """Заголовки авторизации из флагов и окружения; нет кредов — RuntimeError."""
+        raise NotImplementedError
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace, headers: Dict[str, str]) -> "TtsBackend":
+        """Бэкенд из флагов add_synth_arguments и заголовков auth_headers."""
+        raise NotImplementedError
+
+    def cache_body(self, text: str) -> Dict[str, Any]:
+        """Всё, от чего зависит аудио (обычно тело запроса). Ключ кэша считается от этого словаря."""
+        raise NotImplementedError
+
+    def synth(self, text: str, limiter: Optional[TokenBucket] = None, retries: int = 3) -> bytes:
+        """
+        Аудио одного кусочка. Перед каждым запросом — limiter.acquire().
+        Временная ошибка после последней попытки — retry_queue.TransientError,
+        чтобы кусочек отложила очередь повторов.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+def load(name: str) -> Type[TtsBackend]:
+    """Класс бэкенда по имени из BACKENDS или по пути module:Class."""
+    target = BACKENDS.get(name, name)
+    module_name, _, attr = target.partition(":")
+    if not attr:
+        raise ValueError(f"Неизвестный бэкенд {name!r}: ожидается одно из {', '.join(BACKENDS)} или module:Class")
+    cls = getattr(importlib.import_module(module_name), attr)
+    if not (isinstance(cls, type) and issubclass(cls, TtsBackend)):
+        raise TypeError(f"{target} — не подкласс TtsBackend")
+    return cls
@@ -0,0 +1,112 @@
+# scripts/tts_cache.py
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set
+
+DEFAULT_CACHE_DIR = Path(os.getenv("TTS_CACHE_DIR", "~/.cache/speechkit_tts")).expanduser()
+DEFAULT_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "2048"))
+
+
+def cache_key(body: Dict[str, Any]) -> str:
+    """
+    Ключ — sha256 от тела запроса (make_request_body): текст, голос, роль,
+    скорость, контейнер. Одинаковые фразы из разных книг попадают в одну запись.
+    """
+    raw = json.dumps(body, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cached_keys(root: Path) -> Set[str]:
+    """Ключи всех записей кэша — чтобы оценить попадания, не читая аудио и не трогая отметки LRU."""
+    return {p.stem for p in Path(root).glob("*/*.bin")}
+
+
+class SynthCache:
+    """
+    Дисковый кэш синтезированного аудио с LRU-вытеснением по суммарному размеру.
+
+    Раскладка: <root>/<ab>/<abcdef...>.bin. Время последнего обращения —
+    mtime файла (обновляется при попадании), поэтому порядок LRU переживает
+    перезапуски и общий для всех процессов, использующих одну папку.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._size = sum(p.stat().st_size for p in self.root.glob("*/*.bin"))
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.bin"
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # отметка для LRU
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += len(data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._store(key, len(data), lambda tmp: tmp.write_bytes(data))
+
+    def put_file(self, key: str, src: Path) -> None:
+        """То же, что put, но аудио уже лежит в файле: копируем, не читая его в память."""
+        self._store(key, src.stat().st_size, lambda tmp: shutil.copyfile(src, tmp))
+
+    def _store(self, key: str, size: int, write: Callable[[Path], Any]) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        write(tmp)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Удаляет самые давно использованные записи, пока не уложимся в 90% лимита."""
+        entries = []
+        for p in self.root.glob("*/*.bin"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        self._size = sum(size for _, size, _ in entries)
+        entries.sort()
+        target = int(self.max_bytes * 0.9)
+        for _, size, p in entries:
+            if self._size <= target:
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def stats_line(self) -> str:
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return (
+            f"Кэш: {self.hits} попаданий, {self.misses} промахов ({rate:.1f}%), "
+            f"сэкономлено {self.bytes_saved:,} байт аудио"
+        )
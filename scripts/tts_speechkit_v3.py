@@ -4,25 +4,45 @@ from __future__ import annotations
 
 import argparse
 import base64
+import binascii
 import json
 import os
+import struct
 import sys
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Dict, Any, Optional, Iterable
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Iterable, Iterator, Callable, Tuple, TypeVar
 
-import requests
 from dotenv import load_dotenv
 load_dotenv()
 
+from scripts import audio_formats, dedup, ledger, metrics, retry_queue, tts_backend
+from scripts.chunk_store import iter_chunks
+from scripts.metrics import RUN
+from scripts.prepare_jsonl import read_jsonl
+from scripts.ratelimit import TokenBucket
+from scripts.tts_backend import TtsBackend
+from scripts.tts_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_MB, SynthCache, cache_key
+
+if TYPE_CHECKING:
+    import requests
+
 API_URL = "https://tts.api.cloud.yandex.net/tts/v3/utteranceSynthesis"
+MOCK_URL = "http://127.0.0.1:8765/tts/v3/utteranceSynthesis"  # python -m benchmarks.stub_speechkit
 
 # Дефолты под задачу: Филипп, 1.1x, MP3
 DEFAULT_VOICE = "filipp"
 DEFAULT_ROLE = ""              # роль отключена по умолчанию (у filipp role=neutral не поддерживается)
 DEFAULT_SPEED = 1.1
 DEFAULT_CONTAINER = "MP3"
-DEFAULT_RATE_LIMIT_SLEEP = 0.2  # пауза между запросами, сек
+DEFAULT_RATE_LIMIT_SLEEP = 0.2  # пауза между запросами, сек (устарело, см. --rps)
+DEFAULT_RPS = 1 / DEFAULT_RATE_LIMIT_SLEEP  # запросов в секунду на весь процесс
+DEFAULT_WORKERS = 1
+STREAM_BLOCK = 64 * 1024  # сколько байт ответа читать из сокета за раз
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+SAFE_TEXT_CHARS = 250  # длиннее — только с unsafeMode: SpeechKit сам делит текст на фразы
 
 # Пути по умолчанию
 DEFAULT_IN_DIR = Path("./out/speechkit_chunks")
@@ -50,12 +70,35 @@ def build_headers(api_key: Optional[str], iam_token: Optional[str], folder_id: O
     raise RuntimeError("Нужен SPEECHKIT_API_KEY или IAM_TOKEN + FOLDER_ID.")
 
 
+def make_session(headers: Dict[str, str], pool_size: int = 1) -> requests.Session:
+    """
+    Переиспользуемый транспорт: keep-alive соединения к SpeechKit вместо
+    нового TCP+TLS рукопожатия на каждый кусочек. Пул соединений по размеру
+    равен числу воркеров, чтобы потоки не ждали друг друга за сокетом.
+    """
+    import requests  # ~0.1 s на импорт: --plan, asyncio-клиенту и нарезке не нужен
+
+    pool_size = max(1, pool_size)
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1,      # ходим на один хост
+        pool_maxsize=pool_size,
+        pool_block=True,         # не открываем лишних соединений сверх пула
+        max_retries=0,           # ретраи делает synth_one
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(headers)
+    session.headers["Connection"] = "keep-alive"
+    return session
+
+
 # ---------- Формирование тела запроса ----------
 
 def make_request_body(text: str, voice: str, role: str, speed: float, container: str) -> Dict[str, Any]:
     """
     В v3 каждый объект hints содержит ровно одно поле (voice|role|speed...).
-    Роль делаем опциональной.
+    Роль делаем опциональной. Текст длиннее SAFE_TEXT_CHARS отправляем с unsafeMode.
     """
     body: Dict[str, Any] = {
         "text": text,
@@ -73,172 +116,621 @@ def make_request_body(text: str, voice: str, role: str, speed: float, container:
     role = (role or "").strip()
     if role:
         body["hints"].insert(1, {"role": role})
+    if len(text) > SAFE_TEXT_CHARS:
+        body["unsafeMode"] = True
     return body
 
 
 # ---------- Чтение стримингового ответа ----------
 
-def _iter_audio_chunks_ndjson(resp: requests.Response) -> Iterable[bytes]:
+def is_binary_audio(content_type: str) -> bool:
+    """Ответ пришёл готовым аудио, а не NDJSON с audioChunk."""
+    content_type = content_type.lower()
+    return content_type.startswith("audio/") or content_type.startswith("application/octet-stream")
+
+
+def _iter_audio_chunks_ndjson(resp: requests.Response, decoder: Optional["NdjsonAudioDecoder"] = None) -> Iterable[bytes]:
     """
     Проходит по NDJSON/построчному JSON и извлекает base64 аудио-чанки.
     Поддерживает варианты:
       - {"audioChunk":{"data":"..."}}
       - {"result":{"audioChunk":{"data":"..."}}}
+    Ответ одним JSON без перевода строки тоже разбирается (последняя строка).
+    Счётчики кадров остаются в decoder, если его передали.
     """
-    for raw_line in resp.iter_lines(decode_unicode=True):
-        if not raw_line:
-            continue
-        line = raw_line.strip()
-        if not line:
-            continue
-        try:
-            obj = json.loads(line)
-        except Exception:
-            continue
+    decoder = decoder if decoder is not None else NdjsonAudioDecoder()
+    for block in resp.iter_content(chunk_size=STREAM_BLOCK):
+        yield from decoder.feed(block)
+    yield from decoder.flush()
+
 
-        node = obj.get("result", obj)
-        chunk = node.get("audioChunk")
-        if isinstance(chunk, dict):
-            data_b64 = chunk.get("data")
-            if data_b64:
-                try:
-                    yield base64.b64decode(data_b64)
-                except Exception:
-                    continue
+_AUDIO_KEY = b'"audioChunk"'
+_DATA_KEY = b'"data"'
+# strict_mode появился в 3.11; без него мусор внутри base64 молча пропускается
+_B64_STRICT = {"strict_mode": True} if sys.version_info >= (3, 11) else {}
+
+
+def _audio_from_json(line: bytes) -> Optional[bytes]:
+    """Медленный путь: полный json.loads. Нужен, только если в строке есть экранирование."""
+    obj = json.loads(line)
+    node = obj.get("result", obj)
+    chunk = node.get("audioChunk")
+    data_b64 = chunk.get("data") if isinstance(chunk, dict) else None
+    return base64.b64decode(data_b64, validate=True) if data_b64 else None
+
+
+class NdjsonAudioDecoder:
+    """
+    Инкрементальный разбор NDJSON-ответа прямо по байтам: кусок подаётся как
+    пришёл из сокета, на выходе — аудио из каждой законченной строки.
+
+    Объект JSON целиком не строится: в строке ищется "audioChunk", за ним
+    значение "data", и base64 декодируется из memoryview над буфером без
+    промежуточных str/bytes. Строки без audioChunk (служебные кадры) считаются
+    в `other`, битые строки и base64 — в `malformed`, а не пропадают молча.
+    Последняя строка без перевода строки (или весь ответ одним JSON) — в flush().
+    """
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+        self.frames = 0       # строк с аудио
+        self.other = 0        # строк без audioChunk.data
+        self.malformed = 0    # строк, которые не удалось разобрать
+
+    def feed(self, data: bytes) -> List[bytes]:
+        buf = self._buf
+        scan = len(buf)  # хвост прошлых кусков уже проверен: перевода строки в нём нет
+        buf += data
+        out: List[bytes] = []
+        start = 0
+        with memoryview(buf) as view:
+            while (end := buf.find(b"\n", scan)) >= 0:
+                self._frame(buf, view, start, end, out)
+                start = scan = end + 1
+        if start:
+            del buf[:start]
+        return out
+
+    def flush(self) -> List[bytes]:
+        buf = self._buf
+        out: List[bytes] = []
+        if buf.strip():
+            with memoryview(buf) as view:
+                self._frame(buf, view, 0, len(buf), out)
+        buf.clear()
+        return out
+
+    def _frame(self, buf: bytearray, view: memoryview, start: int, end: int, out: List[bytes]) -> None:
+        key = buf.find(_AUDIO_KEY, start, end)
+        if key < 0:
+            if buf[start:end].strip():
+                self.other += 1
+            return
+        key = buf.find(_DATA_KEY, key, end)
+        # значение: "data" <пробелы> : <пробелы> "<base64>"
+        colon = buf.find(b":", key + len(_DATA_KEY), end) if key >= 0 else -1
+        q1 = buf.find(b'"', colon, end) if colon >= 0 else -1
+        q2 = buf.find(b'"', q1 + 1, end) if q1 >= 0 else -1
+        try:
+            if q2 < 0 or buf.find(b"\\", q1, q2) >= 0 or bytes(view[colon + 1:q1]).strip():
+                # нестандартная раскладка или экранирование ("\/") — разбираем честно
+                audio = _audio_from_json(bytes(view[start:end]))
+            else:
+                audio = binascii.a2b_base64(view[q1 + 1:q2], **_B64_STRICT)
+        except (ValueError, AttributeError, binascii.Error):
+            self.malformed += 1
+            return
+        if audio:
+            self.frames += 1
+            out.append(audio)
+        else:
+            self.other += 1
+
+
+def note_malformed(decoder: NdjsonAudioDecoder, ev: Dict[str, Any]) -> None:
+    """Битые кадры — это дыра в аудио: пишем в отчёт и предупреждаем, но не падаем."""
+    if decoder.malformed:
+        ev["malformed_frames"] = decoder.malformed
+        print(f"[WARN] {decoder.malformed} битых NDJSON-кадров из {decoder.frames + decoder.malformed}", file=sys.stderr)
 
 
 # ---------- Синтез одного кусочка ----------
 
 def synth_one(
     text: str,
-    headers: Dict[str, str],
+    headers: Optional[Dict[str, str]],
     voice: str,
     role: str,
     speed: float,
     container: str,
     retries: int = 3,
     timeout: int = 90,
+    limiter: Optional[TokenBucket] = None,
+    session: Optional[requests.Session] = None,
+    url: str = API_URL,
 ) -> bytes:
+    """
+    Если передан session (см. make_session) — заголовки уже в нём,
+    и headers можно не передавать.
+    """
     body = make_request_body(text, voice=voice, role=role, speed=speed, container=container)
+    http = session
+    if http is None:
+        import requests
+
+        http = requests
+
+    with RUN.timer("tts", chars=len(text)) as ev:
+        waited = 0.0
+        for attempt in range(1, retries + 1):
+            ev["retries"] = attempt - 1
+            if limiter is not None:
+                t_wait = time.perf_counter()
+                limiter.acquire()
+                waited += time.perf_counter() - t_wait
+                ev["limiter_wait"] = waited
+            t_send = time.perf_counter()
+            r = http.post(url, headers=headers, json=body, stream=True, timeout=timeout)
+            ev["status"] = r.status_code
+
+            if r.status_code == 200:
+                if is_binary_audio(r.headers.get("Content-Type", "")):
+                    # прислали бинарник целиком
+                    audio = bytearray(r.content)
+                else:
+                    audio = bytearray()
+                    decoder = NdjsonAudioDecoder()
+                    # потоковая склейка чанков
+                    for chunk_bytes in _iter_audio_chunks_ndjson(r, decoder):
+                        if not audio:
+                            ev["first_audio_s"] = time.perf_counter() - t_send
+                        audio.extend(chunk_bytes)
+                    note_malformed(decoder, ev)
+
+                if audio:
+                    ev["bytes"] = len(audio)
+                    return bytes(audio)
+
+                raise RuntimeError("HTTP 200, но пустой аудио-ответ (нет audioChunk.data).")
+
+            if r.status_code in RETRY_STATUSES:
+                r.close()  # вернуть соединение в пул, тело ответа нам не нужно
+                wait = min(2 ** (attempt - 1), 8)
+                if r.status_code == 429 and limiter is not None:
+                    # троттлинг касается всего процесса: тормозим все воркеры разом
+                    limiter.pause(wait)
+                if attempt == retries:
+                    # повторять дальше — дело вызывающего (см. retry_queue), спать здесь незачем
+                    tries = f" после {retries} попыток" if retries > 1 else ""
+                    raise retry_queue.TransientError(f"HTTP {r.status_code}{tries}", status=r.status_code)
+                print(f"[WARN] HTTP {r.status_code}, retry {attempt}/{retries} через {wait}s", file=sys.stderr)
+                if r.status_code != 429 or limiter is None:
+                    time.sleep(wait)
+                continue
+
+            try:
+                err = r.json()
+            except Exception:
+                err = r.text
+            raise RuntimeError(f"TTS error HTTP {r.status_code}: {err}")
 
-    for attempt in range(1, retries + 1):
-        r = requests.post(API_URL, headers=headers, json=body, stream=True, timeout=timeout)
+    raise RuntimeError("Не удалось синтезировать после ретраев.")
 
-        if r.status_code == 200:
-            audio = bytearray()
 
-            # потоковая склейка чанков
-            for chunk_bytes in _iter_audio_chunks_ndjson(r):
-                audio.extend(chunk_bytes)
+# ---------- Бэкенды ----------
+
+class SpeechKitV3Backend(TtsBackend):
+    """Yandex SpeechKit v3 REST: тело make_request_body, NDJSON-ответ, keep-alive пул make_session."""
+
+    name = "speechkit_v3"
+    default_url = API_URL
+
+    def __init__(
+        self,
+        headers: Dict[str, str],
+        voice: str = DEFAULT_VOICE,
+        role: str = DEFAULT_ROLE,
+        speed: float = DEFAULT_SPEED,
+        container: str = DEFAULT_CONTAINER,
+        workers: int = DEFAULT_WORKERS,
+        url: Optional[str] = None,
+    ):
+        self.url = url or self.default_url
+        self.voice = voice
+        self.role = role
+        self.speed = speed
+        self.container = container
+        self.ext = audio_ext(container)
+        self.session = make_session(headers, pool_size=workers)
+
+    @classmethod
+    def auth_headers(cls, args: argparse.Namespace) -> Dict[str, str]:
+        api_key = args.api_key or os.getenv("SPEECHKIT_API_KEY")
+        iam_token = args.iam_token or os.getenv("IAM_TOKEN")
+        folder_id = args.folder_id or os.getenv("FOLDER_ID")
+        return build_headers(api_key=api_key, iam_token=iam_token, folder_id=folder_id)
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace, headers: Dict[str, str]) -> "SpeechKitV3Backend":
+        return cls(
+            headers,
+            voice=args.voice,
+            role=args.role,
+            speed=args.speed,
+            container=args.container,
+            workers=args.workers,
+            url=args.tts_url,
+        )
+
+    def cache_body(self, text: str) -> Dict[str, Any]:
+        return make_request_body(text, voice=self.voice, role=self.role, speed=self.speed, container=self.container)
+
+    def synth(self, text: str, limiter: Optional[TokenBucket] = None, retries: int = 3) -> bytes:
+        return synth_one(
+            text=text,
+            headers=None,
+            voice=self.voice,
+            role=self.role,
+            speed=self.speed,
+            container=self.container,
+            retries=retries,
+            limiter=limiter,
+            session=self.session,
+            url=self.url,
+        )
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class MockSpeechKitBackend(SpeechKitV3Backend):
+    """
+    Протокол SpeechKit v3 против локальной заглушки (benchmarks/stub_speechkit.py):
+    креды не нужны, а записи кэша не смешиваются с настоящим аудио.
+    """
 
-            # если не пришло по строкам — пробуем целиком как JSON
-            if not audio:
-                try:
-                    data = r.json()
-                    node = data.get("result", data)
-                    if "audioChunk" in node and "data" in node["audioChunk"]:
-                        audio.extend(base64.b64decode(node["audioChunk"]["data"]))
-                except Exception:
-                    # на всякий случай, если прислали бинарник
-                    if r.content:
-                        return bytes(r.content)
+    name = "mock"
+    default_url = MOCK_URL
 
-            if audio:
-                return bytes(audio)
+    @classmethod
+    def auth_headers(cls, args: argparse.Namespace) -> Dict[str, str]:
+        return {"Content-Type": "application/json", "Authorization": "Api-Key mock"}
 
-            raise RuntimeError("HTTP 200, но пустой аудио-ответ (нет audioChunk.data).")
+    def cache_body(self, text: str) -> Dict[str, Any]:
+        return dict(super().cache_body(text), backend=self.name)
 
-        if r.status_code in (429, 500, 502, 503, 504):
-            wait = min(2 ** (attempt - 1), 8)
-            print(f"[WARN] HTTP {r.status_code}, retry {attempt}/{retries} через {wait}s", file=sys.stderr)
-            time.sleep(wait)
-            continue
 
-        try:
-            err = r.json()
-        except Exception:
-            err = r.text
-        raise RuntimeError(f"TTS error HTTP {r.status_code}: {err}")
+# ---------- Пул воркеров ----------
 
-    raise RuntimeError("Не удалось синтезировать после ретраев.")
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def iter_pool(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    workers: int,
+) -> Iterator[Tuple[T, Optional[R], Optional[BaseException]]]:
+    """
+    Выполняет func(item) в пуле из `workers` потоков и отдаёт (item, result, error)
+    по мере готовности. Вход читается лениво: в полёте не больше 2 * workers задач,
+    так что генератор на входе может быть сколь угодно длинным.
+    """
+    workers = max(1, workers)
+    window = workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending: Dict[Future, T] = {}
+
+        def drain(block_until: int) -> Iterator[Tuple[T, Optional[R], Optional[BaseException]]]:
+            while len(pending) > block_until:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    item = pending.pop(fut)
+                    err = fut.exception()
+                    yield item, (None if err else fut.result()), err
+
+        for item in items:
+            pending[pool.submit(func, item)] = item
+            yield from drain(window - 1)
+        yield from drain(0)
+
+
+def audio_ext(container: str) -> str:
+    return ".wav" if container == "WAV" else ".ogg" if container == "OGG_OPUS" else ".mp3"
+
+
+def temp_path(target: Path) -> Path:
+    """Временный файл рядом с target: после os.replace файл либо целый, либо его нет."""
+    return target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.part")
+
+
+def write_atomic(target: Path, data: bytes) -> None:
+    """Иначе оборванная запись оставит файл, который следующий запуск сочтёт готовым."""
+    tmp = temp_path(target)
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _audio_seconds(path: Path) -> float:
+    """Длительность готового файла для отчёта; нечитаемый заголовок не должен ронять синтез."""
+    try:
+        return audio_formats.duration(path)
+    except (ValueError, OSError, struct.error):
+        return 0.0
+
+
+# ---------- Синтезатор: транспорт + лимитер + кэш ----------
+
+class Synthesizer:
+    """
+    Всё, что нужно воркеру для одного кусочка: бэкенд (по умолчанию
+    SpeechKit v3 с общим пулом соединений), общий лимитер и кэш.
+    Один экземпляр делят все потоки.
+    """
+
+    def __init__(
+        self,
+        headers: Dict[str, str],
+        voice: str = DEFAULT_VOICE,
+        role: str = DEFAULT_ROLE,
+        speed: float = DEFAULT_SPEED,
+        container: str = DEFAULT_CONTAINER,
+        workers: int = DEFAULT_WORKERS,
+        rps: float = DEFAULT_RPS,
+        cache: Optional[SynthCache] = None,
+        url: str = API_URL,
+        retries: int = 3,
+        backend: Optional[TtsBackend] = None,
+    ):
+        if backend is None:
+            backend = SpeechKitV3Backend(headers, voice, role, speed, container, workers, url)
+        self.backend = backend
+        self.retries = retries
+        self.ext = backend.ext
+        self.limiter = TokenBucket(rate=rps, burst=max(1, workers))
+        self.cache = cache
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace, headers: Dict[str, str], retries: int = 3) -> "Synthesizer":
+        cache = None if args.no_cache else SynthCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+        backend = tts_backend.load(args.backend).from_args(args, headers)
+        return cls(headers, workers=args.workers, rps=rps_from_args(args), cache=cache, retries=retries, backend=backend)
+
+    def synth(self, text: str) -> bytes:
+        key = None
+        if self.cache is not None:
+            key = cache_key(self.backend.cache_body(text))
+            audio = self.cache.get(key)
+            if audio is not None:
+                RUN.record("tts_cache_hit", 0.0, chars=len(text), bytes=len(audio))
+                return audio
+        audio = self.backend.synth(text, limiter=self.limiter, retries=self.retries)
+        if self.cache is not None:
+            self.cache.put(key, audio)
+        return audio
+
+    def synth_to_file(self, text: str, target: Path) -> int:
+        audio = self.synth(text)
+        t0 = time.perf_counter()
+        write_atomic(target, audio)
+        if RUN.enabled:
+            RUN.record("write_audio", time.perf_counter() - t0, bytes=len(audio), audio_seconds=_audio_seconds(target))
+        return len(audio)
+
+    def close(self) -> None:
+        self.backend.close()
+        if self.cache is not None:
+            print(self.cache.stats_line())
 
 
 # ---------- CLI ----------
 
-def main(argv: list[str] | None = None) -> int:
-    p = argparse.ArgumentParser(description="Batch TTS через Yandex SpeechKit v3 (REST)")
-    p.add_argument("--in-dir", type=Path, default=DEFAULT_IN_DIR, help=f"Папка с .txt чанками (по умолчанию: {DEFAULT_IN_DIR})")
-    p.add_argument("--out-dir", type=Path, default=DEFAULT_OUT_DIR, help=f"Куда сохранять аудио (по умолчанию: {DEFAULT_OUT_DIR})")
+def non_negative(value: str) -> float:
+    """Число >= 0 для argparse type=."""
+    try:
+        x = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Ожидается число, а не {value!r}") from None
+    if not x >= 0:
+        raise argparse.ArgumentTypeError(f"Нужно число >= 0: {value!r}")
+    return x
+
+
+def rps_from_args(args: argparse.Namespace) -> float:
+    """Лимит запросов в секунду из --rps или устаревшего --sleep; 0 — без лимита."""
+    if args.rps is not None:
+        return args.rps
+    if args.sleep is not None:
+        return 1 / args.sleep if args.sleep else 0.0
+    return DEFAULT_RPS
+
+
+def add_synth_arguments(p: argparse.ArgumentParser) -> None:
+    """Флаги бэкенда, голоса, параллелизма, кэша и кредов — общие для всех точек входа с синтезом."""
+    p.add_argument(
+        "--backend",
+        default=tts_backend.DEFAULT_BACKEND,
+        help=f"Сервис синтеза: {', '.join(tts_backend.BACKENDS)} или module:Class (по умолчанию: {tts_backend.DEFAULT_BACKEND})",
+    )
+    p.add_argument("--tts-url", default=None, help="Адрес API вместо адреса бэкенда по умолчанию (например, локальная заглушка).")
     p.add_argument("--voice", default=DEFAULT_VOICE, help=f"Голос (по умолчанию: {DEFAULT_VOICE})")
     p.add_argument("--role", default=DEFAULT_ROLE, help="Опциональная роль (по умолчанию: выключена)")
     p.add_argument("--speed", type=float, default=DEFAULT_SPEED, help=f"Скорость (по умолчанию: {DEFAULT_SPEED})")
     p.add_argument("--container", default=DEFAULT_CONTAINER, choices=["WAV", "OGG_OPUS", "MP3"], help=f"Аудио-контейнер (по умолчанию: {DEFAULT_CONTAINER})")
-    p.add_argument("--sleep", type=float, default=DEFAULT_RATE_LIMIT_SLEEP, help=f"Пауза между запросами, сек (по умолчанию: {DEFAULT_RATE_LIMIT_SLEEP})")
-    p.add_argument("--limit", type=int, default=0, help="Озвучить не больше N файлов (для теста). 0 = все.")
-    p.add_argument("--start", type=int, default=1, help="Стартовый индекс файла (1 = 00001.txt).")
+    p.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Сколько запросов держать в полёте одновременно (по умолчанию: {DEFAULT_WORKERS})")
+    p.add_argument("--rps", type=non_negative, default=None, help=f"Лимит запросов в секунду на весь процесс, 0 — без лимита (по умолчанию: {DEFAULT_RPS:g})")
+    p.add_argument("--sleep", type=non_negative, default=None, help="Устарело: пауза между запросами, сек. Эквивалентно --rps 1/SLEEP, 0 — без паузы.")
+    p.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help=f"Общий для всех книг кэш аудио (по умолчанию: {DEFAULT_CACHE_DIR})")
+    p.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MAX_MB, help=f"Предельный размер кэша, МБ (по умолчанию: {DEFAULT_CACHE_MAX_MB})")
+    p.add_argument("--no-cache", action="store_true", help="Не использовать кэш аудио.")
+    p.add_argument(
+        "--dedup",
+        default="link",
+        choices=["link", "manifest", "off"],
+        help="Одинаковые кусочки синтезировать один раз: link — остальным жёсткая ссылка/копия файла, "
+             "manifest — только запись в dedup_manifest.json для сборки, off — без дедупликации (по умолчанию: link)",
+    )
 
     # креды
     p.add_argument("--api-key", default=None, help="SPEECHKIT_API_KEY (если не задан, пробуем IAM токен).")
     p.add_argument("--iam-token", default=None, help="IAM_TOKEN (для Bearer).")
     p.add_argument("--folder-id", default=None, help="FOLDER_ID (обязателен при IAM_TOKEN).")
 
+
+def headers_from_args(args: argparse.Namespace) -> Dict[str, str]:
+    """Заголовки авторизации выбранного --backend; неизвестный бэкенд или нет кредов — исключение."""
+    return tts_backend.load(args.backend).auth_headers(args)
+
+
+def add_input_arguments(p: argparse.ArgumentParser) -> None:
+    """Откуда брать кусочки и какую их часть озвучивать — общие для пакетных точек входа."""
+    p.add_argument("--in-dir", type=Path, default=DEFAULT_IN_DIR, help=f"Папка с кусочками: хранилище chunks.idx/chunks.dat или .txt (по умолчанию: {DEFAULT_IN_DIR})")
+    p.add_argument("--manifest", type=Path, default=None, help="Брать кусочки из JSONL-манифеста (speechkit_chunks.jsonl от prepare_jsonl) вместо --in-dir.")
+    p.add_argument("--out-dir", type=Path, default=DEFAULT_OUT_DIR, help=f"Куда сохранять аудио (по умолчанию: {DEFAULT_OUT_DIR})")
+    p.add_argument("--limit", type=int, default=0, help="Озвучить не больше N файлов (для теста). 0 = все.")
+    p.add_argument("--start", type=int, default=1, help="Стартовый индекс файла (1 = 00001.txt).")
+    p.add_argument(
+        "--shard",
+        type=ledger.parse_shard,
+        default=ledger.ALL,
+        help="Озвучить только долю i из N (с нуля), например 0/4. Доля определяется хэшем id: "
+             "процессы или машины с разными i не пересекаются. Сверка — python -m scripts.ledger merge.",
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(description="Batch TTS через Yandex SpeechKit v3 (REST) или другой --backend")
+    add_input_arguments(p)
+    add_synth_arguments(p)
+    retry_queue.add_arguments(p)
+    metrics.add_arguments(p)
+
     args = p.parse_args(argv)
 
-    api_key = args.api_key or os.getenv("SPEECHKIT_API_KEY")
-    iam_token = args.iam_token or os.getenv("IAM_TOKEN")
-    folder_id = args.folder_id or os.getenv("FOLDER_ID")
+    metrics.start(args)
+    try:
+        return run(args)
+    finally:
+        metrics.finish(args)
+
 
+def run(args: argparse.Namespace) -> int:
     try:
-        headers = build_headers(api_key=api_key, iam_token=iam_token, folder_id=folder_id)
+        headers = headers_from_args(args)
     except Exception as e:
         print(f"[FATAL] {e}", file=sys.stderr)
         return 2
 
-    in_dir: Path = args.in_dir
     out_dir: Path = args.out_dir
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    files = sorted(in_dir.glob("*.txt"))
-    if not files:
-        print(f"[FATAL] Нет .txt файлов в {in_dir}", file=sys.stderr)
+    selected = select_chunks(args)
+    if selected is None:
         return 1
+    chunks, aliases = selected
+
+    total = len(chunks)
+    print(f"Файлов для синтеза: {total} (backend={args.backend}, voice={args.voice}, speed={args.speed}, container={args.container}, workers={args.workers})")
+
+    # повторы по 429/5xx делает очередь повторов, а не synth_one в том же потоке
+    synth = Synthesizer.from_args(args, headers, retries=1)
+    ext = synth.ext
+    status = ledger.SynthLedger(out_dir, args.shard)
+    policy, breaker = retry_queue.from_args(args, synth.limiter)
+
+    def pending_chunks() -> Iterator[Tuple[int, str, str]]:
+        for i, (stem, text) in enumerate(chunks, 1):
+            target = out_dir / f"{stem}{ext}"
+            if target.exists():
+                print(f"[{i}/{total}] SKIP {target.name} (уже есть)")
+                status.done(stem, target.stat().st_size, attempts=0)
+                continue
+            yield i, stem, text
+
+    def work(item: Tuple[int, str, str]) -> int:
+        _, stem, text = item
+        return synth.synth_to_file(text.strip(), out_dir / f"{stem}{ext}")
+
+    def deferred(item: Tuple[int, str, str], err: BaseException, attempt: int, delay: float) -> None:
+        i, stem, _ = item
+        print(f"[{i}/{total}] RETRY {stem} через {delay:.1f}s (попытка {attempt}/{policy.max_attempts}): {err}", file=sys.stderr)
+
+    failures = []
+    for outcome in retry_queue.iter_pool_retrying(work, pending_chunks(), args.workers, policy, breaker, on_defer=deferred):
+        i, stem, _ = outcome.item
+        if outcome.error is not None:
+            status.failed(stem, outcome.error, outcome.attempts)
+            failures.append(retry_queue.failure_record(stem, outcome))
+            print(f"[{i}/{total}] FAIL {stem}: {outcome.error}", file=sys.stderr)
+        else:
+            status.done(stem, outcome.result, outcome.attempts)
+            print(f"[{i}/{total}] OK   → {stem}{ext} ({outcome.result} bytes)")
+    synth.close()
+    status.close()
+
+    finish_aliases(args, out_dir, ext, aliases)
+    manifest = retry_queue.write_failures(out_dir, failures)
+    if manifest is not None:
+        print(f"Не удалось: {len(failures)} кусочков, список — {manifest}", file=sys.stderr)
+    print(f"Готово: {out_dir}")
+    return 0 if not failures else 1
 
-    if args.start > 1:
-        files = [p for p in files if int(p.stem) >= args.start]
-    if args.limit > 0:
-        files = files[:args.limit]
-
-    total = len(files)
-    print(f"Файлов для синтеза: {total} (voice={args.voice}, speed={args.speed}, container={args.container})")
-
-    ext = ".wav" if args.container == "WAV" else ".ogg" if args.container == "OGG_OPUS" else ".mp3"
-
-    for i, pth in enumerate(files, 1):
-        text = pth.read_text(encoding="utf-8").strip()
-        target = out_dir / f"{pth.stem}{ext}"
 
-        if target.exists():
-            print(f"[{i}/{total}] SKIP {target.name} (уже есть)")
-            continue
+def select_chunks(args: argparse.Namespace) -> Optional[Tuple[List[Tuple[str, str]], Dict[str, str]]]:
+    """
+    Кусочки из --manifest или --in-dir с учётом --start/--limit/--dedup/--shard:
+    (что синтезировать, дубликаты). None — кусочков нет.
 
-        try:
-            audio = synth_one(
-                text=text,
-                headers=headers,
-                voice=args.voice,
-                role=args.role,
-                speed=args.speed,
-                container=args.container,
-            )
-            target.write_bytes(audio)
-            print(f"[{i}/{total}] OK   → {target.name} ({len(audio)} bytes)")
-        except Exception as e:
-            print(f"[{i}/{total}] FAIL {pth.name}: {e}", file=sys.stderr)
-
-        time.sleep(args.sleep)
+    Дубликаты ищутся по всей выборке до деления на шарды, чтобы все шарды
+    одинаково решили, какой id — оригинал; оригинал может достаться другому
+    шарду, тогда файл дубликата доделает ledger merge.
+    """
+    if args.manifest is not None:
+        source = args.manifest
+        chunks = list(read_jsonl(args.manifest))
+    else:
+        source = args.in_dir
+        chunks = list(iter_chunks(args.in_dir))
+    if not chunks:
+        print(f"[FATAL] Нет кусочков в {source} (ни chunks.idx, ни .txt файлов, ни строк манифеста)", file=sys.stderr)
+        return None
 
-    print(f"Готово: {out_dir}")
-    return 0
+    if args.start > 1:
+        chunks = [(stem, text) for stem, text in chunks if int(stem) >= args.start]
+    if args.limit > 0:
+        chunks = chunks[:args.limit]
+
+    aliases: Dict[str, str] = {}
+    if args.dedup != "off":
+        deduped = dedup.plan(chunks)
+        aliases = deduped.aliases
+        if aliases:
+            print(f"Дубликатов: {len(aliases)} — сэкономлено {len(aliases)} запросов и {deduped.saved_chars:,} символов")
+        chunks = deduped.unique
+
+    shard: ledger.Shard = args.shard
+    if shard.count > 1:
+        chunks = [(stem, text) for stem, text in chunks if shard.owns(stem)]
+        aliases = {dup: canon for dup, canon in aliases.items() if shard.owns(dup)}
+        print(f"Шард {shard}: {len(chunks)} кусочков")
+    return chunks, aliases
+
+
+def finish_aliases(args: argparse.Namespace, out_dir: Path, ext: str, aliases: Dict[str, str]) -> None:
+    if not aliases:
+        return
+    if args.shard.count > 1:
+        # общий манифест пишет ledger merge: шарды заканчивают в разное время и затирали бы записи друг друга
+        print(f"Дубликатов в шарде: {len(aliases)}; dedup_manifest.json запишет python -m scripts.ledger merge")
+    else:
+        dedup.write_manifest(out_dir, aliases)
+    if args.dedup == "link":
+        made, missing = dedup.materialize(out_dir, ext, aliases)
+        print(f"Дубликаты: {made} файлов из готового аудио" + (f", {missing} ждут оригинала" if missing else ""))
 
 
 if __name__ == "__main__":
@@ -1,32 +1,70 @@
 # scripts/utils.py
 
+import os
 import re
 import math
-from typing import List
-
-try:
-    import tiktoken
-except ImportError:
-    tiktoken = None
+import bisect
+import itertools
+import sys
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
 
+from scripts.metrics import RUN
 
 # === Подготовка токенайзера ===
+ENCODINGS = ("o200k_base", "cl100k_base")
+
+_enc = None
+_enc_ready = False
+_enc_lock = threading.Lock()
+
+
+def _load_encoder():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    from project_config import settings
+
+    # словари BPE — в кэше проекта, а не во временной папке: без сети берутся оттуда
+    # (tiktoken сверяет их с зашитыми sha256 и при несовпадении скачивает заново)
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(settings.TIKTOKEN_CACHE_DIR))
+    errors = []
+    for name in ENCODINGS:
+        try:
+            return tiktoken.get_encoding(name)
+        except Exception as e:
+            errors.append(f"{name}: {type(e).__name__}: {e}")
+    raise RuntimeError(
+        f"Не удалось загрузить словарь токенайзера ({'; '.join(errors)}). "
+        f"Без сети он берётся из {os.environ['TIKTOKEN_CACHE_DIR']}: заполните кэш один раз "
+        f"с сетью (python -m scripts.utils tokenizer) или скопируйте его с другой машины."
+    )
+
+
 def get_encoder():
     """
     Возвращает энкодер для подсчёта токенов.
     Если tiktoken не установлен — возвращает None (будем считать по символам).
+
+    Создаётся при первом вызове, один на процесс: импорт tiktoken и загрузка
+    словаря не нужны командам, которые токены не считают.
     """
-    if tiktoken is None:
-        return None
-    for name in ["o200k_base", "cl100k_base"]:
-        try:
-            return tiktoken.get_encoding(name)
-        except Exception:
-            continue
-    return tiktoken.get_encoding("cl100k_base")
+    global _enc, _enc_ready
+    if not _enc_ready:
+        with _enc_lock:
+            if not _enc_ready:
+                _enc = _load_encoder()
+                _enc_ready = True
+    return _enc
 
 
-ENC = get_encoder()
+def __getattr__(name: str):
+    # utils.ENC из старого кода — тот же ленивый энкодер
+    if name == "ENC":
+        return get_encoder()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def count_tokens(text: str) -> int:
@@ -34,9 +72,21 @@ def count_tokens(text: str) -> int:
     Подсчёт количества токенов в строке.
     Если tiktoken недоступен — грубая оценка (≈4 символа на токен).
     """
-    if ENC is None:
+    enc = get_encoder()
+    if enc is None:
         return max(1, math.ceil(len(text) / 4))
-    return len(ENC.encode(text))
+    return len(enc.encode(text))
+
+
+def count_tokens_many(texts: List[str]) -> List[int]:
+    """
+    count_tokens для списка строк: tiktoken кодирует пачку в нескольких потоках,
+    поэтому на сотнях чанков это заметно быстрее цикла.
+    """
+    enc = get_encoder()
+    if enc is None:
+        return [count_tokens(t) for t in texts]
+    return [len(ids) for ids in enc.encode_ordinary_batch(texts)]
 
 
 # === Предварительная нормализация текста ===
@@ -53,84 +103,428 @@ def soft_normalize(text: str) -> str:
     return text
 
 
+# === Детерминированная предочистка ===
+# Строка из одного числа: "12", "- 12 -", "—12—" — номер страницы, глава или год
+_PAGE_NUMBER_LINE = re.compile(r"[-–—]?\s*(\d{1,4})\s*[-–—]?")
+# Насколько номер страницы может убежать вперёд от предыдущего (пропущенные страницы)
+_PAGE_STEP = 3
+# Сколько строк текста должно быть между номерами страниц: подряд идущие числа — это список или таблица
+_PAGE_MIN_LINES = 10
+_LINE_SPACES = re.compile(r"[ \t]+")
+# Слово, разрезанное переносом в конце строки: «компью-»
+_HYPHEN_END = re.compile(r"[^\W\d_][-\u00ad]$")
+# Частицы, перед которыми дефис настоящий: «что-то», «кто-нибудь»
+_KEEP_HYPHEN = re.compile(r"(?:то|либо|нибудь|ка|таки)\b")
+_LOWER_START = re.compile(r"[a-zа-яё]")
+_PARAGRAPH_END = tuple(".!?…:»\"”)")
+_DIALOGUE_START = re.compile(r"(?:--|[-–—])\s")
+_DIALOGUE_DASH = re.compile(r"^(?:--|[-–])(?=\s)")
+_INNER_DASH = re.compile(r"(?<=\s)(?:--|[-–])(?=\s)|(?<=\w)--(?=\w)")
+_QUOTES = re.compile(r'"([^"\n]*)"|“([^”\n]*)”|„([^“”\n]*)[“”]')
+
+
+def _normalize_paragraph(text: str) -> str:
+    """Тире и кавычки внутри абзаца: « - » → « — », реплика «- Да» → «— Да», "…"/“…”/„…“ → «…»."""
+    if "-" in text or "–" in text:  # без дефисов незачем гонять регулярки с lookbehind по всему абзацу
+        text = _DIALOGUE_DASH.sub("—", text)
+        text = _INNER_DASH.sub("—", text)
+    return _QUOTES.sub(lambda m: "«" + (m.group(1) or m.group(2) or m.group(3) or "") + "»", text)
+
+
+class PreCleaner:
+    """
+    Правила вместо LLM для очевидных артефактов PDF→TXT: склеивает строки внутри
+    абзаца и слова, разрезанные переносом, выбрасывает номера страниц,
+    схлопывает пустые строки и пробелы, нормализует тире и кавычки.
+
+    Абзац кончается на пустой строке или на явном признаке нового абзаца после
+    конца фразы: реплике с тире или отступе. Строка из одного числа считается
+    номером страницы, только если абзац продолжается через неё или число идёт
+    следом за прошлым номером страницы; иначе это текст (глава, год).
+
+    Работает построчно как конечный автомат, поэтому текст можно подавать
+    блоками (страницами) — строка, разрезанная границей блока, склеится.
+    Счётчики chars_*/tokens_*/seconds — для отчёта об экономии; with_tokens=False
+    не считает токены (это отдельный проход токенизатора по всему тексту).
+    """
+
+    def __init__(self, with_tokens: bool = True) -> None:
+        self.with_tokens = with_tokens
+        self.chars_in = self.chars_out = 0
+        self.tokens_in = self.tokens_out = 0
+        self.seconds = 0.0
+        self._para: List[str] = []
+        self._done: List[str] = []
+        self._gap = False
+        self._indented = False
+        self._page: Optional[int] = None  # последний выброшенный номер страницы
+        self._page_break = False  # только что выброшен номер страницы
+        self._since_page = 0  # строк текста после последнего номера страницы
+        # строка-число посреди абзаца ждёт следующей строки: (строка, отступ, пустая строка перед ней, число)
+        self._number: Optional[Tuple[str, bool, bool, int]] = None
+
+    def _line(self, line: str) -> None:
+        """Принимает очередную строку; законченные абзацы складывает в _done."""
+        line = line.replace("\u00ad", "")
+        indented = line[:1] in (" ", "\t")
+        if "\t" in line or "  " in line:
+            line = _LINE_SPACES.sub(" ", line)
+        line = line.strip()
+        if not line:
+            self._gap = True  # пустая строка — конец абзаца, если следующая строка не продолжает фразу
+            return
+        if self._page_break:
+            self._page_break = False
+            if self._para and self._continues(line, gap=True):
+                self._gap = False  # пустые строки вокруг номера — граница страницы, а не абзаца
+        m = _PAGE_NUMBER_LINE.fullmatch(line)
+        if self._number is not None:
+            number, self._number = self._number, None
+            # номер страницы посреди абзаца не должен его рвать, но с обеих сторон от него — текст, а не числа списка
+            if not m and self._continues(line, gap=number[2] or self._gap):
+                self._drop_page(number[3])
+                self._page_break = False
+                self._gap = False
+            else:
+                self._keep_number(number)
+        if not m:
+            self._since_page += 1
+            self._take(line, indented)
+            return
+        n = int(m.group(1))
+        if self._page is not None and 0 < n - self._page <= _PAGE_STEP and self._since_page >= _PAGE_MIN_LINES:
+            self._drop_page(n)
+            return
+        if self._para and not _PAGE_NUMBER_LINE.fullmatch(self._para[-1]):
+            self._number = (line, indented, self._gap, n)
+            self._gap = False
+            return
+        self._take(line, indented)
+
+    def _drop_page(self, n: int) -> None:
+        self._page = n
+        self._page_break = True
+        self._since_page = 0
+
+    def _continues(self, line: str, gap: bool) -> bool:
+        """Продолжает ли line абзац через строку-число: перенос, строчная буква или (без пустых строк) незаконченная фраза."""
+        prev = self._para[-1]
+        return bool(
+            _HYPHEN_END.search(prev, max(0, len(prev) - 2))
+            or _LOWER_START.match(line)
+            or not (gap or prev.endswith(_PARAGRAPH_END))
+        )
+
+    def _keep_number(self, number: Tuple[str, bool, bool, int]) -> None:
+        """Строка-число оказалась текстом: разбирается как обычная строка со своей пустой строкой перед ней."""
+        line, indented, gap_before, _ = number
+        gap_after, self._gap = self._gap, gap_before
+        self._take(line, indented)
+        self._gap = gap_after
+
+    def _take(self, line: str, indented: bool) -> None:
+        para = self._para
+        gap, self._gap = self._gap, False
+        shifted, self._indented = indented and not self._indented, indented
+        if not para:
+            para.append(line)
+            return
+        prev = para[-1]
+        if _HYPHEN_END.search(prev, max(0, len(prev) - 2)):  # шаблон привязан к концу строки
+            if _LOWER_START.match(line) and not _KEEP_HYPHEN.match(line):
+                para[-1] = prev[:-1] + line
+            else:
+                para[-1] = prev[:-1] + "-" + line
+            return
+        if _LOWER_START.match(line) or not (
+            gap or prev.endswith(_PARAGRAPH_END) and (shifted or _DIALOGUE_START.match(line))
+        ):
+            para.append(line)
+            return
+        self._flush()
+        para.append(line)
+
+    def _flush(self) -> None:
+        if self._number is not None:  # текст кончился на строке-числе
+            number, self._number = self._number, None
+            self._keep_number(number)
+        if self._para:
+            self._done.append(_normalize_paragraph(" ".join(self._para)))
+            self._para.clear()
+
+    def feed(self, blocks: Iterable[str]) -> Iterator[str]:
+        """Отдаёт очищенный текст по абзацам (каждый с "\\n\\n" в конце)."""
+        rest = ""
+        for block in itertools.chain(blocks, (None,)):
+            t0 = time.perf_counter()
+            if block is None:
+                self._line(rest)
+                self._flush()
+            else:
+                self.chars_in += len(block)
+                if self.with_tokens and block:
+                    self.tokens_in += count_tokens(block)
+                lines = (rest + block).split("\n")
+                rest = lines.pop()
+                for line in lines:
+                    self._line(line)
+            out, self._done = self._done, []
+            self.seconds += time.perf_counter() - t0
+            for para in out:
+                self.chars_out += len(para) + 2
+                if self.with_tokens:
+                    self.tokens_out += count_tokens(para)
+                yield para + "\n\n"
+
+    def clean(self, text: str) -> str:
+        return "".join(self.feed([text])).strip()
+
+    def report(self) -> str:
+        saved = 1 - self.tokens_out / self.tokens_in if self.tokens_in else 0.0
+        return (
+            f"Предочистка: {self.tokens_in:,} → {self.tokens_out:,} токенов (−{saved:.0%}), "
+            f"{self.chars_in:,} → {self.chars_out:,} символов, {self.seconds:.2f} s"
+        )
+
+
+def pre_clean(text: str) -> str:
+    """Детерминированная очистка текста целиком (см. PreCleaner)."""
+    return PreCleaner().clean(soft_normalize(text))
+
+
 # === Разделение на чанки по токенам ===
+_ENCODE_SLICE_CHARS = 256_000  # столько символов кодируем за один вызов tiktoken
+_PARA = ("\n\n", b"\n\n")
+_SPACES = ((" ", "\n", "\t"), (b" ", b"\n", b"\t"))
+
+
+def _encode_all(text: str) -> List[int]:
+    """
+    Кодирует текст целиком, крупными срезами через encode_ordinary_batch.
+    Срезы режутся по пробелу, поэтому байты токенов в сумме дают ровно исходный текст.
+    """
+    slices: List[str] = []
+    i = 0
+    while i < len(text):
+        j = i + _ENCODE_SLICE_CHARS
+        if j < len(text):
+            k = text.find(" ", j)  # не рвём слово на границе среза
+            j = len(text) if k < 0 else k
+        slices.append(text[i:j])
+        i = j
+    return list(itertools.chain.from_iterable(get_encoder().encode_ordinary_batch(slices)))
+
+
+_TOKEN_LENGTHS: List[int] = []
+
+
+def _token_lengths() -> List[int]:
+    """Длина в байтах каждого токена словаря (строится один раз на процесс)."""
+    if not _TOKEN_LENGTHS:
+        enc = get_encoder()
+        for i in range(enc.n_vocab):
+            try:
+                _TOKEN_LENGTHS.append(len(enc.decode_single_token_bytes(i)))
+            except KeyError:  # дырки в нумерации словаря
+                _TOKEN_LENGTHS.append(0)
+    return _TOKEN_LENGTHS
+
+
+def _skip_spaces(buf, pos: int) -> int:
+    n = len(buf)
+    while pos < n and buf[pos:pos + 1].isspace():
+        pos += 1
+    return pos
+
+
+def _find_cut(buf, lo: int, hi: int) -> int:
+    """
+    Ищет место разреза в buf[lo:hi]: сначала пустая строка во второй половине
+    окна (граница абзаца), потом любой пробел. Если слово длиннее всего окна —
+    режем по hi, не попадая внутрь многобайтного символа.
+    """
+    is_bytes = isinstance(buf, bytes)
+    para = _PARA[is_bytes]
+    pos = buf.rfind(para, lo + (hi - lo) // 2, hi)
+    if pos > lo:
+        return pos
+    pos = max(buf.rfind(sp, lo, hi + 1) for sp in _SPACES[is_bytes])
+    if pos > lo:
+        return pos
+    if is_bytes:
+        cut = hi
+        while cut > lo and 0x80 <= buf[cut] < 0xC0:
+            cut -= 1
+        if cut == lo:
+            cut = hi
+            while cut < len(buf) and 0x80 <= buf[cut] < 0xC0:
+                cut += 1
+        return cut
+    return hi
+
+
 def chunk_by_tokens(text: str, max_tokens: int) -> List[str]:
     """
     Делит текст на чанки по max_tokens, не разрывая слова.
+
+    Текст кодируется один раз, бюджет отмеряется по реальным токенам
+    склеенного текста (байтовые границы токенов — по таблице длин словаря),
+    а разрез ищется на границе абзаца или слова перед концом бюджета. Без tiktoken — те же правила по оценке ≈4 символа на токен.
     """
-    words = re.findall(r"\S+\s*", text)  # сохраняем пробелы
+    with RUN.timer("chunk", chars=len(text)) as ev:
+        chunks = _chunk_by_tokens(text, max_tokens)
+        ev["chunks"] = len(chunks)
+    return chunks
+
+
+def _chunk_by_tokens(text: str, max_tokens: int) -> List[str]:
+    if get_encoder() is None:
+        buf = text
+        limit = lambda start: start + max_tokens * 4  # noqa: E731
+    else:
+        buf = text.encode("utf-8")
+        ends = list(itertools.accumulate(map(_token_lengths().__getitem__, _encode_all(text))))
+
+        def limit(start: int) -> int:
+            """Байтовая граница, до которой от start помещается max_tokens токенов."""
+            first = bisect.bisect_right(ends, start)  # первый токен, который ещё не взят
+            last = min(first + max_tokens, len(ends)) - 1
+            return ends[last] if last >= 0 else len(buf)
+
+    n = len(buf)
     chunks: List[str] = []
-    cur: List[str] = []
-    cur_tokens = 0
-
-    for w in words:
-        w_tokens = count_tokens(w)
-        if cur and cur_tokens + w_tokens > max_tokens:
-            chunks.append("".join(cur).rstrip())
-            cur = [w]
-            cur_tokens = w_tokens
-        else:
-            cur.append(w)
-            cur_tokens += w_tokens
-    if cur:
-        chunks.append("".join(cur).rstrip())
+    start = _skip_spaces(buf, 0)
+    while start < n:
+        hi = limit(start)
+        cut = n if hi >= n else _find_cut(buf, start, hi)
+        piece = buf[start:cut]
+        if isinstance(piece, bytes):
+            piece = piece.decode("utf-8")
+        piece = piece.rstrip()
+        if piece:
+            chunks.append(piece)
+        start = _skip_spaces(buf, cut)
     return chunks
 
 
-# === Разделение для TTS (по 200 символов) ===
-def split_for_tts(text: str, max_chars: int = 200) -> List[str]:
+def iter_chunks_by_tokens(blocks: Iterable[str], max_tokens: int) -> Iterator[str]:
     """
-    Делит текст на куски <= max_chars символов.
-    Старается резать по предложениям/словам, не ломает слова.
+    То же, что chunk_by_tokens, но для текста, приходящего блоками (страницы PDF,
+    куски большого TXT). Блоки копятся в окне в несколько чанков; все чанки окна,
+    кроме последнего, отдаются, а хвост с последним чанком переносится в следующее окно.
     """
-    parts = re.split(r"(\n\n+|(?<=[\.\!\?\:\;])\s+)", text)
-    out: List[str] = []
-    buf = ""
+    window = max(_ENCODE_SLICE_CHARS, max_tokens * 8)
+    parts: List[str] = []
+    size = 0
+    for block in blocks:
+        parts.append(block)
+        size += len(block)
+        if size < window:
+            continue
+        text = "".join(parts)
+        chunks = chunk_by_tokens(text, max_tokens)
+        yield from chunks[:-1]
+        # последний чанк мог оборваться на конце окна — режем его заново вместе со следующими блоками
+        tail = text[text.rfind(chunks[-1]):] if chunks else ""
+        parts, size = [tail], len(tail)
+    yield from chunk_by_tokens("".join(parts), max_tokens)
 
-    def can_add(buf: str, piece: str) -> bool:
-        return len(buf) + len(piece) <= max_chars
 
-    for piece in parts:
-        if not piece:
+# === Разделение для TTS ===
+# Граница предложения: пустая строка или пробелы после знака конца фразы
+_TTS_BOUNDARY = re.compile(r"\n\n+|(?<=[.!?:;…])\s+")
+
+
+def _split_long_sentence(sentence: str, max_chars: int) -> Iterator[str]:
+    """Предложение длиннее max_chars режем по словам; слово длиннее лимита идёт кусочком целиком."""
+    words: List[str] = []
+    size = -1
+    for w in sentence.split():
+        if words and size + 1 + len(w) > max_chars:
+            yield " ".join(words)
+            words, size = [], -1
+        words.append(w)
+        size += 1 + len(w)
+    if words:
+        yield " ".join(words)
+
+
+def iter_tts_pieces(text: str, max_chars: int = 200, target_chars: Optional[int] = None) -> Iterator[str]:
+    """
+    Потоково упаковывает целые предложения в кусочки для TTS.
+
+    Предложения жадно добавляются в кусочек, пока он не длиннее target_chars
+    (по умолчанию = max_chars). Предложение длиннее max_chars режется по словам.
+    Границы ищутся итератором по тексту, предложения — срезы исходной строки,
+    а кусочек собирается одним join при выдаче, без повторной конкатенации.
+    """
+    target = min(target_chars or max_chars, max_chars)
+    buf: List[str] = []
+    size = -1  # длина кусочка с учётом пробелов между предложениями
+    pos = 0
+    for m in itertools.chain(_TTS_BOUNDARY.finditer(text), (None,)):
+        sentence = text[pos:m.start() if m else len(text)].strip()
+        pos = m.end() if m else len(text)
+        if not sentence:
             continue
-        piece = piece.replace("\n", " ").strip()
-        if not piece:
+        n = len(sentence)
+        if buf and size + 1 + n <= target:
+            buf.append(sentence)
+            size += 1 + n
             continue
-        if not buf:
-            if len(piece) <= max_chars:
-                buf = piece
-            else:
-                # режем по словам
-                words = piece.split()
-                temp = ""
-                for w in words:
-                    add = (w if temp == "" else " " + w)
-                    if len(temp) + len(add) > max_chars:
-                        out.append(temp)
-                        temp = w
-                    else:
-                        temp += add
-                if temp:
-                    buf = temp
+        if buf:
+            yield " ".join(buf).replace("\n", " ")
+            buf, size = [], -1
+        if n > max_chars:
+            yield from _split_long_sentence(sentence, max_chars)
         else:
-            add = (" " + piece)
-            if can_add(buf, add):
-                buf += add
-            else:
-                out.append(buf)
-                if len(piece) <= max_chars:
-                    buf = piece
-                else:
-                    words = piece.split()
-                    temp = ""
-                    for w in words:
-                        add2 = (w if temp == "" else " " + w)
-                        if len(temp) + len(add2) > max_chars:
-                            out.append(temp)
-                            temp = w
-                        else:
-                            temp += add2
-                    buf = temp
+            buf.append(sentence)
+            size = n
     if buf:
-        out.append(buf)
-    return [s.strip() for s in out if s.strip()]
+        yield " ".join(buf).replace("\n", " ")
+
+
+def iter_sentences(text: str) -> Iterator[Tuple[int, int]]:
+    """(начало, конец) непустых предложений text — по тем же границам, что у iter_tts_pieces."""
+    pos = 0
+    for m in itertools.chain(_TTS_BOUNDARY.finditer(text), (None,)):
+        end = m.start() if m else len(text)
+        if pos < end and not text[pos:end].isspace():
+            yield pos, end
+        pos = m.end() if m else len(text)
+
+
+def split_for_tts(text: str, max_chars: int = 200, target_chars: Optional[int] = None) -> List[str]:
+    """
+    Делит текст на куски <= max_chars символов.
+    Старается резать по предложениям/словам, не ломает слова.
+    """
+    with RUN.timer("split", chars=len(text)) as ev:
+        pieces = list(iter_tts_pieces(text, max_chars, target_chars))
+        ev["pieces"] = len(pieces)
+    return pieces
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+
+    p = argparse.ArgumentParser(description="Служебные команды утилит текста")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("tokenizer", help="Загрузить словарь BPE в кэш проекта (сеть нужна один раз) и проверить, что он читается")
+    p.parse_args(argv)
+
+    t0 = time.perf_counter()
+    try:
+        enc = get_encoder()
+    except RuntimeError as e:
+        print(f"[FATAL] {e}", file=sys.stderr)
+        return 1
+    if enc is None:
+        print("[FATAL] tiktoken не установлен: токены оцениваются по символам", file=sys.stderr)
+        return 1
+    print(f"OK: {enc.name}, {enc.n_vocab:,} токенов, {time.perf_counter() - t0:.2f}s; кэш: {os.environ['TIKTOKEN_CACHE_DIR']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())